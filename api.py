@@ -0,0 +1,358 @@
+"""
+Local REST service for the extraction pipeline.
+
+Usage:
+    python -m api --host 127.0.0.1 --port 8000
+    uvicorn api:app --port 8000
+
+    curl -F file=@invoice.pdf -F mode=fused http://127.0.0.1:8000/jobs
+    curl http://127.0.0.1:8000/jobs/<job_id>
+    curl http://127.0.0.1:8000/jobs/<job_id>/result
+    curl -X DELETE http://127.0.0.1:8000/jobs/<job_id>
+
+Uploads are queued and processed by a fixed number of asyncio workers that
+share one rate-limited AsyncExtractionClient. Once API_MAX_QUEUE jobs are
+waiting, submissions are rejected with 429 and a Retry-After estimate.
+Uploading a file that is already queued or running (same bytes and mode)
+returns the existing job instead of processing it twice. Point
+GROQ_BASE_URL at benchmarks.fake_groq to run it without the real API.
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, Response, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from batch import SUPPORTED_EXTENSIONS
+from config import API_MAX_JOBS, API_MAX_QUEUE, API_MAX_UPLOAD_BYTES, API_WORKERS
+from pipeline import MODES, process_document_async
+from utils.tracing import tracer
+
+# Job states; the last three are final
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """One submitted document and its progress through the pipeline."""
+    id: str
+    key: str
+    filename: str
+    mode: str
+    path: str
+    status: str = QUEUED
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    submissions: int = 1
+    record: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def summary(self) -> Dict[str, Any]:
+        """Status fields returned when polling a job."""
+        summary = {
+            'job_id': self.id, 'status': self.status, 'filename': self.filename, 'mode': self.mode,
+            'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+            'submissions': self.submissions,
+        }
+        if self.error:
+            summary['error'] = self.error
+        return summary
+
+
+class JobQueue:
+    """
+    Bounded asyncio job queue in front of process_document_async.
+
+    Jobs are keyed on the SHA-256 of the upload and the mode; a submission
+    whose key matches a queued or running job is coalesced into it.
+    Finished jobs are kept for polling until ``max_jobs`` is exceeded,
+    oldest first.
+    """
+
+    def __init__(self, client=None, workers: int = API_WORKERS, max_queue: int = API_MAX_QUEUE,
+                 max_jobs: int = API_MAX_JOBS, spool_dir: Optional[str] = None):
+        """
+        Initialize the queue; call start() from a running event loop.
+
+        Args:
+            client: AsyncExtractionClient to share (created by start() if None)
+            workers: Documents processed concurrently
+            max_queue: Queued jobs accepted before QueueFull is raised
+            max_jobs: Jobs, finished or not, kept in memory for polling
+            spool_dir: Directory holding uploads until they are processed
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self._client = client
+        self._owns_client = client is None
+        self._spool_dir = spool_dir
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._in_flight: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._queued = 0
+        self._running = 0
+        # Moving average of job duration, used for Retry-After estimates
+        self._mean_seconds = 1.0
+
+    async def start(self):
+        if self._client is None:
+            # Imported here so the module can be loaded without the async client's dependencies
+            from async_extractor import AsyncExtractionClient
+            self._client = AsyncExtractionClient()
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.mkdtemp(prefix="docextract_api_")
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._spool_dir:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'queued': self._queued, 'running': self._running, 'workers': self.workers,
+                'max_queue': self.max_queue, 'jobs': len(self._jobs)}
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up."""
+        return max(1, math.ceil(self._mean_seconds * (self._queued + 1) / max(1, self.workers)))
+
+    async def submit(self, data: bytes, filename: str, mode: str = "two_call") -> Job:
+        """
+        Queue a document, or return the in-flight job for the same bytes and mode.
+
+        Raises:
+            QueueFull: If ``max_queue`` jobs are already waiting
+        """
+        key = f"{hashlib.sha256(data).hexdigest()}:{mode}"
+        job = self._in_flight.get(key)
+        if job is not None:
+            job.submissions += 1
+            return job
+        if self._queued >= self.max_queue:
+            raise QueueFull(self.retry_after())
+
+        job_id = uuid.uuid4().hex
+        ext = os.path.splitext(filename)[1].lower()
+        path = os.path.join(self._spool_dir, job_id + ext)
+        # Registered before the upload is spooled so concurrent duplicates coalesce into it
+        job = Job(id=job_id, key=key, filename=filename, mode=mode, path=path)
+        self._jobs[job_id] = job
+        self._in_flight[key] = job
+        self._queued += 1
+        self._evict()
+        try:
+            await asyncio.to_thread(_write_file, path, data)
+        except OSError as e:
+            self._queued -= 1
+            self._finish(job, FAILED, f"Could not spool upload: {e}")
+            return job
+        if job.status == QUEUED:
+            self._queue.put_nowait(job)
+        else:
+            # Cancelled while spooling: _finish ran before the file existed
+            _remove_file(path)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINAL_STATES:
+            return job
+        if job.status == QUEUED:
+            # The worker that dequeues it skips it
+            self._queued -= 1
+            self._finish(job, CANCELLED)
+        elif job._task is not None:
+            job._task.cancel()
+        return job
+
+    def _evict(self):
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.status in FINAL_STATES][:excess]:
+            del self._jobs[job_id]
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        _remove_file(job.path)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:
+                continue
+            self._queued -= 1
+            self._running += 1
+            job.status = RUNNING
+            job.started = time.time()
+            job._task = asyncio.create_task(process_document_async(job.path, self._client, job.mode))
+            try:
+                job.record = await job._task
+                # Report the uploaded name rather than the spooled copy's path
+                job.record['path'] = job.filename
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # The worker itself is shutting down
+                    job._task.cancel()
+                    self._finish(job, CANCELLED, "Service shut down")
+                    raise
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                self._finish(job, FAILED, str(e))
+            else:
+                if job.record['status'] == 'success':
+                    self._finish(job, DONE)
+                else:
+                    self._finish(job, FAILED, job.record.get('error'))
+                self._mean_seconds = 0.8 * self._mean_seconds + 0.2 * (job.finished - job.started)
+            finally:
+                self._running -= 1
+                job._task = None
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_app(queue: Optional[JobQueue] = None) -> FastAPI:
+    """
+    Build the FastAPI application around ``queue`` (a default JobQueue if None).
+
+    The queue is started and stopped with the application's lifespan.
+    """
+    queue = queue or JobQueue()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await queue.start()
+        try:
+            yield
+        finally:
+            await queue.stop()
+
+    api = FastAPI(title="Agentic Document Extraction", lifespan=lifespan)
+    api.state.queue = queue
+
+    def get_job(job_id: str) -> Job:
+        job = queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        return job
+
+    @api.post("/jobs", status_code=202)
+    async def submit_job(response: Response, file: UploadFile = File(...), mode: str = Form("two_call")):
+        """Upload a document for extraction; returns the job to poll."""
+        if mode not in MODES:
+            raise HTTPException(status_code=422, detail=f"mode must be one of {', '.join(MODES)}")
+        filename = os.path.basename(file.filename or "")
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=415, detail=f"Supported files: {', '.join(SUPPORTED_EXTENSIONS)}")
+        data = await file.read(API_MAX_UPLOAD_BYTES + 1)
+        if len(data) > API_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Uploads are limited to {API_MAX_UPLOAD_BYTES} bytes")
+        try:
+            job = await queue.submit(data, filename, mode)
+        except QueueFull as e:
+            return JSONResponse({'detail': str(e)}, status_code=429,
+                                headers={'Retry-After': str(e.retry_after)})
+        response.headers['Location'] = f"/jobs/{job.id}"
+        return dict(job.summary(), coalesced=job.submissions > 1)
+
+    @api.get("/jobs/{job_id}")
+    async def poll_job(job_id: str):
+        """Current status of a job."""
+        return get_job(job_id).summary()
+
+    @api.get("/jobs/{job_id}/result")
+    async def job_result(job_id: str):
+        """The pipeline record of a finished job (409 while it is still queued or running)."""
+        job = get_job(job_id)
+        if job.status == CANCELLED:
+            raise HTTPException(status_code=410, detail="Job was cancelled")
+        if job.record is None:
+            if job.status == FAILED:
+                raise HTTPException(status_code=500, detail=job.error)
+            raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+        return job.record
+
+    @api.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        """Cancel a queued or running job."""
+        get_job(job_id)
+        return queue.cancel(job_id).summary()
+
+    @api.get("/health")
+    async def health():
+        return dict(queue.stats(), status="ok")
+
+    @api.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Tracing counters and stage histograms in Prometheus text format (TRACING_ENABLED=1)."""
+        return tracer.to_prometheus()
+
+    return api
+
+
+app = create_app()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the extraction pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
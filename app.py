@@ -1,104 +1,227 @@
 import streamlit as st
-import io
+import hashlib
 import json
-from utils.pdf_utils import extract_text_from_pdf
-from extractor import classify_doc, extract_fields
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from config import APP_MAX_JOBS, APP_WORKERS
+from pipeline import load_document, process_pages
+from utils.tracing import span, tracer
+
+# Seconds between refreshes while an upload is still being processed
+POLL_SECONDS = 1.0
+
+IMAGE_TYPES = ("image/png", "image/jpeg")
+
+# How documents the pipeline handled without an LLM classification were labelled
+CLASSIFIED_WITHOUT_LLM = {
+    'router': "Classified locally without an LLM call",
+    'template': "Extracted with a learned template without an LLM call",
+    'duplicate': "Reused the result of a near-duplicate document without an LLM call",
+}
+
+
+class UploadJobs:
+    """
+    Extraction jobs keyed on the uploaded bytes and extraction mode.
+
+    Streamlit reruns the script on every interaction; looking the upload up
+    here instead of reprocessing it means a rerun, a second session or a
+    repeat upload of the same file costs no parsing and no LLM calls.
+    Failed jobs stay until discarded so polling does not retry them, and
+    the oldest finished jobs are evicted beyond ``max_jobs``.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, max_jobs: int = APP_MAX_JOBS):
+        self._pool = pool
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, key: str, name: str, run: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """Return the job for ``key``, starting ``run(job)`` in the background if it is new."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job
+            job = {'name': name, 'status': 'queued', 'stage': "Waiting for a worker", 'fields': []}
+            self._jobs[key] = job
+            finished = [k for k, j in self._jobs.items() if j['status'] in ('done', 'error')]
+            for old in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old]
+        self._pool.submit(run, job)
+        return job
+
+    def discard(self, key: str):
+        with self._lock:
+            self._jobs.pop(key, None)
+
+
+@st.cache_resource
+def get_upload_jobs() -> UploadJobs:
+    """Job store and worker threads shared by every session of this server."""
+    return UploadJobs(ThreadPoolExecutor(max_workers=APP_WORKERS, thread_name_prefix="extract"))
+
+
+def run_upload(job: Dict[str, Any], data: bytes, file_type: str, fused: bool):
+    """
+    Run one upload through the shared extraction pipeline, recording progress on ``job``.
+
+    The upload is spooled to a temporary file so it is read like any batch or
+    API document; the text is then shown while the remaining stages (the
+    same as process_document's) run.
+    """
+    job['status'] = 'running'
+    with span("upload", file=job['name']) as upload_span:
+        job['trace_id'] = upload_span.trace_id
+        try:
+            if file_type == "application/pdf":
+                job['stage'] = "Extracting text from PDF..."
+            elif file_type in IMAGE_TYPES:
+                job['stage'] = "Running OCR on image..."
+            with span("text"), tempfile.TemporaryDirectory(prefix="docextract_app_") as spool:
+                path = os.path.join(spool, "upload" + os.path.splitext(job['name'])[1].lower())
+                with open(path, "wb") as f:
+                    f.write(data)
+                pages, info = load_document(path, with_words=True)
+        except Exception as e:
+            upload_span.record_error(e)
+            job['error'] = str(e)
+            job['status'] = 'error'
+            return
+        job['content'] = "\n\n".join(pages).strip()
+        job['page_info'] = {k: v for k, v in info.items() if k != 'words'}
+
+        # Fields are shown as soon as they are streamed back from the model
+        job['stage'] = "Classifying and extracting structured information..."
+        record = process_pages(
+            job['name'], pages, info, mode="fused" if fused else "two_call", on_field=job['fields'].append
+        )
+        job['compaction'] = record.get('compaction')
+        job['doc_type'] = record.get('doc_type')
+        job['classified_by'] = record.get('classification', {}).get('source')
+        if record['status'] != 'success':
+            job['error'] = record['error']
+            job['status'] = 'error'
+            return
+        job['result'] = record['result']
+        job['status'] = 'done'
+
+
+def show_job(key: str, job: Dict[str, Any], data: bytes, file_type: str):
+    """Render an upload's progress or results."""
+    if file_type in IMAGE_TYPES:
+        st.image(data, caption="Uploaded Image")
+
+    content = job.get('content')
+    if content is not None:
+        page_info = job.get('page_info') or {}
+        if file_type == "application/pdf":
+            st.write(f"✅ Successfully extracted text from PDF ({len(content)} characters)")
+            if page_info.get('ocr_pages'):
+                st.caption(f"{page_info['ocr_pages']} of {page_info['pages']} pages had no text layer and were OCRed")
+        st.subheader("📄 Text Preview")
+        preview_text = content[:1000] + "..." if len(content) > 1000 else content
+        st.text_area("Extracted Text Preview", preview_text, height=200, disabled=True, key=f"preview-{key}")
+
+    compaction = job.get('compaction')
+    if compaction and compaction['chars_saved'] > 0:
+        st.caption(
+            f"Compacted text by {compaction['chars_saved']} characters "
+            f"(~{compaction['tokens_saved']} tokens) before sending it to the model"
+        )
+
+    doc_type = job.get('doc_type')
+    if doc_type:
+        st.subheader("📋 Document Classification")
+        st.info(f"Document Type: **{doc_type.upper()}**")
+        if job.get('classified_by') in CLASSIFIED_WITHOUT_LLM:
+            st.caption(CLASSIFIED_WITHOUT_LLM[job['classified_by']])
+
+    if job['status'] in ('queued', 'running'):
+        st.info(f"⏳ {job['stage']}")
+        fields = list(job['fields'])
+        if fields:
+            st.table([{k: field.get(k) for k in ('name', 'value', 'confidence')} for field in fields])
+    elif job['status'] == 'error':
+        st.error(f"An error occurred: {job['error']}")
+        st.error("Make sure your GROQ_API_KEY is set and all dependencies are installed.")
+        if st.button("🔁 Retry", key=f"retry-{key}"):
+            get_upload_jobs().discard(key)
+            st.rerun()
+    elif job.get('result') is not None:
+        st.subheader("📊 Extracted Information")
+        st.json(job['result'])
+        st.download_button(
+            label="📥 Download Extracted Data",
+            data=json.dumps(job['result'], indent=2),
+            file_name=f"extracted_{doc_type}_{job['name']}.json",
+            mime="application/json",
+            key=f"download-{key}",
+        )
+
+    # Stage timings for this upload (set TRACING_ENABLED=1 to record them)
+    if tracer.enabled and job.get('trace_id') is not None and job['status'] in ('done', 'error'):
+        with st.expander("⏱️ Stage timings"):
+            st.table([
+                {'stage': s['name'], 'ms': round(s['duration'] * 1000, 1), 'error': s['error'] or ""}
+                for s in sorted(tracer.spans(job['trace_id']), key=lambda s: s['start'])
+            ])
+
 
 # Streamlit UI
 st.set_page_config(page_title="Agentic Document Extraction", page_icon="📄", layout="wide")
 st.title("📄 Agentic Document Extraction")
-st.write("Upload a document (PDF, Image, or Text) to extract structured information")
+st.write("Upload documents (PDF, Image, or Text) to extract structured information")
 
-# File uploader
-uploaded_file = st.file_uploader("Upload a document", type=["txt", "pdf", "png", "jpg", "jpeg"])
+# Extraction mode (the fused mode classifies and extracts in one LLM call)
+fused_mode = st.sidebar.radio(
+    "Extraction mode", ["Two calls (classify, then extract)", "Single fused call"]
+) == "Single fused call"
 
-if uploaded_file is not None:
-    st.success(f"Uploaded file: {uploaded_file.name}")
+# File uploader; every file is processed concurrently in the background
+uploaded_files = st.file_uploader(
+    "Upload documents", type=["txt", "pdf", "png", "jpg", "jpeg"], accept_multiple_files=True
+)
 
-    content = None
-    doc_type = None
+if uploaded_files:
+    jobs = get_upload_jobs()
+    uploads = []
+    for uploaded_file in uploaded_files:
+        data = uploaded_file.getvalue()
+        key = f"{hashlib.sha256(data).hexdigest()}:{'fused' if fused_mode else 'two_call'}"
+        job = jobs.submit(
+            key, uploaded_file.name,
+            lambda job, data=data, file_type=uploaded_file.type: run_upload(job, data, file_type, fused_mode),
+        )
+        uploads.append((key, job, data, uploaded_file.type))
 
-    try:
-        # If it's a PDF
-        if uploaded_file.type == "application/pdf":
-            with st.spinner("Extracting text from PDF..."):
-                content = extract_text_from_pdf(uploaded_file)
-            
-            st.write(f"✅ Successfully extracted text from PDF ({len(content)} characters)")
-            
-            # Show preview of extracted text
-            st.subheader("📄 Text Preview")
-            preview_text = content[:1000] + "..." if len(content) > 1000 else content
-            st.text_area("Extracted Text Preview", preview_text, height=200, disabled=True)
-
-        # If it's a text file
-        elif uploaded_file.type == "text/plain":
-            content = uploaded_file.read().decode("utf-8")
-            st.subheader("📄 Extracted Text")
-            preview_text = content[:1000] + "..." if len(content) > 1000 else content
-            st.text_area("Text Content", preview_text, height=200, disabled=True)
-
-        # If it's an image
-        elif uploaded_file.type in ["image/png", "image/jpeg"]:
-            st.image(uploaded_file, caption="Uploaded Image")
-            st.warning("Image OCR not implemented yet. Please use PDF or text files.")
-            content = None
-
-        # Process the extracted content
-        if content and content.strip():
-            
-            # Step 1: Classify document
-            with st.spinner("Classifying document..."):
-                doc_type = classify_doc(content)
-            
-            st.subheader("📋 Document Classification")
-            st.info(f"Document Type: **{doc_type.upper()}**")
-            
-            # Step 2: Extract fields based on document type
-            with st.spinner("Extracting structured information..."):
-                # Define fields based on document type
-                field_mapping = {
-                    'invoice': ['Invoice Number', 'Date', 'Vendor Name', 'Total Amount', 'Tax Amount'],
-                    'medical_bill': ['Patient Name', 'Bill Date', 'Hospital Name', 'Total Amount', 'Insurance'],
-                    'prescription': ['Patient Name', 'Doctor Name', 'Prescription Date', 'Medications'],
-                    'other': ['Date', 'Amount', 'Key Information']
-                }
-                
-                fields_to_extract = field_mapping.get(doc_type, field_mapping['other'])
-                extracted_info = extract_fields(content, doc_type, fields_to_extract)
-            
-            # Display results
-            st.subheader("📊 Extracted Information")
-            
-            # Try to parse as JSON for better display
-            try:
-                if extracted_info.strip().startswith('{'):
-                    parsed_data = json.loads(extracted_info)
-                    st.json(parsed_data)
-                else:
-                    st.markdown("**Extracted Data:**")
-                    st.write(extracted_info)
-            except json.JSONDecodeError:
-                st.markdown("**Extracted Data:**")
-                st.write(extracted_info)
-            
-            # Download option
-            st.download_button(
-                label="📥 Download Extracted Data",
-                data=extracted_info,
-                file_name=f"extracted_{doc_type}_{uploaded_file.name}.json",
-                mime="application/json"
-            )
-
-    except Exception as e:
-        st.error(f"An error occurred: {str(e)}")
-        st.error("Make sure your GROQ_API_KEY is set and all dependencies are installed.")
+    pending = any(job['status'] in ('queued', 'running') for _, job, _, _ in uploads)
+
+    # Only this fragment reruns while polling, so the rest of the page stays responsive
+    @st.fragment(run_every=POLL_SECONDS if pending else None)
+    def show_uploads():
+        done = sum(job['status'] in ('done', 'error') for _, job, _, _ in uploads)
+        st.success(f"Processed {done} of {len(uploads)} uploaded file(s)")
+        tabs = st.tabs([job['name'] for _, job, _, _ in uploads]) if len(uploads) > 1 else [st.container()]
+        for tab, (key, job, data, file_type) in zip(tabs, uploads):
+            with tab:
+                show_job(key, job, data, file_type)
+        if pending and done == len(uploads):
+            # Everything finished; a full rerun stops the polling
+            st.rerun()
+
+    show_uploads()
 
 # Sidebar with information
 with st.sidebar:
     st.header("📋 Instructions")
     st.markdown("""
-    1. **Upload** a document (PDF or text file)
+    1. **Upload** a document (PDF, image or text file)
     2. **Wait** for text extraction and classification
     3. **Review** the extracted structured data
     4. **Download** the results
@@ -115,6 +238,7 @@ with st.sidebar:
     **Required:**
     - GROQ API Key (set as environment variable)
     - Python packages: `streamlit`, `pdfplumber`, `groq`
+    - For scanned PDFs and images: `pytesseract`, `pdf2image`, plus Tesseract and poppler
     
     **Set API Key:**
     ```bash
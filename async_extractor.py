@@ -0,0 +1,223 @@
+import asyncio
+import random
+from typing import List, Optional
+
+import httpx
+from groq import APIConnectionError, AsyncGroq, RateLimitError
+
+from config import (
+    CHUNK_MAX_CHARS, FIELD_MAPPING, GROQ_API_KEY, GROQ_MAX_CONCURRENCY, GROQ_MAX_CONNECTIONS, GROQ_MODEL,
+    GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE, MAX_CHUNKS,
+)
+from extractor import (
+    JSON_MODE, build_classify_messages, build_extract_messages, build_fused_messages, cached_response,
+    chunk_usage, estimate_tokens, estimated_usage, merge_field_results, response_model, store_response,
+)
+from schemas.extraction_models import LLMExtraction
+from utils.chunking import select_chunks
+from utils.parsing import IncrementalFieldParser
+from utils.rate_limit import RateLimitScheduler
+from utils.tracing import count_tokens, span
+
+# Completion budget assumed when estimating the tokens a request will use
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Errors retried with backoff; the SDK reports transport failures as APIConnectionError
+TRANSIENT_ERRORS = (APIConnectionError, httpx.TransportError, asyncio.TimeoutError)
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class AsyncExtractionClient:
+    """
+    Asynchronous classification and extraction against the Groq API.
+
+    A single instance shares one HTTP connection pool and one
+    RateLimitScheduler across every coroutine that uses it, so hundreds of
+    documents can be in flight without exceeding the account's limits.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = GROQ_MODEL,
+        requests_per_minute: float = GROQ_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = GROQ_TOKENS_PER_MINUTE,
+        max_concurrency: int = GROQ_MAX_CONCURRENCY,
+        max_connections: int = GROQ_MAX_CONNECTIONS,
+        max_retries: int = 5,
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            api_key: Groq API key (defaults to GROQ_API_KEY)
+            model: Model used for every request
+            requests_per_minute: Request budget enforced by the scheduler
+            tokens_per_minute: Token budget enforced by the scheduler
+            max_concurrency: Maximum requests awaiting a response at once
+            max_connections: Size of the shared HTTP connection pool
+            max_retries: Attempts after a rate-limit or transient error
+        """
+        self.model = model
+        self.max_retries = max_retries
+        self.scheduler = RateLimitScheduler(requests_per_minute, tokens_per_minute)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        # Retries are handled here so that 429s back off globally
+        self._client = AsyncGroq(api_key=api_key or GROQ_API_KEY, http_client=self._http, max_retries=0)
+        self._max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.close()
+
+    async def chat(self, messages: List[dict], **kwargs) -> str:
+        """Send a chat completion through the scheduler and return its content."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        estimate = estimate_tokens(messages) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(estimate)
+            try:
+                async with self._semaphore:
+                    resp = await self._client.chat.completions.create(
+                        model=self.model, messages=messages, **kwargs
+                    )
+            except (RateLimitError,) + TRANSIENT_ERRORS as e:
+                await self._back_off(e, attempt)
+                continue
+
+            if resp.usage is not None:
+                self.scheduler.record_usage(estimate, resp.usage.total_tokens)
+                count_tokens(resp.usage)
+            return resp.choices[0].message.content
+
+    async def _back_off(self, error: Exception, attempt: int):
+        """Wait before retrying a failed request, or re-raise once retries are exhausted."""
+        if attempt == self.max_retries:
+            raise error
+        if isinstance(error, RateLimitError):
+            delay = _retry_after(error.response)
+            if delay is None:
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+            # Every request waits, not just this one
+            self.scheduler.pause(delay)
+        else:
+            await asyncio.sleep(min(30.0, 2 ** attempt) + random.uniform(0, 1))
+
+    async def chat_stream(self, messages: List[dict], on_field, output_model=LLMExtraction, **kwargs) -> str:
+        """
+        Stream a chat completion, calling on_field(field) as each field completes.
+
+        Each field is validated by ``output_model.parse_field`` first, as
+        it will be in the final response.
+
+        Rate-limit and transport errors are retried like chat() as long as
+        no content has arrived, so no field is reported twice. Token usage
+        is taken from the stream when the API reports it, and estimated
+        from the prompt and output otherwise.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        estimate = estimate_tokens(messages) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(estimate)
+            parser = IncrementalFieldParser(model=output_model)
+            usage = None
+            try:
+                async with self._semaphore:
+                    stream = await self._client.chat.completions.create(
+                        model=self.model, messages=messages, stream=True, **kwargs
+                    )
+                    async for chunk in stream:
+                        usage = chunk_usage(chunk) or usage
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            for field in parser.feed(delta):
+                                on_field(field)
+            except (RateLimitError,) + TRANSIENT_ERRORS as e:
+                if parser.buffer:
+                    # Fields already reported cannot be taken back
+                    raise
+                await self._back_off(e, attempt)
+                continue
+
+            usage = usage or estimated_usage(messages, parser.buffer)
+            self.scheduler.record_usage(estimate, usage.total_tokens)
+            count_tokens(usage)
+            return parser.buffer
+
+    async def _cached(self, operation: str, text: str, params, compute, on_field=None, model=None):
+        """Async counterpart of extractor._cached, sharing its cache lookup and storage."""
+        key, result = cached_response(operation, text, params, on_field, model, self.model)
+        if result is not None:
+            return result
+        with span("llm_request", operation=operation):
+            value = await compute()
+        return store_response(key, value, model)
+
+    async def classify_doc(self, text: str) -> str:
+        """Async counterpart of extractor.classify_doc."""
+        async def compute():
+            content = await self.chat(build_classify_messages(text))
+            return content.strip().lower()
+        return await self._cached("classify", text, None, compute)
+
+    async def extract_fields(self, text: str, doc_type: str, fields: list = None, on_field=None) -> LLMExtraction:
+        """Async counterpart of extractor.extract_fields."""
+        messages = build_extract_messages(text, doc_type, fields)
+        model = response_model(doc_type, fields)
+
+        async def compute():
+            if on_field is not None:
+                return await self.chat_stream(messages, on_field, model, temperature=0)
+            return await self.chat(messages, temperature=0, response_format=JSON_MODE)
+        return await self._cached("extract", text, [doc_type, fields], compute, on_field, model)
+
+    async def extract_fields_chunked(self, text: str, doc_type: str, fields: list = None,
+                                     max_chunks: int = MAX_CHUNKS, max_chars: int = CHUNK_MAX_CHARS,
+                                     on_field=None) -> LLMExtraction:
+        """Async counterpart of extractor.extract_fields_chunked."""
+        if len(text) <= max_chars:
+            return await self.extract_fields(text, doc_type, fields, on_field)
+        chunks = select_chunks(text, fields or [], max_chunks, max_chars)
+        if len(chunks) == 1:
+            return await self.extract_fields(chunks[0], doc_type, fields, on_field)
+        outputs = await asyncio.gather(*(self.extract_fields(chunk, doc_type, fields) for chunk in chunks))
+        merged = merge_field_results(doc_type, outputs, fields)
+        if on_field is not None:
+            for field in merged.fields:
+                on_field(field.model_dump())
+        return merged
+
+    async def classify_and_extract(self, text: str, field_mapping: dict = None, on_field=None) -> LLMExtraction:
+        """Async counterpart of extractor.classify_and_extract."""
+        field_mapping = field_mapping or FIELD_MAPPING
+        messages = build_fused_messages(text, field_mapping)
+
+        async def compute():
+            if on_field is not None:
+                return await self.chat_stream(messages, on_field, temperature=0)
+            return await self.chat(messages, temperature=0, response_format=JSON_MODE)
+        return await self._cached("fused", text, field_mapping, compute, on_field, LLMExtraction)
@@ -0,0 +1,453 @@
+"""
+Headless batch runner for the extraction pipeline.
+
+Usage:
+    python -m batch --input data/ --output results.jsonl --workers 8
+    python -m batch --input "data/**/*.pdf" --executor thread
+    python -m batch --manifest files.lst --output results.jsonl
+    python -m batch --input data/ --executor async --max-in-flight 256
+    python -m batch --input data/ --executor thread --field-events fields.jsonl
+    python -m batch --input data/ --executor async --trace trace.json --metrics metrics.prom
+    python -m batch --input data/ --ledger backfill.sqlite3 --max-attempts 5
+    python -m batch --input data/ --output results.parquet --rotate-bytes 268435456
+    python -m batch --input data/ --templates templates.sqlite3
+    python -m batch --input data/ --near-duplicates seen.sqlite3
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from config import NEAR_DUPLICATE_INDEX, TEMPLATE_STORE
+from pipeline import IMAGE_EXTENSIONS, MODES, STAGES, process_document, process_document_async
+from utils import tracing
+from utils.ledger import document_fingerprint, open_ledger, retry_delay
+from utils.sinks import open_sink
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt") + IMAGE_EXTENSIONS
+EXECUTORS = ("process", "thread", "async")
+
+# Stages calling the LLM; their failures (API and network errors) are worth retrying
+RETRIED_STAGES = ("classify", "extract")
+
+
+def iter_inputs(inputs: Iterable[str] = (), manifest: Optional[str] = None) -> Iterator[str]:
+    """
+    Expand directories, glob patterns and manifest files into document paths.
+
+    Args:
+        inputs: Directories, glob patterns or individual file paths
+        manifest: Optional file listing one document path per line
+
+    Yields:
+        Paths of supported documents, directories in sorted order
+    """
+    for spec in inputs:
+        if os.path.isdir(spec):
+            for root, dirs, files in os.walk(spec):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif glob.has_magic(spec):
+            for path in sorted(glob.iglob(spec, recursive=True)):
+                if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield path
+        else:
+            yield spec
+
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_timings(stage_timings: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """Compute count, mean, p50, p95, p99 and max latency for each stage."""
+    summary = {}
+    for stage, values in stage_timings.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        summary[stage] = {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p50': _percentile(ordered, 50),
+            'p95': _percentile(ordered, 95),
+            'p99': _percentile(ordered, 99),
+            'max': ordered[-1],
+        }
+    return summary
+
+
+class FieldEventWriter:
+    """Appends one JSON line per extracted field as soon as it arrives."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def write(self, doc_path: str, field: Dict[str, Any]):
+        event = {"path": doc_path, "elapsed": time.perf_counter() - self._start, "field": field}
+        with self._lock:
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _ledger_job(path: str, mode: str, ledger: str, max_attempts: int):
+    """Return the ledger, the document's key and its fingerprint (None when the file cannot be read)."""
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+    store = open_ledger(ledger)
+    key = os.path.abspath(path)
+    try:
+        return store, key, document_fingerprint(path, mode)
+    except OSError:
+        # Missing files are reported by the pipeline as usual
+        return store, key, None
+
+
+def _finish_attempt(store, key: str, record: Dict[str, Any], attempt: int, tries: int, max_attempts: int) -> bool:
+    """Record an attempt in the ledger; returns whether the document is done retrying."""
+    record['attempts'] = attempt
+    store.finish(key, record)
+    if record['status'] == 'success' or tries == max_attempts:
+        return True
+    # Unsupported or unreadable files fail the same way every time
+    return record.get('error_stage') not in RETRIED_STAGES
+
+
+def process_with_ledger(path: str, mode: str = "two_call", on_field=None, ledger: str = "",
+                        max_attempts: int = 3, backoff: float = 1.0, **options) -> Dict[str, Any]:
+    """
+    Run process_document with checkpoints from a ledger, retrying failures.
+
+    Each attempt resumes after the document's last checkpointed stage.
+    Attempts that failed in an LLM stage (API and network errors) are
+    retried after exponential backoff until one succeeds or
+    ``max_attempts`` have been made in this run; other failures are final.
+
+    Args:
+        path: Document to process
+        mode: Pipeline mode passed to process_document
+        on_field: Optional streaming callback passed to process_document
+        ledger: Path of the SQLite ledger (see utils.ledger.JobLedger)
+        max_attempts: Attempts made before the document is left failed (at least 1)
+        backoff: Base delay in seconds between attempts
+        **options: Further process_document arguments (templates, duplicates)
+
+    Returns:
+        The record of the last attempt, with its overall attempt number
+    """
+    store, key, fingerprint = _ledger_job(path, mode, ledger, max_attempts)
+    if fingerprint is None:
+        return process_document(path, mode, on_field, **options)
+    for tries in range(1, max_attempts + 1):
+        attempt = store.start(key, fingerprint)
+        record = process_document(path, mode, on_field, store.checkpoints(key), **options)
+        if _finish_attempt(store, key, record, attempt, tries, max_attempts):
+            return record
+        time.sleep(retry_delay(tries, backoff))
+
+
+async def process_with_ledger_async(path: str, client, mode: str = "two_call", on_field=None, ledger: str = "",
+                                    max_attempts: int = 3, backoff: float = 1.0, **options) -> Dict[str, Any]:
+    """Async counterpart of process_with_ledger, using process_document_async."""
+    store, key, fingerprint = _ledger_job(path, mode, ledger, max_attempts)
+    if fingerprint is None:
+        return await process_document_async(path, client, mode, on_field, **options)
+    for tries in range(1, max_attempts + 1):
+        attempt = store.start(key, fingerprint)
+        record = await process_document_async(path, client, mode, on_field, store.checkpoints(key), **options)
+        if _finish_attempt(store, key, record, attempt, tries, max_attempts):
+            return record
+        await asyncio.sleep(retry_delay(tries, backoff))
+
+
+def _skip_completed(paths: Iterable[str], ledger: str, mode: str, handle) -> Iterator[str]:
+    # Hand back the stored record of documents the ledger already has as done
+    store = open_ledger(ledger)
+    for path in paths:
+        try:
+            record = store.completed(os.path.abspath(path), document_fingerprint(path, mode))
+        except OSError:
+            record = None
+        if record is None:
+            yield path
+        else:
+            handle(dict(record, path=path, skipped=True))
+
+
+def _run_pool(path_iter: Iterator[str], pool_cls, workers: int, max_in_flight: int, mode: str, handle,
+              fields: Optional[FieldEventWriter] = None, process=process_document):
+    pending = set()
+    with pool_cls(max_workers=workers) as pool:
+        def fill():
+            while len(pending) < max_in_flight:
+                path = next(path_iter, None)
+                if path is None:
+                    return
+                on_field = partial(fields.write, path) if fields else None
+                pending.add(pool.submit(process, path, mode, on_field))
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                handle(future.result())
+            fill()
+
+
+async def _run_async(path_iter: Iterator[str], max_in_flight: int, mode: str, handle,
+                     fields: Optional[FieldEventWriter] = None, process=process_document_async):
+    # Imported here so process/thread runs do not need the async client
+    from async_extractor import AsyncExtractionClient
+
+    pending = set()
+    async with AsyncExtractionClient() as client:
+        def fill():
+            while len(pending) < max_in_flight:
+                path = next(path_iter, None)
+                if path is None:
+                    return
+                on_field = partial(fields.write, path) if fields else None
+                pending.add(asyncio.ensure_future(process(path, client, mode, on_field)))
+
+        fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                handle(task.result())
+            fill()
+
+
+def run_batch(
+    paths: Iterable[str],
+    output: str,
+    workers: int = 4,
+    executor: str = "process",
+    max_in_flight: Optional[int] = None,
+    mode: str = "two_call",
+    field_events: Optional[str] = None,
+    trace: Optional[str] = None,
+    metrics: Optional[str] = None,
+    ledger: Optional[str] = None,
+    max_attempts: int = 3,
+    rotate_bytes: Optional[int] = None,
+    templates: Optional[str] = TEMPLATE_STORE,
+    duplicates: Optional[str] = NEAR_DUPLICATE_INDEX,
+) -> Dict[str, Any]:
+    """
+    Process documents concurrently and write one JSON record per line.
+
+    At most ``max_in_flight`` documents are submitted at any time, so
+    arbitrarily long inputs are consumed lazily. The "async" executor runs
+    every document on one event loop with a shared, rate-limited Groq
+    client; use a large ``max_in_flight`` with it.
+
+    Args:
+        paths: Document paths to process
+        output: File to write the records to; .jsonl (optionally .gz or
+            .zst compressed), or .parquet/.arrow for one row per document
+            with extracted fields as columns (see utils.sinks)
+        workers: Number of worker processes or threads (ignored for "async")
+        executor: One of "process", "thread" or "async"
+        max_in_flight: Upper bound on queued documents (defaults to 2 * workers)
+        mode: Pipeline mode passed to process_document ("two_call" or "fused")
+        field_events: Optional JSONL file that receives each extracted field
+            as soon as it is streamed (thread and async executors only)
+        trace: Optional JSON file receiving the run's spans in Chrome
+            trace-event format (thread and async executors only)
+        metrics: Optional file receiving counters and stage latency
+            histograms in Prometheus text format (thread and async only)
+        ledger: Optional SQLite job ledger. Documents it records as done
+            are not processed again (their stored records are written
+            out), and the others are checkpointed stage by stage so an
+            interrupted run resumes where it stopped
+        max_attempts: Attempts per document before giving up (with a ledger)
+        rotate_bytes: Start a new numbered output file once one reaches this size
+        templates: Optional SQLite layout template store (see
+            utils.templates); documents in a learned layout are extracted
+            without the LLM
+        duplicates: Optional SQLite near-duplicate index (see
+            utils.near_duplicates); resubmitted documents are flagged and
+            reuse or are compared with their earlier result
+
+    Returns:
+        Dict with document counts, elapsed time, docs/sec and per-stage latency
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}")
+    if ledger and max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+    if field_events and executor == "process":
+        raise ValueError("Field events need the thread or async executor")
+    if (trace or metrics) and executor == "process":
+        # Spans recorded in worker processes never reach this tracer
+        raise ValueError("Tracing needs the thread or async executor")
+    if trace or metrics:
+        tracing.enable()
+    max_in_flight = max_in_flight or workers * 2
+
+    stage_timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    counts = {'documents': 0, 'errors': 0, 'skipped': 0, 'resumed': 0, 'template_lookups': 0, 'template_hits': 0,
+              'duplicates': 0, 'reused': 0}
+    start = time.perf_counter()
+
+    fields = FieldEventWriter(field_events) if field_events else None
+    with open_sink(output, max_bytes=rotate_bytes) as out:
+        def handle(record: Dict[str, Any]):
+            out.write(record)
+            counts['documents'] += 1
+            if record.get('skipped'):
+                counts['skipped'] += 1
+                return
+            if record['status'] != 'success':
+                counts['errors'] += 1
+            if record.get('resumed_stages'):
+                counts['resumed'] += 1
+            if 'template' in record:
+                counts['template_lookups'] += 1
+                counts['template_hits'] += record['template']['status'] == 'hit'
+            if 'duplicate' in record:
+                counts['duplicates'] += 1
+                counts['reused'] += record['duplicate']['action'] == 'reused'
+            for stage, seconds in record['timings'].items():
+                stage_timings.setdefault(stage, []).append(seconds)
+            if 'first_field_latency' in record:
+                stage_timings.setdefault('first_field', []).append(record['first_field_latency'])
+
+        path_iter = iter(paths)
+        stores = {'templates': templates, 'duplicates': duplicates}
+        process = partial(process_document, **stores)
+        process_async = partial(process_document_async, **stores)
+        if ledger:
+            path_iter = _skip_completed(path_iter, ledger, mode, handle)
+            process = partial(process_with_ledger, ledger=ledger, max_attempts=max_attempts, **stores)
+            process_async = partial(process_with_ledger_async, ledger=ledger, max_attempts=max_attempts, **stores)
+        if executor == "async":
+            asyncio.run(_run_async(path_iter, max_in_flight, mode, handle, fields, process_async))
+        else:
+            pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+            _run_pool(path_iter, pool_cls, workers, max_in_flight, mode, handle, fields, process)
+    if fields:
+        fields.close()
+    if trace:
+        tracing.tracer.write_trace(trace)
+    if metrics:
+        tracing.tracer.write_prometheus(metrics)
+
+    elapsed = time.perf_counter() - start
+    return {
+        **counts,
+        'elapsed': elapsed,
+        'docs_per_sec': (counts['documents'] - counts['skipped']) / elapsed if elapsed > 0 else 0.0,
+        'template_hit_rate': (counts['template_hits'] / counts['template_lookups']
+                              if counts['template_lookups'] else None),
+        'stages': summarize_timings(stage_timings),
+        'outputs': out.files,
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Render a batch summary as a human-readable report."""
+    lines = [
+        f"Processed {summary['documents']} documents ({summary['errors']} errors) "
+        f"in {summary['elapsed']:.2f}s: {summary['docs_per_sec']:.2f} docs/sec",
+    ]
+    if summary.get('skipped') or summary.get('resumed'):
+        lines.append(f"{summary['skipped']} already done in the ledger, {summary['resumed']} resumed from a checkpoint")
+    if summary.get('template_lookups'):
+        lines.append(f"template hit rate: {summary['template_hit_rate']:.1%} "
+                     f"({summary['template_hits']} of {summary['template_lookups']} documents extracted without the LLM)")
+    if summary.get('duplicates'):
+        lines.append(f"{summary['duplicates']} near-duplicates of earlier documents, "
+                     f"{summary['reused']} reusing the earlier result")
+    lines += [
+        f"{'stage':<12} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}",
+    ]
+    for stage, stats in summary['stages'].items():
+        lines.append(
+            f"{stage:<12} {stats['count']:>7} "
+            + " ".join(f"{stats[key] * 1000:>7.1f}ms" for key in ('mean', 'p50', 'p95', 'p99', 'max'))
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Extract structured data from many documents.")
+    parser.add_argument("--input", "-i", nargs="*", default=[],
+                        help="Documents, directories or glob patterns to process")
+    parser.add_argument("--manifest", help="File listing one document path per line")
+    parser.add_argument("--output", "-o", default="results.jsonl",
+                        help="Output file: .jsonl, .jsonl.gz, .jsonl.zst, .parquet or .arrow")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--executor", choices=EXECUTORS, default="process")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Maximum documents queued at once (default: 2 * workers)")
+    parser.add_argument("--mode", choices=MODES, default="two_call",
+                        help="Classify and extract in two LLM calls or one fused call")
+    parser.add_argument("--field-events",
+                        help="Stream completions and append each field to this JSONL file as it arrives")
+    parser.add_argument("--trace", help="Write per-stage spans to this JSON trace file (chrome://tracing)")
+    parser.add_argument("--metrics", help="Write counters and stage histograms to this Prometheus text file")
+    parser.add_argument("--rotate-bytes", type=int, default=None,
+                        help="Rotate to a new numbered output file once one reaches this size")
+    parser.add_argument("--ledger", help="SQLite job ledger used to skip finished documents and resume the rest")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Attempts per document when a ledger is used; LLM failures are retried with backoff")
+    parser.add_argument("--templates", default=TEMPLATE_STORE,
+                        help="SQLite layout template store; repeat layouts are extracted without the LLM")
+    parser.add_argument("--near-duplicates", default=NEAR_DUPLICATE_INDEX,
+                        help="SQLite near-duplicate index; resubmitted documents reuse their earlier result")
+    args = parser.parse_args(argv)
+
+    if not args.input and not args.manifest:
+        parser.error("provide --input and/or --manifest")
+    if args.max_attempts < 1:
+        parser.error("--max-attempts must be at least 1")
+
+    summary = run_batch(
+        iter_inputs(args.input, args.manifest),
+        args.output,
+        workers=args.workers,
+        executor=args.executor,
+        max_in_flight=args.max_in_flight,
+        mode=args.mode,
+        field_events=args.field_events,
+        trace=args.trace,
+        metrics=args.metrics,
+        ledger=args.ledger,
+        max_attempts=args.max_attempts,
+        rotate_bytes=args.rotate_bytes,
+        templates=args.templates,
+        duplicates=args.near_duplicates,
+    )
+    print(format_summary(summary), file=sys.stderr)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
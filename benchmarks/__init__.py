@@ -0,0 +1,8 @@
+"""
+Reproducible benchmarks for the extraction pipeline.
+
+This package contains:
+- fake_groq: Local stand-in for the Groq chat-completions API
+- corpus: Synthetic invoices, medical bills and prescriptions
+- run: Benchmark runner reporting per-stage latency, throughput and memory
+"""
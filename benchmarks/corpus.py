@@ -0,0 +1,256 @@
+"""
+Synthetic invoices, medical bills and prescriptions for benchmarking.
+
+Usage:
+    python -m benchmarks.corpus --output corpus/ --count 60 --formats txt pdf png scan_pdf
+
+Every document is produced from a seeded random generator, so the same
+arguments always give the same corpus. Fields are written as
+"Label: value" lines using the labels in config.FIELD_MAPPING; the
+ground truth of each document is written to manifest.jsonl.
+"""
+import argparse
+import json
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+except ImportError:
+    Image = None
+
+DOC_TYPES = ('invoice', 'medical_bill', 'prescription')
+FORMATS = ('txt', 'pdf', 'png', 'scan_pdf')
+
+_COMPANIES = ['Acme Supplies Ltd', 'Northwind Traders Inc', 'Globex Industrial LLC', 'Initech Services GmbH',
+              'Umbrella Logistics Ltd', 'Stark Components Inc', 'Wayne Office Supply LLC']
+_PEOPLE = ['Maria Garcia', 'James Smith', 'Aiko Tanaka', 'Olu Adeyemi', 'Priya Patel', 'Lars Nilsson',
+           'Fatima Khan', 'Chen Wei']
+_HOSPITALS = ['St. Mary General Hospital', 'Riverside Medical Center', 'Lakeview Community Hospital',
+              'Northgate Health Clinic']
+_INSURERS = ['BlueShield PPO', 'Aetna Choice Plus', 'UnitedHealth Select', 'Self-pay']
+_ITEMS = ['Widget assembly', 'Consulting hours', 'Cable harness', 'Annual license', 'Shipping and handling',
+          'Replacement filter', 'Installation service', 'Steel brackets']
+_PROCEDURES = ['Emergency room visit', 'Complete blood count', 'Chest X-ray', 'Physician consultation',
+               'MRI scan', 'Medication administration']
+_DRUGS = ['Amoxicillin 500mg capsule', 'Lisinopril 10mg tablet', 'Metformin 850mg tablet',
+          'Atorvastatin 20mg tablet', 'Ibuprofen 400mg tablet']
+_SIGS = ['1 tablet by mouth twice daily', '1 capsule three times daily for 7 days', 'once daily at bedtime']
+
+
+def _date(rng: random.Random) -> str:
+    year, month, day = rng.randint(2021, 2025), rng.randint(1, 12), rng.randint(1, 28)
+    style = rng.randrange(3)
+    if style == 0:
+        return f"{year}-{month:02d}-{day:02d}"
+    if style == 1:
+        return f"{day:02d}/{month:02d}/{year}"
+    months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    return f"{day} {months[month - 1]} {year}"
+
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+def make_invoice(rng: random.Random, items: int) -> Tuple[List[str], Dict[str, str]]:
+    vendor = rng.choice(_COMPANIES)
+    lines = [vendor.upper(), "TAX INVOICE", ""]
+    truth = {
+        'Invoice Number': f"INV-{rng.randint(2021, 2025)}-{rng.randint(1, 99999):05d}",
+        'Date': _date(rng),
+        'Vendor Name': vendor,
+    }
+    lines += [f"{name}: {truth[name]}" for name in ('Invoice Number', 'Date', 'Vendor Name')]
+    lines += [f"Bill To: {rng.choice(_PEOPLE)}", "", "Description                 Qty     Unit     Amount"]
+    subtotal = 0.0
+    for _ in range(items):
+        qty, unit = rng.randint(1, 20), rng.randint(500, 50000) / 100
+        subtotal += qty * unit
+        lines.append(f"{rng.choice(_ITEMS):<26} {qty:>4} {unit:>8.2f} {qty * unit:>10.2f}")
+    subtotal = round(subtotal, 2)
+    tax = round(subtotal * rng.choice([0.05, 0.08, 0.1, 0.2]), 2)
+    truth.update({'Subtotal': _money(subtotal), 'Tax Amount': _money(tax), 'Total Amount': _money(subtotal + tax)})
+    lines += ["", *(f"{name}: {truth[name]}" for name in ('Subtotal', 'Tax Amount', 'Total Amount')),
+              "", "Payment due within 30 days. Thank you for your business."]
+    return lines, truth
+
+
+def make_medical_bill(rng: random.Random, items: int) -> Tuple[List[str], Dict[str, str]]:
+    hospital = rng.choice(_HOSPITALS)
+    truth = {
+        'Patient Name': rng.choice(_PEOPLE),
+        'Bill Date': _date(rng),
+        'Hospital Name': hospital,
+        'Insurance': rng.choice(_INSURERS),
+    }
+    lines = [hospital.upper(), "PATIENT STATEMENT - MEDICAL BILL", ""]
+    lines += [f"{name}: {truth[name]}" for name in ('Hospital Name', 'Patient Name', 'Bill Date', 'Insurance')]
+    lines += [f"Account Number: {rng.randint(100000, 999999)}", "", "Service                       Charge"]
+    total = 0.0
+    for _ in range(items):
+        charge = rng.randint(2000, 250000) / 100
+        total += charge
+        lines.append(f"{rng.choice(_PROCEDURES):<28} {charge:>10.2f}")
+    truth['Total Amount'] = _money(round(total, 2))
+    lines += ["", f"Total Amount: {truth['Total Amount']}", "Please contact billing with any questions."]
+    return lines, truth
+
+
+def make_prescription(rng: random.Random, items: int) -> Tuple[List[str], Dict[str, str]]:
+    drugs = rng.sample(_DRUGS, k=min(len(_DRUGS), max(1, items // 2)))
+    truth = {
+        'Patient Name': rng.choice(_PEOPLE),
+        'Doctor Name': f"Dr. {rng.choice(_PEOPLE)}",
+        'Prescription Date': _date(rng),
+        'Medications': "; ".join(drugs),
+    }
+    lines = ["PRESCRIPTION", rng.choice(_HOSPITALS), ""]
+    lines += [f"{name}: {truth[name]}" for name in ('Patient Name', 'Doctor Name', 'Prescription Date', 'Medications')]
+    lines.append("")
+    for drug in drugs:
+        lines += [f"Rx: {drug}", f"Sig: {rng.choice(_SIGS)}", f"Refills: {rng.randint(0, 3)}"]
+    lines += ["", "Signature: ____________________"]
+    return lines, truth
+
+
+GENERATORS = {
+    'invoice': make_invoice,
+    'medical_bill': make_medical_bill,
+    'prescription': make_prescription,
+}
+
+
+def _pdf_escape(line: str) -> str:
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(pages: Sequence[Sequence[str]], path: str, font_size: int = 10):
+    """Write a PDF with a real text layer (Courier, one line per row) without extra dependencies."""
+    objects: List[bytes] = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for lines in pages:
+        rows = [f"BT /F1 {font_size} Tf 50 {760 - i * (font_size + 4)} Td ({_pdf_escape(line)}) Tj ET"
+                for i, line in enumerate(lines)]
+        stream = "\n".join(rows).encode("latin-1")
+        page_ids.append(next_id)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {next_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        next_id += 2
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    header = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>",
+    ]
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(header + objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode()
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    body += f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+def render_scan(lines: Sequence[str], rng: random.Random, dpi: int = 150) -> "Image.Image":
+    """Render lines as a slightly rotated, blurred and noisy grayscale page."""
+    if Image is None:
+        raise RuntimeError("Pillow not installed.")
+    step = int(dpi / 5)
+    # Letter size, stretched for long single-image documents
+    width, height = int(8.5 * dpi), max(int(11 * dpi), dpi + len(lines) * step)
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=max(10, dpi // 7))
+    for i, line in enumerate(lines):
+        draw.text((dpi // 2, dpi // 2 + i * step), line, fill=rng.randint(0, 60), font=font)
+    page = page.rotate(rng.uniform(-1.5, 1.5), fillcolor=255, resample=Image.BICUBIC)
+    page = page.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 0.8)))
+    noise = Image.effect_noise((width, height), rng.uniform(10, 30))
+    return Image.blend(page, noise, 0.08)
+
+
+def _paginate(lines: List[str], per_page: int) -> List[List[str]]:
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+
+def generate_corpus(output: str, count: int = 30, formats: Iterable[str] = ('txt', 'pdf'),
+                    doc_types: Iterable[str] = DOC_TYPES, max_items: int = 12, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic corpus and return the document paths.
+
+    Documents cycle through ``doc_types`` and ``formats``: 'txt' is plain
+    text with form feeds between pages, 'pdf' has a text layer, 'png' is a
+    scanned-looking image, and 'scan_pdf' wraps such images in a PDF with
+    no text layer. Line-item counts vary so some documents span pages.
+
+    Args:
+        output: Directory to write into (created if missing)
+        count: Number of documents
+        formats: Formats to cycle through
+        doc_types: Document types to cycle through
+        max_items: Maximum line items per document
+        seed: Random seed; the same arguments always give the same corpus
+
+    Returns:
+        Paths of the generated documents
+    """
+    formats, doc_types = list(formats), list(doc_types)
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown formats: {', '.join(sorted(unknown))}")
+    os.makedirs(output, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    with open(os.path.join(output, "manifest.jsonl"), "w", encoding="utf-8") as manifest:
+        for i in range(count):
+            doc_type = doc_types[i % len(doc_types)]
+            fmt = formats[(i // len(doc_types)) % len(formats)]
+            lines, truth = GENERATORS[doc_type](rng, rng.randint(1, max_items))
+            pages = _paginate(lines, 50)
+            ext = {'txt': 'txt', 'pdf': 'pdf', 'png': 'png', 'scan_pdf': 'pdf'}[fmt]
+            path = os.path.join(output, f"{i:05d}_{doc_type}_{fmt}.{ext}")
+            if fmt == 'txt':
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\f".join("\n".join(page) for page in pages))
+            elif fmt == 'pdf':
+                write_text_pdf(pages, path)
+            elif fmt == 'png':
+                render_scan(lines, rng).save(path)
+            else:
+                images = [render_scan(page, rng).convert("RGB") for page in pages]
+                images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+            manifest.write(json.dumps({'path': path, 'doc_type': doc_type, 'format': fmt, 'fields': truth}) + "\n")
+            paths.append(path)
+    return paths
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic document corpus.")
+    parser.add_argument("--output", "-o", default="corpus", help="Directory to write documents into")
+    parser.add_argument("--count", "-n", type=int, default=30)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=['txt', 'pdf'])
+    parser.add_argument("--doc-types", nargs="+", choices=DOC_TYPES, default=list(DOC_TYPES))
+    parser.add_argument("--max-items", type=int, default=12, help="Maximum line items per document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = generate_corpus(args.output, args.count, args.formats, args.doc_types, args.max_items, args.seed)
+    print(f"Wrote {len(paths)} documents to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+"""
+Local stand-in for the Groq chat-completions API.
+
+Usage:
+    python -m benchmarks.fake_groq --port 8799 --latency 0.3 --jitter 0.1 --rate-limit 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8799 GROQ_API_KEY=fake python -m batch -i corpus/
+
+Classification requests are answered from keywords in the document and
+extraction requests by reading "Label: value" lines, which is how the
+synthetic corpus lays out its fields, so validation sees realistic values.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# Keywords used to answer classification requests, checked in order
+_TYPE_KEYWORDS = (
+    ('prescription', ('prescription', ' rx', 'sig:', 'refills')),
+    ('medical_bill', ('hospital', 'patient', 'insurance', 'medical')),
+    ('invoice', ('invoice', 'vendor', 'subtotal')),
+)
+_DOC_TYPE_LINE = re.compile(r'^Document type:\s*(\S+)', re.MULTILINE)
+_FIELDS_LINE = re.compile(r'^Fields:\s*(.+)$', re.MULTILINE)
+
+
+def guess_doc_type(text: str) -> str:
+    """Classify text the way the fake model does."""
+    lowered = text.lower()
+    for doc_type, keywords in _TYPE_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return doc_type
+    return 'other'
+
+
+def find_value(text: str, label: str) -> Optional[str]:
+    """Return the value on a "Label: value" line, if the text has one."""
+    match = re.search(rf'^\s*{re.escape(label)}\s*:\s*(.+?)\s*$', text, re.IGNORECASE | re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def _document_text(messages: List[Dict[str, str]]) -> str:
+    content = messages[-1]['content']
+    marker = content.find("\nText:\n")
+    return content[marker + 7:] if marker != -1 else content
+
+
+def answer(messages: List[Dict[str, str]]) -> str:
+    """Build the completion the fake model returns for ``messages``."""
+    # Imported here so starting the server does not read config before callers set the environment
+    from config import FIELD_MAPPING
+
+    system = messages[0]['content'] if messages[0]['role'] == 'system' else ""
+    text = _document_text(messages)
+    if 'document classifier. Based' in system:
+        return guess_doc_type(text)
+
+    prompt = messages[-1]['content']
+    declared = _DOC_TYPE_LINE.search(prompt)
+    doc_type = declared.group(1) if declared else guess_doc_type(text)
+    requested = _FIELDS_LINE.search(prompt)
+    if requested and not requested.group(1).startswith("auto-detect"):
+        names = [name.strip() for name in requested.group(1).split(",")]
+    else:
+        names = FIELD_MAPPING.get(doc_type, FIELD_MAPPING['other'])
+
+    fields = []
+    for name in names:
+        value = find_value(text, name)
+        fields.append({'name': name, 'value': value, 'confidence': 0.95 if value else 0.1})
+    overall = sum(f['confidence'] for f in fields) / len(fields) if fields else 0.0
+    return json.dumps({'doc_type': doc_type, 'fields': fields, 'overall_confidence': round(overall, 3)})
+
+
+class FakeGroqServer:
+    """
+    Threaded HTTP server speaking the subset of the Groq API the pipeline uses.
+
+    Each request sleeps for ``latency`` plus or minus up to ``jitter``
+    seconds; a ``rate_limit`` fraction of requests is answered with 429
+    and a Retry-After header instead. Streaming requests are answered as
+    server-sent events in small chunks.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, jitter: float = 0.05,
+                 rate_limit: float = 0.0, retry_after: float = 0.2, chunk_chars: int = 16,
+                 seed: Optional[int] = None):
+        """
+        Initialize the server; call start() or use it as a context manager.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            latency: Mean seconds before a response is sent
+            jitter: Maximum deviation from ``latency`` in seconds
+            rate_limit: Fraction of requests rejected with 429 (0-1)
+            retry_after: Retry-After value sent with 429 responses
+            chunk_chars: Characters per streamed chunk
+            seed: Seed for reproducible latency and 429 draws
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.chunk_chars = chunk_chars
+        self.stats = {'requests': 0, 'rate_limited': 0, 'streamed': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as GROQ_BASE_URL."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGroqServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-groq", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _draw(self):
+        # Returns (delay, rate_limited) for one request
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            limited = self._random.random() < self.rate_limit
+            if limited:
+                self.stats['rate_limited'] += 1
+        return delay, limited
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+
+                delay, limited = server._draw()
+                if limited:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens",
+                                                    "code": "rate_limit_exceeded"}},
+                                    {"retry-after": str(server.retry_after)})
+                    return
+                time.sleep(delay)
+
+                content = answer(request["messages"])
+                prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                         "total_tokens": prompt_tokens + len(content) // 4}
+                base = {"id": f"chatcmpl-{server.stats['requests']}", "created": int(time.time()),
+                        "model": request.get("model", "fake")}
+                if request.get("stream"):
+                    with server._lock:
+                        server.stats['streamed'] += 1
+                    self._stream(base, content, usage)
+                    return
+                self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }]))
+
+            def _stream(self, base: Dict[str, Any], content: str, usage: Dict[str, int]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                step = max(1, server.chunk_chars)
+                for i in range(0, len(content), step):
+                    event = dict(base, object="chat.completion.chunk", choices=[{
+                        "index": 0, "finish_reason": None, "delta": {"content": content[i:i + step]},
+                    }])
+                    self.wfile.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+                    self.wfile.flush()
+                # Like Groq, report usage on a final chunk under x_groq
+                event = dict(base, object="chat.completion.chunk", x_groq={"id": base["id"], "usage": usage},
+                             choices=[{"index": 0, "finish_reason": "stop", "delta": {}}])
+                self.wfile.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a fake Groq chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Maximum latency deviation in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server = FakeGroqServer(args.host, args.port, args.latency, args.jitter, args.rate_limit,
+                            args.retry_after, seed=args.seed)
+    print(f"Fake Groq API listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,214 @@
+"""
+Benchmark the extraction pipeline against a local fake Groq API.
+
+Usage:
+    python -m benchmarks.run --count 60 --formats txt pdf --executor thread --workers 8
+    python -m benchmarks.run --count 300 --executor async --max-in-flight 128 --latency 0.5 --rate-limit 0.05
+    python -m benchmarks.run --corpus corpus/ --json bench.json
+
+A synthetic corpus is generated (or an existing one reused), the fake
+server is started in-process, and every document goes through
+batch.run_batch. The report gives p50/p95/p99 latency per stage (text
+extraction split into plain-text, PDF text layer and OCR), validation
+and confidence scoring, documents per second, peak RSS, field accuracy
+against the corpus ground truth and the fake server's request counts.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import DOC_TYPES, FORMATS, generate_corpus
+from benchmarks.fake_groq import FakeGroqServer
+
+# Report order; the pipeline's text stage is split into text, pdf_text and ocr
+STAGE_ORDER = (
+    "text", "pdf_text", "ocr", "compact", "dedup", "route", "template", "classify", "extract", "validate", "locate", "score",
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """Peak resident set size of this process and of its finished children, in MiB."""
+    if resource is None:
+        return {'self': None, 'children': None}
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def _text_stage(record: Dict[str, Any]) -> str:
+    # Split the pipeline's text stage by how the text was obtained
+    if record.get('ocr_pages'):
+        return 'ocr'
+    if record['path'].lower().endswith(".pdf"):
+        return 'pdf_text'
+    return 'text'
+
+
+def _score_input(record: Dict[str, Any]) -> Dict[str, Any]:
+    from config import FIELD_MAPPING
+    from validator import error_codes
+
+    result = record.get('result') or {}
+    return {
+        'metadata': {
+            'ocr_confidence': record.get('ocr_confidence', 1.0),
+            'required_fields': FIELD_MAPPING.get(record.get('doc_type'), []),
+        },
+        'extracted_data': {f['name']: f['value'] for f in result.get('fields', []) if f.get('value')},
+        'validation': {'error_codes': error_codes(result)},
+    }
+
+
+def _load_truth(corpus: str) -> Dict[str, Dict[str, Any]]:
+    path = os.path.join(corpus, "manifest.jsonl")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {os.path.abspath(entry['path']): entry for entry in entries}
+
+
+def run_benchmark(paths: List[str], output: str, executor: str = "thread", workers: int = 4,
+                  max_in_flight: Optional[int] = None, mode: str = "two_call",
+                  truth: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Run the batch pipeline over ``paths`` and collect benchmark statistics.
+
+    GROQ_BASE_URL and the other settings must already point at the server
+    under test; config is read when the pipeline is first imported.
+
+    Args:
+        paths: Documents to process
+        output: JSONL file receiving the pipeline records
+        executor: Batch executor ("process", "thread" or "async")
+        workers: Worker processes or threads
+        max_in_flight: Upper bound on queued documents
+        mode: Pipeline mode ("two_call" or "fused")
+        truth: Optional ground truth by absolute path, from the corpus manifest
+
+    Returns:
+        Dict with the batch summary, per-stage latency, peak RSS and accuracy
+    """
+    from batch import run_batch, summarize_timings
+    from confidence import score_batch, score_result
+
+    summary = run_batch(paths, output, workers=workers, executor=executor, max_in_flight=max_in_flight, mode=mode)
+
+    with open(output, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    stage_timings: Dict[str, List[float]] = {}
+    for record in records:
+        for stage, seconds in record['timings'].items():
+            stage = _text_stage(record) if stage == "text" else stage
+            stage_timings.setdefault(stage, []).append(seconds)
+
+    scorable = [_score_input(record) for record in records if record['status'] == 'success']
+    for item in scorable:
+        start = time.perf_counter()
+        score_result(item)
+        stage_timings.setdefault('score', []).append(time.perf_counter() - start)
+    start = time.perf_counter()
+    score_batch(scorable)
+    batch_score_seconds = time.perf_counter() - start
+
+    correct = total = 0
+    for record in records:
+        expected = (truth or {}).get(os.path.abspath(record['path']))
+        if not expected:
+            continue
+        got = {f['name']: f['value'] for f in (record.get('result') or {}).get('fields', [])}
+        for name, value in expected['fields'].items():
+            total += 1
+            correct += got.get(name) == value
+
+    ordered = sorted(stage_timings, key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER))
+    summary['stages'] = summarize_timings({stage: stage_timings[stage] for stage in ordered})
+    summary['score_batch_seconds'] = batch_score_seconds
+    summary['peak_rss_mb'] = peak_rss_mb()
+    summary['field_accuracy'] = correct / total if total else None
+    return summary
+
+
+def format_report(summary: Dict[str, Any]) -> str:
+    """Render a benchmark summary as a human-readable report."""
+    from batch import format_summary
+
+    rss = summary['peak_rss_mb']
+    lines = [format_summary(summary)]
+    lines.append(f"score_batch over all results: {summary['score_batch_seconds'] * 1000:.2f}ms")
+    if rss['self'] is not None:
+        lines.append(f"peak RSS: {rss['self']:.1f} MiB (children {rss['children']:.1f} MiB)")
+    if summary['field_accuracy'] is not None:
+        lines.append(f"field accuracy: {summary['field_accuracy']:.1%}")
+    if 'server' in summary:
+        server = summary['server']
+        lines.append(f"fake API: {server['requests']} requests, {server['rate_limited']} rate limited, "
+                     f"{server['streamed']} streamed")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local fake Groq API.")
+    parser.add_argument("--corpus", help="Existing corpus directory (default: generate one)")
+    parser.add_argument("--count", "-n", type=int, default=60, help="Documents to generate")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=['txt', 'pdf'])
+    parser.add_argument("--doc-types", nargs="+", choices=DOC_TYPES, default=list(DOC_TYPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--executor", choices=("process", "thread", "async"), default="thread")
+    parser.add_argument("--workers", "-w", type=int, default=8)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--mode", choices=("two_call", "fused"), default="two_call")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake API mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Fake API latency jitter in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of fake API requests given 429")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--rpm", type=float, default=1e6, help="Requests per minute allowed by the async client")
+    parser.add_argument("--tpm", type=float, default=1e9, help="Tokens per minute allowed by the async client")
+    parser.add_argument("--cache", action="store_true", help="Keep the on-disk result cache enabled")
+    parser.add_argument("--templates", action="store_true",
+                        help="Learn layout templates during the run and extract repeat layouts from them")
+    parser.add_argument("--json", help="Also write the summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    corpus = args.corpus or os.path.join(workdir, "corpus")
+    if args.corpus:
+        from batch import iter_inputs
+        paths = list(iter_inputs([corpus]))
+    else:
+        paths = generate_corpus(corpus, args.count, args.formats, args.doc_types, seed=args.seed)
+
+    with FakeGroqServer(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                        retry_after=args.retry_after, seed=args.seed) as server:
+        os.environ['GROQ_BASE_URL'] = server.url
+        os.environ.setdefault('GROQ_API_KEY', 'fake')
+        os.environ['GROQ_REQUESTS_PER_MINUTE'] = str(args.rpm)
+        os.environ['GROQ_TOKENS_PER_MINUTE'] = str(args.tpm)
+        if not args.cache:
+            os.environ['EXTRACTION_CACHE_DIR'] = ""
+        os.environ['TEMPLATE_STORE'] = os.path.join(workdir, "templates.sqlite3") if args.templates else ""
+        summary = run_benchmark(paths, os.path.join(workdir, "results.jsonl"), args.executor, args.workers,
+                                args.max_in_flight, args.mode, _load_truth(corpus))
+        summary['server'] = dict(server.stats)
+
+    print(format_report(summary))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,11 @@
-from typing import Dict, List, Any, Optional
+import threading
 from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from utils.tracing import span
+from validator import ErrorCode
 
 @dataclass
 class ScoreComponent:
@@ -9,97 +15,253 @@ class ScoreComponent:
     value: float
     description: str = ""
 
+# Score components in column order, with their default weights and descriptions
+COMPONENTS = ('ocr_confidence', 'field_presence', 'validation', 'data_type', 'pattern_match')
+
+DEFAULT_WEIGHTS = {
+    'ocr_confidence': 0.3,
+    'field_presence': 0.2,
+    'validation': 0.3,
+    'data_type': 0.1,
+    'pattern_match': 0.1
+}
+
+COMPONENT_DESCRIPTIONS = {
+    'ocr_confidence': "Confidence of the OCR text extraction",
+    'field_presence': "Proportion of required fields that were extracted",
+    'validation': "Proportion of fields that passed validation",
+    'data_type': "Proportion of fields with correct data types",
+    'pattern_match': "Proportion of fields that matched expected patterns",
+}
+
+_INVALID, _TYPE, _PATTERN = int(ErrorCode.INVALID), int(ErrorCode.TYPE), int(ErrorCode.PATTERN)
+_ERROR_CODES = {'none': 0, 'invalid': _INVALID, 'type': _TYPE, 'pattern': _PATTERN}
+
+
+def _error_bits(error: Any) -> int:
+    # Plain ints: IntFlag arithmetic is too slow for the batch path. Any
+    # error makes the field invalid; ErrorCode.NONE (0) is no error at all.
+    if isinstance(error, int):
+        code = int(error)
+        return code | _INVALID if code else 0
+    if isinstance(error, Mapping):
+        code = _ERROR_CODES.get(str(error.get('code', 'invalid')).lower(), _INVALID)
+        return code | _INVALID if code else 0
+    message = str(error)
+    bits = _INVALID
+    if 'Expected type' in message:
+        bits |= _TYPE
+    if 'pattern' in message.lower():
+        bits |= _PATTERN
+    return bits
+
+
+def _field_bits(errors: Mapping[str, Iterable[Any]]) -> List[int]:
+    bits = []
+    for field_errors in errors.values():
+        code = 0
+        for error in field_errors:
+            code |= _error_bits(error)
+        if code:
+            bits.append(code)
+    return bits
+
+
+def error_code(error: Any) -> ErrorCode:
+    """
+    Map one validation error to its ErrorCode.
+
+    Errors are expected to be ErrorCode values, ints or dicts with a 'code'
+    key ('type', 'pattern', 'invalid' or 'none'), such as those from
+    validator.error_codes; ErrorCode.NONE means no error. Legacy message
+    strings are still accepted and mapped once by their wording.
+    """
+    return ErrorCode(_error_bits(error))
+
+
+def field_error_codes(errors: Mapping[str, Iterable[Any]]) -> Dict[str, ErrorCode]:
+    """Combine each field's errors into a single ErrorCode per field."""
+    codes = {}
+    for field, field_errors in errors.items():
+        code = 0
+        for error in field_errors:
+            code |= _error_bits(error)
+        if code:
+            codes[field] = ErrorCode(code)
+    return codes
+
+
+@dataclass(frozen=True)
+class ScoreBatch:
+    """
+    Scores for many extraction results, stored column-wise.
+
+    ``components`` has one row per result and one column per entry of
+    COMPONENTS; components that do not apply to a result (e.g. field
+    presence without required fields) are NaN and carry no weight.
+    """
+    scores: np.ndarray
+    components: np.ndarray
+    weights: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of one component for every result."""
+        return self.components[:, COMPONENTS.index(name)]
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """Return {'score': ..., <component>: ...} arrays, e.g. for a DataFrame."""
+        columns = {'score': self.scores}
+        for i, name in enumerate(COMPONENTS):
+            columns[name] = self.components[:, i]
+        return columns
+
+    def ranked(self, descending: bool = True) -> np.ndarray:
+        """Indices of the results ordered by score."""
+        order = np.argsort(self.scores, kind='stable')
+        return order[::-1] if descending else order
+
+    def below(self, threshold: float) -> np.ndarray:
+        """Indices of the results scoring under ``threshold``."""
+        return np.flatnonzero(self.scores < threshold)
+
+    def breakdown(self, index: int) -> List[Dict[str, Any]]:
+        """Per-component breakdown of one result, as ConfidenceScorer reports it."""
+        rows = []
+        for i, name in enumerate(COMPONENTS):
+            value = self.components[index, i]
+            if np.isnan(value):
+                continue
+            rows.append({
+                'name': name,
+                'weight': float(self.weights[i]),
+                'value': float(value),
+                'weighted_value': float(self.weights[i] * value),
+                'description': COMPONENT_DESCRIPTIONS[name]
+            })
+        return rows
+
+
+def _counts(extraction_result: Dict[str, Any]):
+    metadata = extraction_result.get('metadata', {})
+    extracted_fields = extraction_result.get('extracted_data', {})
+    required_fields = metadata.get('required_fields', [])
+    validation = extraction_result.get('validation', {})
+    codes = validation.get('error_codes')
+    if codes is None:
+        codes = _field_bits(validation.get('errors', {}))
+    else:
+        codes = [int(code) for code in codes.values() if code]
+    return (
+        metadata.get('ocr_confidence', 0.8),
+        len(required_fields),
+        sum(1 for field in required_fields if field in extracted_fields),
+        len(extracted_fields),
+        len(codes),
+        sum(1 for code in codes if code & _TYPE),
+        sum(1 for code in codes if code & _PATTERN),
+    )
+
+
+def score_batch(extraction_results: Iterable[Dict[str, Any]],
+                weights: Optional[Mapping[str, float]] = None) -> ScoreBatch:
+    """
+    Score many extraction results at once.
+
+    Each result is reduced to a row of counts in a single pass; all
+    components and the weighted scores are then computed on NumPy arrays.
+    The function keeps no state, so it is safe to call from any thread.
+
+    Args:
+        extraction_results: Dicts with 'metadata' (ocr_confidence,
+            required_fields), 'extracted_data' and 'validation'. Validation
+            may hold 'error_codes' ({field: ErrorCode}) or 'errors'
+            ({field: [error, ...]}, see error_code)
+        weights: Component weights (defaults to DEFAULT_WEIGHTS)
+
+    Returns:
+        ScoreBatch with one score (0-1) and one component row per result
+    """
+    with span("score"):
+        return _score_batch(extraction_results, weights)
+
+
+def _score_batch(extraction_results: Iterable[Dict[str, Any]], weights: Optional[Mapping[str, float]]) -> ScoreBatch:
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    w = np.array([weights[name] for name in COMPONENTS], dtype=float)
+    rows = [_counts(result) for result in extraction_results]
+    if not rows:
+        return ScoreBatch(np.zeros(0), np.zeros((0, len(COMPONENTS))), w)
+
+    ocr, required, present, total, invalid, type_errors, pattern_errors = np.array(rows, dtype=float).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        has_fields = total > 0
+        components = np.column_stack([
+            ocr,
+            np.where(required > 0, present / required, np.nan),
+            np.where(has_fields, (total - invalid) / total, np.nan),
+            np.where(has_fields, 1 - type_errors / total, np.nan),
+            np.where(has_fields, 1 - pattern_errors / total, np.nan),
+        ])
+        applied = np.where(np.isnan(components), 0.0, w)
+        total_weight = applied.sum(axis=1)
+        weighted = np.nansum(components * w, axis=1)
+        scores = np.where(total_weight > 0, weighted / total_weight, 0.0)
+    return ScoreBatch(np.clip(scores, 0.0, 1.0), components, w)
+
+
+def score_result(extraction_result: Dict[str, Any], weights: Optional[Mapping[str, float]] = None) -> float:
+    """Score a single extraction result; pure counterpart of ConfidenceScorer.calculate_score."""
+    return float(score_batch([extraction_result], weights).scores[0])
+
+
 class ConfidenceScorer:
     """
     Calculates confidence scores for extracted document data.
-    
+
     Confidence scores are calculated based on multiple factors:
     - OCR confidence
     - Field presence
     - Field validation
     - Data type consistency
     - Pattern matching
+
+    Scoring is delegated to score_batch; the breakdown of the last
+    calculate_score call is kept per thread, so one scorer can be shared.
     """
-    
+
     def __init__(self):
-        self.components: List[ScoreComponent] = []
-        self.weights = {
-            'ocr_confidence': 0.3,
-            'field_presence': 0.2,
-            'validation': 0.3,
-            'data_type': 0.1,
-            'pattern_match': 0.1
-        }
-    
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self._local = threading.local()
+
+    @property
+    def components(self) -> List[ScoreComponent]:
+        """Components of the last score calculated by this thread."""
+        return getattr(self._local, 'components', [])
+
     def calculate_score(self, extraction_result: Dict[str, Any]) -> float:
         """
         Calculate overall confidence score for an extraction result.
-        
+
         Args:
             extraction_result: Dictionary containing extraction results and metadata
-            
+
         Returns:
             Float between 0 and 1 representing the confidence score
         """
-        self.components = []
-        
-        # Calculate OCR confidence component
-        ocr_confidence = extraction_result.get('metadata', {}).get('ocr_confidence', 0.8)
-        self._add_component('ocr_confidence', self.weights['ocr_confidence'], ocr_confidence,
-                          "Confidence of the OCR text extraction")
-        
-        # Calculate field presence component
-        extracted_fields = extraction_result.get('extracted_data', {})
-        required_fields = extraction_result.get('metadata', {}).get('required_fields', [])
-        
-        if required_fields:
-            present_fields = sum(1 for field in required_fields if field in extracted_fields)
-            field_presence = present_fields / len(required_fields)
-            self._add_component('field_presence', self.weights['field_presence'], field_presence,
-                              "Proportion of required fields that were extracted")
-        
-        # Calculate validation component
-        validation_errors = extraction_result.get('validation', {}).get('errors', {})
-        total_fields = len(extracted_fields)
-        
-        if total_fields > 0:
-            validated_fields = total_fields - len(validation_errors)
-            validation_score = validated_fields / total_fields
-            self._add_component('validation', self.weights['validation'], validation_score,
-                              "Proportion of fields that passed validation")
-        
-        # Calculate data type consistency
-        type_errors = sum(
-            1 for field_errors in validation_errors.values() 
-            if any('Expected type' in str(err) for err in field_errors)
-        )
-        
-        if total_fields > 0:
-            type_consistency = 1 - (type_errors / total_fields)
-            self._add_component('data_type', self.weights['data_type'], type_consistency,
-                              "Proportion of fields with correct data types")
-        
-        # Calculate pattern matching score
-        pattern_errors = sum(
-            1 for field_errors in validation_errors.values() 
-            if any('pattern' in str(err).lower() for err in field_errors)
-        )
-        
-        if total_fields > 0:
-            pattern_score = 1 - (pattern_errors / total_fields)
-            self._add_component('pattern_match', self.weights['pattern_match'], pattern_score,
-                              "Proportion of fields that matched expected patterns")
-        
-        # Calculate weighted sum
-        total_weight = sum(comp.weight for comp in self.components)
-        if total_weight > 0:
-            weighted_sum = sum(comp.weight * comp.value for comp in self.components)
-            final_score = weighted_sum / total_weight
-        else:
-            final_score = 0.0
-        
-        return max(0.0, min(1.0, final_score))  # Clamp between 0 and 1
-    
+        batch = score_batch([extraction_result], self.weights)
+        self._local.components = [
+            ScoreComponent(row['name'], row['weight'], row['value'], row['description'])
+            for row in batch.breakdown(0)
+        ]
+        return float(batch.scores[0])
+
+    def score_batch(self, extraction_results: Iterable[Dict[str, Any]]) -> ScoreBatch:
+        """Score many results with this scorer's weights (see score_batch)."""
+        return score_batch(extraction_results, self.weights)
+
     def get_score_breakdown(self) -> List[Dict[str, Any]]:
         """Get detailed breakdown of score components."""
         return [
@@ -112,22 +274,11 @@ class ConfidenceScorer:
             }
             for comp in self.components
         ]
-    
-    def _add_component(self, name: str, weight: float, value: float, description: str = ""):
-        """Add a score component."""
-        self.components.append(
-            ScoreComponent(
-                name=name,
-                weight=weight,
-                value=value,
-                description=description
-            )
-        )
-    
+
     def adjust_weights(self, new_weights: Dict[str, float]):
         """
         Adjust the weights of score components.
-        
+
         Args:
             new_weights: Dictionary of component names to new weights
         """
@@ -1,34 +1,227 @@
-import pdfplumber
-from groq import Groq
-from config import GROQ_API_KEY, GROQ_MODEL
-from prompts import DOC_CLASSIFIER_PROMPT, EXTRACTION_PROMPT
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import List, Type
+from config import CHUNK_MAX_CHARS, FIELD_MAPPING, GROQ_MODEL, MAX_CHUNKS
+from prompts import DOC_CLASSIFIER_PROMPT, EXTRACTION_PROMPT, FUSED_EXTRACTION_PROMPT, PROMPT_VERSION, SCHEMA_INSTRUCTION
+from schemas.extraction_models import LLMExtraction, extraction_model, extraction_schema
+from utils.cache import get_result_cache, make_cache_key, normalize_text
+from utils.chunking import select_chunks
+from utils.groq_client import get_groq_client
+from utils.parsing import IncrementalFieldParser, parse_model
+from utils.tracing import count_tokens, span
+from utils.pdf_utils import extract_text_from_pdf  # noqa: F401 (kept for existing imports)
 
-client = Groq(api_key=GROQ_API_KEY)
+# Non-streamed extractions ask for JSON mode; streamed ones rely on the schema in the prompt
+JSON_MODE = {"type": "json_object"}
 
-def extract_text_from_pdf(file):
-    text = ""
-    with pdfplumber.open(file) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text
+def request_cache_key(operation: str, text: str, params=None, model: str = GROQ_MODEL) -> str:
+    return make_cache_key(operation, model, PROMPT_VERSION, params, normalize_text(text))
 
-def classify_doc(text: str) -> str:
-    resp = client.chat.completions.create(
-        model=GROQ_MODEL,
-        messages=[
-            {"role": "system", "content": DOC_CLASSIFIER_PROMPT},
-            {"role": "user", "content": text[:2000]}
-        ]
-    )
-    return resp.choices[0].message.content.strip().lower()
-
-def extract_fields(text: str, doc_type: str, fields: list = None):
+def response_model(doc_type: str = None, fields: list = None) -> Type[LLMExtraction]:
+    """Model an extraction response is validated against (typed when fields are known)."""
+    return extraction_model(doc_type, fields) if fields else LLMExtraction
+
+def _emit_fields(result: LLMExtraction, on_field):
+    for field in result.fields:
+        on_field(field.model_dump())
+
+def cached_response(operation: str, text: str, params, on_field=None, model: Type[LLMExtraction] = None,
+                    llm_model: str = GROQ_MODEL):
+    """
+    Look a request up in the result cache.
+
+    On a hit the cached response is parsed into ``model`` (when given) and
+    its fields are reported to ``on_field``.
+
+    Returns:
+        Tuple of (cache key, or None without a cache; cached result, or
+        None on a miss)
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return None, None
+    key = request_cache_key(operation, text, params, llm_model)
+    value = cache.get(key)
+    if value is None:
+        return key, None
+    with span("parse", cached=True):
+        result = parse_model(model, value) if model else value
+    if on_field is not None and model:
+        _emit_fields(result, on_field)
+    return key, result
+
+def store_response(key, value: str, model: Type[LLMExtraction] = None):
+    """Parse a fresh response into ``model`` (when given) and cache it under ``key``."""
+    with span("parse", cached=False):
+        result = parse_model(model, value) if model else value
+    if key is not None:
+        get_result_cache().set(key, result.model_dump_json() if model else value)
+    return result
+
+def _cached(operation: str, text: str, params, compute, on_field=None, model: Type[LLMExtraction] = None):
+    """
+    Return a cached response for this request, calling ``compute`` on a miss.
+
+    With ``model`` the response is parsed into it exactly once and the
+    validated model is returned; its canonical JSON is what gets cached.
+    When ``on_field`` is given, ``compute`` is expected to report fields as
+    they stream in; on a cache hit the cached fields are reported instead.
+    """
+    key, result = cached_response(operation, text, params, on_field, model)
+    if result is not None:
+        return result
+    with span("llm_request", operation=operation):
+        value = compute()
+    return store_response(key, value, model)
+
+def estimate_tokens(messages: List[dict]) -> int:
+    """Rough prompt size in tokens (about four characters per token)."""
+    return sum(len(m["content"]) for m in messages) // 4 + 8 * len(messages)
+
+def chunk_usage(chunk):
+    """Token usage reported on a streamed chunk, or None (Groq reports it on the last chunk, under x_groq)."""
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage
+
+def estimated_usage(messages: List[dict], content: str) -> SimpleNamespace:
+    """Usage estimated from the prompt and the streamed output, for streams that report none."""
+    prompt_tokens, completion_tokens = estimate_tokens(messages), len(content) // 4
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens)
+
+def _stream_completion(messages: list, on_field, model: Type[LLMExtraction] = LLMExtraction, **kwargs) -> str:
+    """Stream a completion, calling on_field(field) with each field object, validated by ``model``, as it completes."""
+    parser = IncrementalFieldParser(model=model)
+    usage = None
+    stream = get_groq_client().chat.completions.create(model=GROQ_MODEL, messages=messages, stream=True, **kwargs)
+    for chunk in stream:
+        usage = chunk_usage(chunk) or usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            for field in parser.feed(delta):
+                on_field(field)
+    count_tokens(usage or estimated_usage(messages, parser.buffer))
+    return parser.buffer
+
+def build_classify_messages(text: str) -> list:
+    return [
+        {"role": "system", "content": DOC_CLASSIFIER_PROMPT},
+        {"role": "user", "content": text[:2000]}
+    ]
+
+def build_extract_messages(text: str, doc_type: str, fields: list = None) -> list:
     field_list = ", ".join(fields) if fields else "auto-detect relevant fields"
-    prompt = EXTRACTION_PROMPT + f"\nDocument type: {doc_type}\nFields: {field_list}\nText:\n{text[:3000]}"
-
-    resp = client.chat.completions.create(
-        model=GROQ_MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
-    return resp.choices[0].message.content
+    schema = SCHEMA_INSTRUCTION.format(schema=extraction_schema(response_model(doc_type, fields)))
+    prompt = EXTRACTION_PROMPT + schema + f"\nDocument type: {doc_type}\nFields: {field_list}\nText:\n{text[:CHUNK_MAX_CHARS]}"
+    return [{"role": "user", "content": prompt}]
+
+def fits_fused_call(text: str, max_chars: int = CHUNK_MAX_CHARS) -> bool:
+    """
+    Whether a document is short enough for one fused classify-and-extract call.
+
+    Longer documents are classified and then extracted chunk by chunk
+    (extract_fields_chunked), so fused mode never truncates them.
+    """
+    return len(text) <= max_chars
+
+def build_fused_messages(text: str, field_mapping: dict = None) -> list:
+    field_mapping = field_mapping or FIELD_MAPPING
+    mapping = "\n".join(f"- {doc_type}: {', '.join(fields)}" for doc_type, fields in field_mapping.items())
+    prompt = FUSED_EXTRACTION_PROMPT.format(field_mapping=mapping)
+    return [
+        {"role": "system", "content": prompt + SCHEMA_INSTRUCTION.format(schema=extraction_schema())},
+        {"role": "user", "content": text[:CHUNK_MAX_CHARS]}
+    ]
+
+def classify_doc(text: str) -> str:
+    def compute():
+        resp = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL,
+            messages=build_classify_messages(text)
+        )
+        count_tokens(resp.usage)
+        return resp.choices[0].message.content.strip().lower()
+    return _cached("classify", text, None, compute)
+
+def extract_fields(text: str, doc_type: str, fields: list = None, on_field=None) -> LLMExtraction:
+    """
+    Extract fields and return the validated response model.
+
+    Pass ``on_field`` to stream the completion: it is called with each
+    {"name", "value", "confidence"} dict as soon as that field is complete.
+    """
+    messages = build_extract_messages(text, doc_type, fields)
+    model = response_model(doc_type, fields)
+
+    def compute():
+        if on_field is not None:
+            return _stream_completion(messages, on_field, model, temperature=0)
+        resp = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            temperature=0,
+            response_format=JSON_MODE
+        )
+        count_tokens(resp.usage)
+        return resp.choices[0].message.content
+    return _cached("extract", text, [doc_type, fields], compute, on_field, model)
+
+def classify_and_extract(text: str, field_mapping: dict = None, on_field=None) -> LLMExtraction:
+    """Classify and extract in a single LLM call; returns the validated response model."""
+    field_mapping = field_mapping or FIELD_MAPPING
+    messages = build_fused_messages(text, field_mapping)
+
+    def compute():
+        if on_field is not None:
+            return _stream_completion(messages, on_field, LLMExtraction, temperature=0)
+        resp = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            temperature=0,
+            response_format=JSON_MODE
+        )
+        count_tokens(resp.usage)
+        return resp.choices[0].message.content
+    return _cached("fused", text, field_mapping, compute, on_field, LLMExtraction)
+
+def merge_field_results(doc_type: str, results: list, fields: list = None) -> LLMExtraction:
+    """Merge per-chunk extraction results, keeping each field's most confident value."""
+    best = {}
+    for result in results:
+        for field in result.fields:
+            if field.value in (None, "", "null", "N/A"):
+                continue
+            key = field.name.strip().lower()
+            if key not in best or field.confidence > best[key].confidence:
+                best[key] = field
+    merged = list(best.values())
+    overall = sum(f.confidence for f in merged) / len(merged) if merged else 0.0
+    repairs = [repair for result in results for repair in result.repairs]
+    return response_model(doc_type, fields)(doc_type=doc_type, fields=merged, overall_confidence=overall,
+                                            repairs=repairs)
+
+def extract_fields_chunked(text: str, doc_type: str, fields: list = None,
+                           max_chunks: int = MAX_CHUNKS, max_chars: int = CHUNK_MAX_CHARS,
+                           on_field=None):
+    """
+    Extract fields from long documents without silently truncating them.
+
+    Short texts go through extract_fields unchanged. Longer ones are split
+    at page/section boundaries, the chunks most relevant to ``fields`` are
+    extracted in parallel, and per-field results are merged by confidence.
+    With ``on_field``, short texts stream their fields; merged results are
+    reported once every chunk has finished.
+    """
+    if len(text) <= max_chars:
+        return extract_fields(text, doc_type, fields, on_field)
+    chunks = select_chunks(text, fields or [], max_chunks, max_chars)
+    if len(chunks) == 1:
+        return extract_fields(chunks[0], doc_type, fields, on_field)
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        outputs = list(pool.map(lambda chunk: extract_fields(chunk, doc_type, fields), chunks))
+    merged = merge_field_results(doc_type, outputs, fields)
+    if on_field is not None:
+        _emit_fields(merged, on_field)
+    return merged
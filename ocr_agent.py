@@ -1,54 +1,269 @@
-from typing import Dict, Optional, Union
-import pytesseract
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import io
+import threading
+
+from utils.tracing import span
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Tesseract language codes mapped to PaddleOCR's
+PADDLE_LANGUAGES = {'eng': 'en', 'fra': 'fr', 'deu': 'german', 'spa': 'es', 'chi_sim': 'ch'}
+
+
+class TesseractEngine:
+    """OCR engine backed by pytesseract.image_to_data."""
+
+    name = 'tesseract'
+
+    def __init__(self, config: Dict):
+        if pytesseract is None:
+            raise RuntimeError("pytesseract not installed.")
+        self.kwargs = dict(config.get('tesseract', {}))
+        self.kwargs.setdefault('lang', config.get('language', 'eng'))
+
+    def recognize(self, img: Image.Image) -> Dict[str, Any]:
+        """Return text plus per-word boxes and confidences (0-1)."""
+        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT, **self.kwargs)
+        words = []
+        lines: Dict[tuple, List[str]] = {}
+        for i, text in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            if conf < 0 or not text.strip():
+                continue
+            left, top = data['left'][i], data['top'][i]
+            words.append({
+                'text': text,
+                'bbox': [left, top, left + data['width'][i], top + data['height'][i]],
+                'confidence': conf / 100.0,
+            })
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            lines.setdefault(key, []).append(text)
+
+        # Rebuild text in reading order: words per line, blank line between blocks
+        parts = []
+        previous_block = None
+        for (block, _, _), line_words in lines.items():
+            if previous_block is not None and block != previous_block:
+                parts.append("")
+            parts.append(" ".join(line_words))
+            previous_block = block
+        return {'text': "\n".join(parts), 'words': words}
+
+
+class PaddleOCREngine:
+    """OCR engine backed by PaddleOCR (model is loaded once per engine)."""
+
+    name = 'paddle'
+
+    def __init__(self, config: Dict):
+        try:
+            from paddleocr import PaddleOCR
+        except ImportError:
+            raise RuntimeError("paddleocr not installed.")
+        language = config.get('language', 'eng')
+        options = {'use_angle_cls': True, 'lang': PADDLE_LANGUAGES.get(language, language), 'show_log': False}
+        options.update(config.get('paddle', {}))
+        self._ocr = PaddleOCR(**options)
+
+    def recognize(self, img: Image.Image) -> Dict[str, Any]:
+        """Return text plus per-word boxes and confidences (0-1)."""
+        import numpy as np
+
+        result = self._ocr.ocr(np.array(img.convert('RGB')), cls=True)
+        words = []
+        lines = []
+        for box, (text, conf) in (result[0] if result else None) or []:
+            xs = [point[0] for point in box]
+            ys = [point[1] for point in box]
+            # PaddleOCR detects text lines; treat each line as one box
+            words.append({
+                'text': text,
+                'bbox': [min(xs), min(ys), max(xs), max(ys)],
+                'confidence': float(conf),
+            })
+            lines.append(text)
+        return {'text': "\n".join(lines), 'words': words}
+
+
+OCR_ENGINES = {
+    'tesseract': TesseractEngine,
+    'paddle': PaddleOCREngine,
+}
+
+
+def _load_image(document: Union[bytes, str, Image.Image]) -> Image.Image:
+    if isinstance(document, bytes):
+        return Image.open(io.BytesIO(document))
+    if isinstance(document, str):
+        return Image.open(document)
+    return document
+
+
+def _mean_confidence(words: List[Dict[str, Any]]) -> float:
+    if not words:
+        return 0.0
+    return sum(word['confidence'] for word in words) / len(words)
+
+
+_worker_agent = None
+
+
+def _init_worker(config: Dict):
+    # Each worker process builds its engine (and loads any model) exactly once
+    global _worker_agent
+    _worker_agent = OCRAgent(dict(config, workers=1))
+    _worker_agent.engine
+
+
+def _process_in_worker(document: Union[bytes, str, Image.Image]) -> Dict:
+    return _worker_agent.process_document(document)
+
 
 class OCRAgent:
     """Handles OCR processing of documents."""
-    
+
     def __init__(self, config: Optional[Dict] = None):
-        """Initialize the OCR agent with optional configuration."""
+        """
+        Initialize the OCR agent with optional configuration.
+
+        Recognized keys: 'engine' ('tesseract' or 'paddle'), 'language',
+        'workers' (processes used by the batch API), and per-engine options
+        under 'tesseract' or 'paddle'.
+        """
         self.config = config or {}
-        
+        self._engine = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Guards lazy creation of the engine and pool, which threads may race for
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        """The OCR engine, created on first use."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    name = self.config.get('engine', 'tesseract')
+                    if name not in OCR_ENGINES:
+                        raise ValueError(f"Unknown OCR engine: {name}")
+                    self._engine = OCR_ENGINES[name](self.config)
+        return self._engine
+
     def process_document(self, document: Union[bytes, str, Image.Image]) -> Dict:
         """
         Process a document and extract text using OCR.
-        
+
         Args:
             document: Can be a file path (str), bytes, or PIL Image
-            
+
         Returns:
-            Dict containing extracted text and metadata
+            Dict containing extracted text, per-word boxes and metadata
+            with the mean word confidence
         """
-        try:
-            # Convert input to PIL Image if it's not already
-            if isinstance(document, bytes):
-                img = Image.open(io.BytesIO(document))
-            elif isinstance(document, str):
-                img = Image.open(document)
-            else:
-                img = document
-                
-            # Convert to grayscale for better OCR results
-            if img.mode != 'L':
-                img = img.convert('L')
-                
-            # Perform OCR
-            text = pytesseract.image_to_string(img, **self.config.get('tesseract', {}))
-            
-            return {
-                'status': 'success',
-                'text': text,
-                'metadata': {
-                    'pages': 1,  # Default, can be updated for multi-page docs
-                    'language': self.config.get('language', 'eng'),
-                    'confidence': 0.0  # Can be updated with actual confidence
+        with span("ocr_page", engine=self.config.get('engine', 'tesseract')) as page_span:
+            try:
+                # Convert input to PIL Image if it's not already
+                img = _load_image(document)
+
+                # Convert to grayscale for better OCR results
+                if img.mode != 'L':
+                    img = img.convert('L')
+
+                # Perform OCR
+                result = self.engine.recognize(img)
+
+                return {
+                    'status': 'success',
+                    'text': result['text'],
+                    'words': result['words'],
+                    'metadata': {
+                        'pages': 1,
+                        'language': self.config.get('language', 'eng'),
+                        'engine': self.engine.name,
+                        'confidence': _mean_confidence(result['words'])
+                    }
                 }
+
+            except Exception as e:
+                # Reported in the result, and on the span so failures show up in metrics
+                page_span.record_error(e)
+                return {
+                    'status': 'error',
+                    'error': str(e),
+                    'text': ''
+                }
+
+    def process_pages(self, documents: Iterable[Union[bytes, str, Image.Image]]) -> Iterator[Dict]:
+        """
+        OCR many pages or images, yielding results in input order.
+
+        With config['workers'] > 1 pages are spread over a pool of
+        long-lived worker processes that each hold a warm engine; the pool
+        is kept for later calls until close(). At most two pages per worker
+        are outstanding, so ``documents`` may be a lazy page renderer.
+
+        Args:
+            documents: File paths, bytes or PIL Images
+
+        Yields:
+            One process_document result per input
+        """
+        workers = self.config.get('workers', 1)
+        if workers <= 1:
+            for document in documents:
+                yield self.process_document(document)
+            return
+
+        pool = self._worker_pool(workers)
+        queued = []
+        for document in documents:
+            queued.append(pool.submit(_process_in_worker, document))
+            if len(queued) >= workers * 2:
+                yield queued.pop(0).result()
+        for future in queued:
+            yield future.result()
+
+    def _worker_pool(self, workers: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=(self.config,))
+            return self._pool
+
+    def process_batch(self, documents: Iterable[Union[bytes, str, Image.Image]]) -> Dict:
+        """
+        OCR a multi-page document or a set of images as one result.
+
+        Args:
+            documents: File paths, bytes or PIL Images, one per page
+
+        Returns:
+            Dict with the joined text, per-page results and metadata whose
+            confidence is the mean over every recognized word
+        """
+        pages = list(self.process_pages(documents))
+        words = [word for page in pages for word in page.get('words', [])]
+        errors = [page['error'] for page in pages if page['status'] != 'success']
+        return {
+            'status': 'error' if errors and len(errors) == len(pages) else 'success',
+            'text': "\n\n".join(page['text'] for page in pages).strip(),
+            'pages': pages,
+            'errors': errors,
+            'metadata': {
+                'pages': len(pages),
+                'language': self.config.get('language', 'eng'),
+                'engine': self.config.get('engine', 'tesseract'),
+                'confidence': _mean_confidence(words)
             }
-            
-        except Exception as e:
-            return {
-                'status': 'error',
-                'error': str(e),
-                'text': ''
-            }
+        }
+
+    def close(self):
+        """Shut down the worker pool used by the batch API."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
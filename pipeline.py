@@ -0,0 +1,539 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    FIELD_MAPPING, OCR_DPI, OCR_ENGINE, OCR_LANGUAGE, OCR_WORKERS, PDF_PAGE_WORKERS,
+    NEAR_DUPLICATE_INDEX, ROUTER_CONFIDENCE_THRESHOLD, TEMPLATE_STORE,
+)
+from extractor import classify_and_extract, classify_doc, extract_fields_chunked, fits_fused_call
+from router import DocumentRouter
+from utils.compaction import compact_pages
+from utils.pdf_utils import iter_pdf_images, iter_pdf_page_layers, needs_ocr
+from utils.templates import open_template_store
+from utils.tracing import span
+from utils.word_index import locate_fields, text_words
+from validator import validate_output
+
+STAGES = ("text", "compact", "dedup", "route", "template", "classify", "extract", "validate", "locate")
+
+# "two_call" classifies then extracts; "fused" does both in one LLM call
+MODES = ("two_call", "fused")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+_router = DocumentRouter()
+_ocr_agent = None
+_ocr_agent_lock = threading.Lock()
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str):
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+def get_ocr_agent():
+    """Return this process's shared OCRAgent, creating it on first use."""
+    global _ocr_agent
+    with _ocr_agent_lock:
+        if _ocr_agent is None:
+            # Imported lazily so text-only runs do not need the OCR stack
+            from ocr_agent import OCRAgent
+            _ocr_agent = OCRAgent({'engine': OCR_ENGINE, 'language': OCR_LANGUAGE, 'workers': OCR_WORKERS})
+    return _ocr_agent
+
+
+def extract_pdf_pages(file, ocr_agent=None, workers: int = PDF_PAGE_WORKERS,
+                      with_words: bool = False) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Extract PDF page texts, using the text layer where it exists and OCR elsewhere.
+
+    Every page is first read through its text layer. Pages whose layer is
+    empty or thin (see pdf_utils.needs_ocr) are then rendered and OCRed
+    together, so mixed documents only pay for OCR on scanned pages.
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        ocr_agent: OCRAgent to use (defaults to the shared agent)
+        workers: Processes used for text-layer extraction
+        with_words: Also collect each page's words with their boxes in PDF
+            points, from the text layer or, for OCRed pages, from OCR
+
+    Returns:
+        Tuple of (page texts, info) where info counts total and OCRed pages
+        and holds the mean OCR confidence when any page was OCRed, and the
+        words of each page under 'words' when ``with_words`` is set
+    """
+    pages: Dict[int, str] = {}
+    words: Dict[int, list] = {}
+    ocr_pages = []
+    with span("pdf_text"):
+        for index, text, coverage, *layer_words in iter_pdf_page_layers(file, workers=workers,
+                                                                        with_words=with_words):
+            pages[index] = text
+            if layer_words:
+                words[index] = layer_words[0]
+            if needs_ocr(text, coverage):
+                ocr_pages.append(index)
+
+    info: Dict[str, Any] = {'pages': len(pages), 'ocr_pages': len(ocr_pages)}
+    if ocr_pages:
+        confidences = []
+        with span("ocr", pages=len(ocr_pages)) as ocr_span:
+            try:
+                agent = ocr_agent or get_ocr_agent()
+                rendered = []
+
+                def images():
+                    # Note each image's page index, so results land on the page they came from
+                    for index, image in iter_pdf_images(file, dpi=OCR_DPI, grayscale=True, pages=ocr_pages):
+                        rendered.append(index)
+                        yield image
+
+                # Rendering runs ahead on a background thread while pages are OCRed; results
+                # come back in input order, so the n-th belongs to the n-th rendered page
+                for n, result in enumerate(agent.process_pages(images())):
+                    index = rendered[n]
+                    if result['status'] == 'success' and result['text'].strip():
+                        pages[index] = result['text']
+                        confidences.append(result['metadata']['confidence'])
+                        if with_words:
+                            words[index] = _scaled_words(result['words'], 72 / OCR_DPI)
+            except Exception as e:
+                # Keep whatever the text layer had rather than failing the document
+                info['ocr_error'] = str(e)
+                ocr_span.record_error(e)
+        if confidences:
+            info['ocr_confidence'] = sum(confidences) / len(confidences)
+    if with_words:
+        info['words'] = [words.get(index, []) for index in sorted(pages)]
+
+    return [pages[index] for index in sorted(pages)], info
+
+
+def _scaled_words(words: List[Dict[str, Any]], scale: float) -> List[Dict[str, Any]]:
+    # OCR boxes are in pixels of the rendered page; the text layer's are in points
+    return [{'text': word['text'], 'bbox': [round(v * scale, 2) for v in word['bbox']]} for word in words]
+
+
+def extract_pdf_text(file, ocr_agent=None, workers: int = PDF_PAGE_WORKERS) -> Tuple[str, Dict[str, Any]]:
+    """Like extract_pdf_pages, but returns the pages joined by blank lines."""
+    pages, info = extract_pdf_pages(file, ocr_agent, workers)
+    return "\n\n".join(pages).strip(), info
+
+
+def load_document(path: str, with_words: bool = False) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Read the page texts of a PDF, image or plain-text document.
+
+    Form feeds in text files are treated as page breaks.
+
+    Args:
+        path: Path to a PDF, image or text file
+        with_words: Also return each page's words and boxes under
+            info['words'] (PDF points, image pixels, or character cells
+            for text files)
+
+    Returns:
+        Tuple of (page texts, info) with page and OCR counts
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return extract_pdf_pages(path, with_words=with_words)
+    if ext in IMAGE_EXTENSIONS:
+        result = get_ocr_agent().process_document(path)
+        if result['status'] != 'success':
+            raise RuntimeError(f"OCR failed: {result['error']}")
+        info = {'pages': 1, 'ocr_pages': 1, 'ocr_confidence': result['metadata']['confidence']}
+        if with_words:
+            info['words'] = [_scaled_words(result['words'], 1.0)]
+        return [result['text']], info
+    if ext == ".txt":
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            pages = f.read().split("\f")
+        return pages, ({'words': [text_words(page) for page in pages]} if with_words else {})
+    raise ValueError(f"Unsupported file type: {ext or path}")
+
+
+def route_locally(text: str, threshold: float = ROUTER_CONFIDENCE_THRESHOLD) -> Tuple[Optional[str], float]:
+    """
+    Classify with the local DocumentRouter.
+
+    Returns:
+        Tuple of (doc_type, confidence); doc_type is None when the router is
+        not confident enough and the LLM classifier should be used. Router
+        types without a field mapping (receipt, contract, id) map to 'other',
+        as the LLM classifier would label them.
+    """
+    doc_type, confidence = _router.classify(text)
+    if confidence < threshold:
+        return None, confidence
+    return (doc_type if doc_type in FIELD_MAPPING else 'other'), confidence
+
+
+def _fused_doc_type(result: Dict[str, Any]) -> str:
+    doc_type = result.get("doc_type") or "other"
+    return doc_type if doc_type in FIELD_MAPPING else "other"
+
+
+def _checkpointed(checkpoints, record: Dict[str, Any], stage: str, compute: Callable[[], Any]) -> Any:
+    """Return the stage's checkpointed output, or compute it and save a checkpoint."""
+    if checkpoints is None:
+        return compute()
+    value = checkpoints.load(stage)
+    if value is not None:
+        record.setdefault("resumed_stages", []).append(stage)
+        return value
+    value = compute()
+    checkpoints.save(stage, value)
+    return value
+
+
+async def _checkpointed_async(checkpoints, record: Dict[str, Any], stage: str, compute: Callable[[], Any]) -> Any:
+    """Async counterpart of _checkpointed; ``compute`` returns an awaitable."""
+    if checkpoints is None:
+        return await compute()
+    value = checkpoints.load(stage)
+    if value is not None:
+        record.setdefault("resumed_stages", []).append(stage)
+        return value
+    value = await compute()
+    checkpoints.save(stage, value)
+    return value
+
+
+async def _dumped(result) -> Dict[str, Any]:
+    # Extraction results are kept as plain dicts so they can be checkpointed
+    return (await result).model_dump()
+
+
+def _find_near_duplicate(index_path: str, text: str, words: Optional[list]):
+    """
+    Look a document up in the near-duplicate index.
+
+    Returns:
+        Tuple of (index, signature, prior match or None, whether the prior
+        result can be reused because all its values are still present)
+    """
+    # Imported here so runs without the index do not load numpy
+    from utils.near_duplicates import minhash, open_near_duplicate_index, reusable
+    index = open_near_duplicate_index(index_path)
+    signature = minhash(text)
+    prior = index.query(signature) if signature is not None else None
+    reuse = prior is not None and words is not None and reusable(prior["result"], words)
+    return index, signature, prior, reuse
+
+
+def _record_near_duplicate(record: Dict[str, Any], index, signature, prior: Optional[Dict[str, Any]], reused: bool):
+    """Note what changed since a prior near-duplicate and index newly extracted documents."""
+    from utils.near_duplicates import diff_results
+    if prior is not None and not reused:
+        record["duplicate"]["changes"] = diff_results(prior["result"], record["result"])
+    if not reused and signature is not None and "error" not in record["result"]:
+        index.add(record["path"], signature, record["result"])
+
+
+def _first_field_tracker(record: Dict[str, Any], start: float, on_field: Optional[Callable]):
+    """Wrap on_field so the record notes how long the first field took to arrive."""
+    if on_field is None:
+        return None
+
+    def callback(field: Dict[str, Any]):
+        record.setdefault("first_field_latency", time.perf_counter() - start)
+        on_field(field)
+    return callback
+
+
+@dataclass
+class _DocumentState:
+    """What the stages before the LLM learned about a document, for the stages after it."""
+    text: str
+    words: Optional[list]
+    doc_type: Optional[str]
+    # Result found without the LLM (prior near-duplicate or template), or None
+    local_output: Optional[Dict[str, Any]] = None
+    store: Any = None
+    duplicate_index: Any = None
+    signature: Any = None
+    prior: Optional[Dict[str, Any]] = None
+    reused: bool = False
+
+
+def _new_record(path: str, mode: str, on_field: Optional[Callable]) -> Tuple[Dict[str, Any], Optional[Callable]]:
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    record: Dict[str, Any] = {"path": path, "status": "success", "mode": mode, "timings": {}}
+    return record, _first_field_tracker(record, time.perf_counter(), on_field)
+
+
+@contextmanager
+def _document_span(record: Dict[str, Any]):
+    """Trace the document; errors and the stage raising them are captured in the record rather than raised."""
+    with span("document", path=record["path"], mode=record["mode"]) as document_span:
+        try:
+            yield
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            # A stage's time is recorded even when it raises, so the last one timed is where it failed
+            record["error_stage"] = next(reversed(record["timings"]), None)
+            document_span.record_error(e)
+
+
+def _before_llm(record: Dict[str, Any], pages: List[str], info: Dict[str, Any], on_field: Optional[Callable],
+                templates: Optional[str], duplicates: Optional[str]) -> _DocumentState:
+    """
+    Run the stages between text extraction and the LLM.
+
+    Compacts the text, looks the document up in the near-duplicate index
+    and the template store, and routes it locally. A result found without
+    the LLM is returned as the state's local_output, and already reported
+    to on_field.
+    """
+    timings = record["timings"]
+    words = info.pop("words", None)
+    record.update(info)
+
+    with _timed(timings, "compact"):
+        text, record["compaction"] = compact_pages(pages)
+    if not text.strip():
+        raise ValueError("No text could be extracted from the document")
+    record["chars"] = len(text)
+
+    state = _DocumentState(text=text, words=words, doc_type=None)
+    if duplicates:
+        with _timed(timings, "dedup"):
+            state.duplicate_index, state.signature, state.prior, state.reused = _find_near_duplicate(
+                duplicates, text, words
+            )
+        if state.prior is not None:
+            record["duplicate"] = {"of": state.prior["key"], "similarity": state.prior["similarity"],
+                                   "action": "reused" if state.reused else "extracted"}
+
+    with _timed(timings, "route"):
+        state.doc_type, route_confidence = route_locally(text)
+    record["classification"] = {
+        "source": "router" if state.doc_type else "llm", "router_confidence": route_confidence
+    }
+
+    # A resubmitted document reuses its prior result, a known layout its template
+    if state.reused:
+        state.local_output = state.prior["result"]
+    elif templates and words:
+        state.store = open_template_store(templates)
+        with _timed(timings, "template"):
+            state.local_output, record["template"] = state.store.extract(words, state.doc_type)
+
+    if state.local_output is not None:
+        record["doc_type"] = state.local_output["doc_type"]
+        record["classification"]["source"] = "duplicate" if state.reused else "template"
+        if on_field is not None:
+            for field in state.local_output["fields"]:
+                on_field(field)
+    return state
+
+
+def _after_llm(record: Dict[str, Any], state: _DocumentState, raw_output: Dict[str, Any]):
+    """Validate the extraction, locate its fields and update the template store and near-duplicate index."""
+    timings = record["timings"]
+    if state.local_output is not None:
+        # Prior results and template hits were validated when produced; doing
+        # it again would apply their failed rules' penalties a second time
+        record["result"] = raw_output
+    else:
+        with _timed(timings, "validate"):
+            record["result"] = validate_output(raw_output)
+
+    if state.words is not None and "error" not in record["result"]:
+        with _timed(timings, "locate"):
+            record["result"], record["located_fields"] = locate_fields(record["result"], state.words)
+
+    if state.store is not None and state.local_output is None:
+        # Learn the layout of confident LLM extractions for the next document like this one
+        with span("template_learn"):
+            template_id = state.store.learn(state.words, record["result"])
+        if template_id is not None:
+            record["template"]["learned"] = template_id
+
+    if state.duplicate_index is not None:
+        _record_near_duplicate(record, state.duplicate_index, state.signature, state.prior, state.reused)
+
+
+def _process_pages(record: Dict[str, Any], pages: List[str], info: Dict[str, Any], on_field: Optional[Callable],
+                   checkpoints, templates: Optional[str], duplicates: Optional[str]):
+    """The stages of process_document after text extraction."""
+    timings = record["timings"]
+    state = _before_llm(record, pages, info, on_field, templates, duplicates)
+    text, doc_type = state.text, state.doc_type
+
+    raw_output = state.local_output
+    if raw_output is None and doc_type is None and record["mode"] == "fused" and fits_fused_call(text):
+        with _timed(timings, "extract"):
+            raw_output = _checkpointed(
+                checkpoints, record, "extract",
+                lambda: classify_and_extract(text, on_field=on_field).model_dump(),
+            )
+        record["doc_type"] = _fused_doc_type(raw_output)
+    elif raw_output is None:
+        if doc_type is None:
+            with _timed(timings, "classify"):
+                doc_type = _checkpointed(checkpoints, record, "classify", lambda: classify_doc(text))
+        record["doc_type"] = doc_type
+
+        with _timed(timings, "extract"):
+            fields = FIELD_MAPPING.get(doc_type, FIELD_MAPPING['other'])
+            raw_output = _checkpointed(
+                checkpoints, record, "extract",
+                lambda: extract_fields_chunked(text, doc_type, fields, on_field=on_field).model_dump(),
+            )
+
+    _after_llm(record, state, raw_output)
+
+
+def process_document(path: str, mode: str = "two_call", on_field: Optional[Callable] = None,
+                     checkpoints=None, templates: Optional[str] = TEMPLATE_STORE,
+                     duplicates: Optional[str] = NEAR_DUPLICATE_INDEX) -> Dict[str, Any]:
+    """
+    Run a single document through the full extraction pipeline.
+
+    The stages are text extraction, compaction, local routing, LLM
+    classification (skipped when the router is confident), field
+    extraction, validation and locating each field's source (page and
+    bounding box) among the document's words. Resubmitted documents found
+    in the near-duplicate index and, with a template store, documents in
+    a learned layout skip classification and extraction.
+    Errors are captured in the returned record rather than
+    raised so that one bad file does not abort a batch.
+
+    Args:
+        path: Path to a PDF, image or text file
+        mode: "two_call" for separate classify/extract requests, or "fused"
+            to do both in one request when the router is not confident and
+            the document fits one request (longer ones use two_call)
+        on_field: Optional callback; the extraction is streamed and it is
+            called with each field dict as soon as the field is complete
+        checkpoints: Optional stage store with load(stage) and save(stage,
+            value), such as utils.ledger.StageCheckpoints; text extraction,
+            classification and extraction are skipped when already saved
+        templates: Optional SQLite template store (see utils.templates).
+            Documents matching a learned layout are extracted from it
+            without the LLM unless the result fails validation, and
+            confident LLM extractions are learned as templates
+        duplicates: Optional SQLite near-duplicate index (see
+            utils.near_duplicates). A near-duplicate of an indexed document
+            is flagged under 'duplicate' and reuses the prior result when
+            all of its values are still present exactly (amounts and dates
+            also by value); otherwise it is extracted and the changed
+            fields are listed
+
+    Returns:
+        Dict with the document path, status, doc_type, validated result
+        and per-stage timings in seconds
+    """
+    record, on_field = _new_record(path, mode, on_field)
+    timings = record["timings"]
+
+    with _document_span(record):
+        with _timed(timings, "text"):
+            pages, info = _checkpointed(checkpoints, record, "text", lambda: load_document(path, with_words=True))
+        _process_pages(record, pages, info, on_field, checkpoints, templates, duplicates)
+
+    return record
+
+
+def process_pages(path: str, pages: List[str], info: Dict[str, Any], mode: str = "two_call",
+                  on_field: Optional[Callable] = None, templates: Optional[str] = TEMPLATE_STORE,
+                  duplicates: Optional[str] = NEAR_DUPLICATE_INDEX) -> Dict[str, Any]:
+    """
+    Run already loaded page texts through every stage after text extraction.
+
+    For callers that read the document themselves, such as the Streamlit
+    app, which shows the text while it is being extracted.
+
+    Args:
+        path: Name the document is recorded (and near-duplicate indexed) under
+        pages: Page texts, as returned by load_document
+        info: Page info from load_document, with the page words under 'words'
+            so fields can be located and templates used
+        mode: "two_call" or "fused", as for process_document
+        on_field: Optional streaming callback, as for process_document
+        templates: Optional template store path, as for process_document
+        duplicates: Optional near-duplicate index path, as for process_document
+
+    Returns:
+        Dict with the same layout as process_document, without a 'text' timing
+    """
+    record, on_field = _new_record(path, mode, on_field)
+    with _document_span(record):
+        _process_pages(record, pages, info, on_field, None, templates, duplicates)
+    return record
+
+
+async def process_document_async(path: str, client, mode: str = "two_call", on_field: Optional[Callable] = None,
+                                 checkpoints=None, templates: Optional[str] = TEMPLATE_STORE,
+                                 duplicates: Optional[str] = NEAR_DUPLICATE_INDEX) -> Dict[str, Any]:
+    """
+    Async counterpart of process_document for use with AsyncExtractionClient.
+
+    Text extraction runs in a worker thread so that LLM requests for other
+    documents keep flowing while a PDF is parsed. Every stage but the LLM
+    calls is shared with process_document.
+
+    Args:
+        path: Path to a PDF, image or text file
+        client: AsyncExtractionClient shared by all documents in the run
+        mode: "two_call" or "fused", as for process_document
+        on_field: Optional streaming callback, as for process_document
+        checkpoints: Optional stage store, as for process_document
+        templates: Optional template store path, as for process_document
+        duplicates: Optional near-duplicate index path, as for process_document
+
+    Returns:
+        Dict with the same layout as process_document
+    """
+    record, on_field = _new_record(path, mode, on_field)
+    timings = record["timings"]
+
+    with _document_span(record):
+        with _timed(timings, "text"):
+            pages, info = await _checkpointed_async(
+                checkpoints, record, "text", lambda: asyncio.to_thread(load_document, path, True)
+            )
+        state = _before_llm(record, pages, info, on_field, templates, duplicates)
+        text, doc_type = state.text, state.doc_type
+
+        raw_output = state.local_output
+        if raw_output is None and doc_type is None and mode == "fused" and fits_fused_call(text):
+            with _timed(timings, "extract"):
+                raw_output = await _checkpointed_async(
+                    checkpoints, record, "extract",
+                    lambda: _dumped(client.classify_and_extract(text, on_field=on_field)),
+                )
+            record["doc_type"] = _fused_doc_type(raw_output)
+        elif raw_output is None:
+            if doc_type is None:
+                with _timed(timings, "classify"):
+                    doc_type = await _checkpointed_async(
+                        checkpoints, record, "classify", lambda: client.classify_doc(text)
+                    )
+            record["doc_type"] = doc_type
+
+            with _timed(timings, "extract"):
+                fields = FIELD_MAPPING.get(doc_type, FIELD_MAPPING['other'])
+                raw_output = await _checkpointed_async(
+                    checkpoints, record, "extract",
+                    lambda: _dumped(client.extract_fields_chunked(text, doc_type, fields, on_field=on_field)),
+                )
+
+        _after_llm(record, state, raw_output)
+
+    return record
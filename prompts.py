@@ -23,4 +23,34 @@ Given the document text and expected fields, return JSON in the following schema
 Rules:
 - Estimate confidence between 0 and 1.
 - Return only valid JSON.
-"""
\ No newline at end of file
+"""
+FUSED_EXTRACTION_PROMPT = """
+You are a document classifier and information extractor.
+First decide the document type, then extract the fields listed for that type:
+
+{field_mapping}
+
+Return JSON in the following schema:
+
+{{
+  "doc_type": "<invoice|medical_bill|prescription|other>",
+  "fields": [
+    {{"name": "FieldName", "value": "ExtractedValue", "confidence": 0.0}}
+  ],
+  "overall_confidence": 0.0
+}}
+
+Rules:
+- Use "other" when the document is none of the listed types.
+- Only extract the fields listed for the chosen doc_type, using those exact names.
+- Estimate confidence between 0 and 1.
+- Return only valid JSON.
+"""
+
+SCHEMA_INSTRUCTION = """
+The JSON must conform to this JSON Schema:
+{schema}
+"""
+
+# Bump whenever a prompt above changes so cached responses are not reused
+PROMPT_VERSION = "2"
@@ -1,35 +1,185 @@
-from typing import Dict, Any
+import math
+import re
+from typing import Dict, Any, List, Tuple, Union
+
+# Weighted keyword/regex features for each document type. Features are
+# matched case-insensitively; list more specific phrases before the
+# shorter keywords they contain so the longer phrase wins.
+DOCUMENT_FEATURES: Dict[str, List[Tuple[str, float]]] = {
+    'invoice': [
+        (r'\binvoice\s*(?:no|number|num|#|date)\b', 4.0),
+        (r'\btax\s+invoice\b', 4.0),
+        (r'\binvoice\b', 3.0),
+        (r'\bbill\s+to\b', 1.5),
+        (r'\bship\s+to\b', 1.0),
+        (r'\bamount\s+due\b', 1.5),
+        (r'\bdue\s+date\b', 1.5),
+        (r'\bpayment\s+terms\b|\bnet\s+\d{2}\b', 1.5),
+        (r'\bpurchase\s+order\b|\bp\.?o\.?\s*(?:no|number|#)', 1.0),
+        (r'\bunit\s+price\b', 1.0),
+        (r'\bsub\s*-?total\b', 1.0),
+        (r'\b(?:vat|gst|sales\s+tax)\b', 0.5),
+        (r'\bremit(?:tance)?\b', 1.0),
+    ],
+    'medical_bill': [
+        (r'\bpatient\s+(?:name|id|account|number)\b', 2.5),
+        (r'\b(?:hospital|clinic|medical\s+cent(?:er|re)|health\s*care)\b', 2.0),
+        (r'\b(?:cpt|icd-?10|hcpcs)\b', 3.0),
+        (r'\bdiagnosis\b', 1.5),
+        (r'\b(?:admission|discharge)\s+date\b', 2.5),
+        (r'\b(?:insurance|insurer|payer|copay|co-pay|deductible)\b', 1.5),
+        (r'\bclaim\s*(?:no|number|#)?\b', 1.0),
+        (r'\b(?:room\s+charges|consultation|laboratory|radiology)\b', 1.0),
+        (r'\bstatement\s+of\s+account\b|\bpatient\s+responsibility\b', 2.0),
+    ],
+    'prescription': [
+        (r'\bprescription\b', 3.0),
+        (r'\brx\b|℞', 2.5),
+        (r'\bsig\s*:', 3.0),
+        (r'\b\d+(?:\.\d+)?\s*(?:mg|mcg|ml)\b', 1.0),
+        (r'\b(?:tablet|tab|capsule|cap|syrup|ointment)s?\b', 1.0),
+        (r'\b(?:once|twice|thrice)\s+(?:a\s+)?daily\b|\b(?:od|bd|bid|tid|qid|prn)\b', 1.5),
+        (r'\brefills?\b', 1.5),
+        (r'\bpharmac(?:y|ist)\b|\bdispense\b', 1.0),
+        (r'\bdr\.?\s+[a-z]+|\bm\.?d\.?\b', 0.5),
+    ],
+    'receipt': [
+        (r'\breceipt\b', 3.0),
+        (r'\bthank\s+you\s+for\s+(?:shopping|your\s+(?:purchase|visit))\b', 2.5),
+        (r'\bcashier\b|\bregister\s*#?\b', 1.5),
+        (r'\bchange\s+due\b|\bcash\s+tendered\b', 2.5),
+        (r'\b(?:visa|mastercard|amex|debit)\b.{0,20}\b(?:\*{2,}|x{2,})\d{4}\b', 1.5),
+        (r'\btransaction\s*(?:id|no|#)?\b', 1.0),
+    ],
+    'contract': [
+        (r'\bagreement\b', 2.0),
+        (r'\bthis\s+(?:agreement|contract)\s+is\s+(?:made|entered)\b', 4.0),
+        (r'\bwhereas\b', 2.0),
+        (r'\bhereinafter\b|\bhereto\b|\bhereby\b', 1.5),
+        (r'\bin\s+witness\s+whereof\b', 3.0),
+        (r'\bgoverning\s+law\b|\bjurisdiction\b', 1.5),
+        (r'\btermination\b|\bindemnif(?:y|ication)\b|\bconfidentiality\b', 1.0),
+        (r'\bthe\s+parties\b', 1.5),
+    ],
+    'id': [
+        (r'\bpassport\b', 3.0),
+        (r"\bdriver'?s?\s+licen[cs]e\b", 3.0),
+        (r'\bidentity\s+card\b|\bnational\s+id\b', 3.0),
+        (r'\bdate\s+of\s+birth\b|\bd\.?o\.?b\.?\b', 1.5),
+        (r'\bnationality\b|\bplace\s+of\s+birth\b', 1.5),
+        (r'\b(?:date\s+of\s+)?expiry\b|\bexpires\b', 1.0),
+        (r'\bsex\s*:?\s*[mf]\b', 1.0),
+        (r'[a-z0-9<]{30,}<<', 3.0),
+    ],
+}
+
 
 class DocumentRouter:
-    """Routes documents to appropriate processing pipelines based on their type."""
-    
-    def __init__(self):
+    """
+    Routes documents to appropriate processing pipelines based on their type.
+
+    Classification is local and rule-based: every feature in
+    DOCUMENT_FEATURES is compiled once into a single alternation regex, the
+    text is scanned in one pass, and each document type is scored by the
+    weights of the features it matched. Confidence combines the strength of
+    the best score with its margin over the runner-up, so callers can fall
+    back to an LLM classifier for ambiguous documents.
+    """
+
+    def __init__(self, min_confidence: float = 0.5, max_chars: int = 20000, scale: float = 4.0):
+        """
+        Initialize the router.
+
+        Args:
+            min_confidence: Confidence needed for get_document_type and the
+                _is_* checks to accept a type
+            max_chars: Only the first max_chars characters are scanned
+            scale: Score at which confidence saturation reaches ~63%
+        """
+        self.min_confidence = min_confidence
+        self.max_chars = max_chars
+        self.scale = scale
         self.document_types = {
             'invoice': self._is_invoice,
             'receipt': self._is_receipt,
             'contract': self._is_contract,
             'id': self._is_id_document
         }
-    
-    def get_document_type(self, document: Dict[str, Any]) -> str:
+
+        self._features: List[Tuple[str, float]] = []
+        alternatives = []
+        for doc_type, features in DOCUMENT_FEATURES.items():
+            for pattern, weight in features:
+                alternatives.append(f"(?P<f{len(self._features)}>{pattern})")
+                self._features.append((doc_type, weight))
+        self._index = re.compile("|".join(alternatives), re.IGNORECASE)
+
+    def score(self, document: Union[Dict[str, Any], str]) -> Dict[str, float]:
+        """
+        Score every document type against the text.
+
+        A feature that matches repeatedly adds a diminishing bonus so that
+        a single keyword repeated in a header or footer cannot dominate.
+
+        Args:
+            document: Text, or a dict with a 'text' key
+
+        Returns:
+            Dict mapping each document type to its (unnormalized) score
+        """
+        text = self._get_text(document)[:self.max_chars]
+        counts: Dict[int, int] = {}
+        for match in self._index.finditer(text):
+            feature = int(match.lastgroup[1:])
+            counts[feature] = counts.get(feature, 0) + 1
+
+        scores = {doc_type: 0.0 for doc_type in DOCUMENT_FEATURES}
+        for feature, count in counts.items():
+            doc_type, weight = self._features[feature]
+            scores[doc_type] += weight * (1.0 + math.log(count))
+        return scores
+
+    def classify(self, document: Union[Dict[str, Any], str]) -> Tuple[str, float]:
+        """
+        Classify a document locally.
+
+        Args:
+            document: Text, or a dict with a 'text' key
+
+        Returns:
+            Tuple of (doc_type, confidence between 0 and 1); doc_type is
+            'unknown' when no feature matched
+        """
+        ranked = sorted(self.score(document).items(), key=lambda item: item[1], reverse=True)
+        best_type, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best <= 0:
+            return 'unknown', 0.0
+        saturation = 1.0 - math.exp(-best / self.scale)
+        margin = (best - runner_up) / best
+        return best_type, saturation * margin
+
+    def get_document_type(self, document: Union[Dict[str, Any], str]) -> str:
         """Determine the type of document."""
-        for doc_type, check_func in self.document_types.items():
-            if check_func(document):
-                return doc_type
-        return 'unknown'
-    
+        doc_type, confidence = self.classify(document)
+        return doc_type if confidence >= self.min_confidence else 'unknown'
+
+    def _get_text(self, document: Union[Dict[str, Any], str]) -> str:
+        if isinstance(document, str):
+            return document
+        return document.get('text') or ''
+
+    def _is_type(self, document: Union[Dict[str, Any], str], doc_type: str) -> bool:
+        return self.get_document_type(document) == doc_type
+
     def _is_invoice(self, document: Dict[str, Any]) -> bool:
-        # Add invoice detection logic here
-        return False
-    
+        return self._is_type(document, 'invoice')
+
     def _is_receipt(self, document: Dict[str, Any]) -> bool:
-        # Add receipt detection logic here
-        return False
-    
+        return self._is_type(document, 'receipt')
+
     def _is_contract(self, document: Dict[str, Any]) -> bool:
-        # Add contract detection logic here
-        return False
-    
+        return self._is_type(document, 'contract')
+
     def _is_id_document(self, document: Dict[str, Any]) -> bool:
-        # Add ID document detection logic here
-        return False
+        return self._is_type(document, 'id')
@@ -1,5 +1,12 @@
-from typing import List, Optional, Dict
-from pydantic import BaseModel, Field
+import json
+from functools import lru_cache
+from typing import Any, ClassVar, Dict, List, Literal, Optional, Sequence, Tuple, Type
+from pydantic import (
+    BaseModel, Field, ValidationError, create_model, field_validator, model_serializer, model_validator,
+)
+from pydantic.json_schema import SkipJsonSchema
+
+from config import FIELD_MAPPING
 
 class Source(BaseModel):
     page: int = 1
@@ -21,3 +28,253 @@ class ExtractionOutput(BaseModel):
     fields: List[KVField]
     overall_confidence: float
     qa: QAReport
+
+
+# Confidence words models sometimes return instead of a number
+CONFIDENCE_LABELS = {"very high": 0.95, "high": 0.9, "medium": 0.6, "moderate": 0.6, "low": 0.3, "very low": 0.1}
+
+
+class LLMField(BaseModel):
+    """A field as returned by the extraction LLM."""
+    name: str
+    value: Optional[str] = None
+    confidence: float = Field(0.0, ge=0.0, le=1.0)
+
+    @field_validator("value", mode="before")
+    @classmethod
+    def _coerce_value(cls, value: Any) -> Any:
+        # Models often return amounts as numbers and medications as lists
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if isinstance(value, list):
+            return "; ".join(str(item) for item in value if item is not None)
+        if isinstance(value, dict):
+            return json.dumps(value)
+        return value
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _coerce_confidence(cls, value: Any) -> Any:
+        if value is None:
+            return 0.0
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = value / 100.0 if 1.0 < value <= 100.0 else value
+            return min(1.0, max(0.0, float(value)))
+        return value
+
+
+class LLMExtraction(BaseModel):
+    """
+    Extraction response for any document type.
+
+    Subclasses built by extraction_model restrict ``doc_type`` and the
+    field names to one entry of FIELD_MAPPING.
+    """
+    doc_type: str
+    fields: List[LLMField] = Field(default_factory=list)
+    overall_confidence: float = 0.0
+    # Changes repair() made to the response; not part of the prompt schema
+    repairs: SkipJsonSchema[List[str]] = Field(default_factory=list)
+
+    # Document type and canonical field names of a typed subclass
+    fixed_doc_type: ClassVar[Optional[str]] = None
+    field_names: ClassVar[Tuple[str, ...]] = ()
+
+    @model_validator(mode="before")
+    @classmethod
+    def _normalize(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        if cls.fixed_doc_type is not None:
+            # The type was decided before extraction; don't fail on the echo
+            data["doc_type"] = cls.fixed_doc_type
+        elif isinstance(data.get("doc_type"), str):
+            data["doc_type"] = data["doc_type"].strip().lower()
+        fields = data.get("fields")
+        if isinstance(fields, list):
+            # Match field names loosely and drop entries the schema cannot hold
+            canonical = {_name_key(name): name for name in cls.field_names}
+            kept = []
+            for field in fields:
+                if isinstance(field, LLMField):
+                    kept.append(field)
+                    continue
+                if not isinstance(field, dict) or not isinstance(field.get("name"), str):
+                    continue
+                if canonical:
+                    name = canonical.get(_name_key(field["name"]))
+                    if name is None:
+                        continue
+                    field = dict(field, name=name)
+                kept.append(field)
+            data["fields"] = kept
+        return data
+
+    @model_serializer(mode="wrap")
+    def _omit_no_repairs(self, handler):
+        data = handler(self)
+        if not self.repairs:
+            data.pop("repairs", None)
+        return data
+
+    @classmethod
+    def repair(cls, data: Any) -> Any:
+        """
+        Coerce or drop the parts of a parsed response that fail validation.
+
+        Fields given as a ``{name: value}`` object become a list, confidence
+        words and percentages become numbers, and fields that still do not
+        validate are dropped, so one bad field does not fail the document.
+        Every change is listed under ``repairs``.
+
+        Args:
+            data: Response parsed from JSON
+
+        Returns:
+            The repaired response, to be validated again
+        """
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        repairs = list(data.get("repairs") or [])
+        if cls.fixed_doc_type is None and not isinstance(data.get("doc_type"), str):
+            repairs.append(f"doc_type {data.get('doc_type')!r} replaced by 'other'")
+            data["doc_type"] = "other"
+        overall = {"doc_type": cls.fixed_doc_type or "other", "overall_confidence": data.get("overall_confidence")}
+        if "overall_confidence" in data and not _validates(cls, overall):
+            repairs.append(f"overall_confidence {data.pop('overall_confidence')!r} dropped")
+
+        fields = data.get("fields")
+        if isinstance(fields, dict):
+            repairs.append("fields object converted to a list")
+            fields = [dict(value, name=name) if isinstance(value, dict) else {"name": name, "value": value}
+                      for name, value in fields.items()]
+        if isinstance(fields, list):
+            kept = []
+            for field in fields:
+                if not cls._field_fits(field) and isinstance(field, dict) and "confidence" in field:
+                    confidence = _confidence_number(field["confidence"])
+                    if cls._field_fits(dict(field, confidence=confidence)):
+                        repairs.append(f"{field['name']}: confidence {field['confidence']!r} read as {confidence}")
+                        field = dict(field, confidence=confidence)
+                if cls._field_fits(field):
+                    kept.append(field)
+                else:
+                    repairs.append(f"dropped invalid field {field!r}")
+            data["fields"] = kept
+        elif fields is not None:
+            repairs.append(f"fields {fields!r} dropped")
+            data.pop("fields")
+        data["repairs"] = repairs
+        return data
+
+    @classmethod
+    def _field_fits(cls, field: Any) -> bool:
+        return _validates(cls, {"doc_type": cls.fixed_doc_type or "other", "fields": [field]})
+
+    @classmethod
+    def parse_field(cls, field: Any) -> Optional[LLMField]:
+        """
+        Validate one streamed field exactly as it would be inside a full response.
+
+        Returns:
+            The field with its canonical name and coerced (or repaired) value,
+            or None when the response model would drop it
+        """
+        data = {"doc_type": cls.fixed_doc_type or "other", "fields": [field]}
+        try:
+            fields = cls.model_validate(data).fields
+        except ValidationError:
+            fields = cls.model_validate(cls.repair(data)).fields
+        return fields[0] if fields else None
+
+
+def _validates(model: Type[BaseModel], data: Dict[str, Any]) -> bool:
+    try:
+        model.model_validate(data)
+    except ValidationError:
+        return False
+    return True
+
+
+def _confidence_number(value: Any) -> float:
+    """Read a confidence word ('high') or percentage ('85%'); anything else counts as 0."""
+    if isinstance(value, str):
+        text = " ".join(value.lower().split())
+        if text in CONFIDENCE_LABELS:
+            return CONFIDENCE_LABELS[text]
+        try:
+            number = float(text.rstrip("%"))
+        except ValueError:
+            return 0.0
+        return min(1.0, max(0.0, number / 100.0 if text.endswith("%") or number > 1.0 else number))
+    return 0.0
+
+
+def _name_key(name: str) -> str:
+    return " ".join(name.replace("_", " ").lower().split())
+
+
+def _class_name(doc_type: str) -> str:
+    return "".join(part.title() for part in doc_type.split("_")) + "Extraction"
+
+
+def build_extraction_model(doc_type: str, field_names: Sequence[str]) -> Type[LLMExtraction]:
+    """Create the response model for one document type and its fields."""
+    field_model = create_model(
+        _class_name(doc_type).replace("Extraction", "Field"),
+        __base__=LLMField,
+        name=(Literal[tuple(field_names)], ...),
+    )
+    model = create_model(
+        _class_name(doc_type),
+        __base__=LLMExtraction,
+        doc_type=(Literal[doc_type], doc_type),
+        fields=(List[field_model], Field(default_factory=list)),
+    )
+    model.fixed_doc_type = doc_type
+    model.field_names = tuple(field_names)
+    return model
+
+
+# Typed response models per document type, e.g. EXTRACTION_MODELS['invoice']
+EXTRACTION_MODELS: Dict[str, Type[LLMExtraction]] = {
+    doc_type: build_extraction_model(doc_type, fields) for doc_type, fields in FIELD_MAPPING.items()
+}
+
+
+@lru_cache(maxsize=64)
+def _custom_extraction_model(doc_type: str, field_names: Tuple[str, ...]) -> Type[LLMExtraction]:
+    return build_extraction_model(doc_type, field_names)
+
+
+def extraction_model(doc_type: Optional[str] = None, fields: Optional[Sequence[str]] = None) -> Type[LLMExtraction]:
+    """
+    Return the response model for a document type.
+
+    Args:
+        doc_type: Document type, or None when the LLM decides it (fused mode)
+        fields: Field names requested, when they differ from FIELD_MAPPING
+
+    Returns:
+        The typed model for the type, or LLMExtraction for any other type
+    """
+    if fields and tuple(fields) != tuple(FIELD_MAPPING.get(doc_type, ())):
+        return _custom_extraction_model(doc_type or "other", tuple(fields))
+    return EXTRACTION_MODELS.get(doc_type, LLMExtraction)
+
+
+def _strip_titles(schema: Any) -> Any:
+    if isinstance(schema, dict):
+        return {key: _strip_titles(value) for key, value in schema.items() if key != "title"}
+    if isinstance(schema, list):
+        return [_strip_titles(value) for value in schema]
+    return schema
+
+
+@lru_cache(maxsize=64)
+def extraction_schema(model: Type[LLMExtraction] = LLMExtraction) -> str:
+    """Compact JSON Schema of a response model, as sent in prompts."""
+    schema = _strip_titles(model.model_json_schema())
+    return json.dumps(schema, separators=(",", ":"))
@@ -0,0 +1,54 @@
+import pytest
+
+from extractor import merge_field_results
+from schemas.extraction_models import EXTRACTION_MODELS
+from utils.chunking import score_chunk, select_chunks, split_chunks
+
+FIELDS = ["Invoice Number", "Total Amount"]
+
+
+def test_split_chunks_packs_blocks_up_to_the_limit():
+    text = "\n\n".join(["a" * 40, "b" * 40, "c" * 40])
+    assert split_chunks(text, max_chars=90) == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
+
+
+def test_split_chunks_cuts_long_blocks_at_lines():
+    block = "\n".join(["x" * 30] * 5)
+    chunks = split_chunks(block, max_chars=70)
+    assert all(len(chunk) <= 70 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == "x" * 150
+
+
+def test_split_chunks_breaks_at_form_feeds():
+    assert split_chunks("page one\fpage two", max_chars=10) == ["page one", "page two"]
+
+
+def test_score_chunk_rewards_labels_with_values():
+    assert score_chunk("Grand Total: 108.00", FIELDS) == 1.5
+    assert score_chunk("Grand Total: see below", FIELDS) == 1.0
+    assert score_chunk("Terms of delivery", FIELDS) == 0.0
+
+
+def test_select_chunks_keeps_first_and_most_relevant_in_order():
+    blocks = ["Invoice No: INV-1", "Shipping notes", "Amount Due: 10.00", "More notes", "Total: 10.00"]
+    chunks = select_chunks("\n\n".join(blocks), FIELDS, max_chunks=3, max_chars=20)
+    assert chunks == ["Invoice No: INV-1", "Amount Due: 10.00", "Total: 10.00"]
+
+
+def test_select_chunks_returns_short_texts_whole():
+    assert select_chunks("Total: 1.00", FIELDS) == ["Total: 1.00"]
+
+
+def test_merge_keeps_most_confident_value_per_field():
+    model = EXTRACTION_MODELS["invoice"]
+    first = model.model_validate({"doc_type": "invoice", "fields": [
+        {"name": "Total Amount", "value": "10.00", "confidence": 0.6},
+        {"name": "Invoice Number", "value": "INV-1", "confidence": 0.9},
+    ]})
+    second = model.model_validate({"doc_type": "invoice", "fields": [
+        {"name": "Total Amount", "value": "12.00", "confidence": 0.8},
+        {"name": "Invoice Number", "value": "N/A", "confidence": 1.0},
+    ]})
+    merged = merge_field_results("invoice", [first, second])
+    assert {f.name: f.value for f in merged.fields} == {"Total Amount": "12.00", "Invoice Number": "INV-1"}
+    assert merged.overall_confidence == pytest.approx(0.85)
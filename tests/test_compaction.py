@@ -0,0 +1,50 @@
+from utils.compaction import compact_pages, compact_text
+
+INVOICE = (
+    "ACME Corp\n"
+    "Invoice Number: INV-001\n"
+    "Date: 2024-01-31\n"
+    "All purchases subject to our terms and conditions.\n"
+    "Subtotal: 100.00\n"
+    "Tax: 8.00\n"
+    "Total: 108.00"
+)
+
+
+def test_terms_sentence_keeps_following_lines():
+    text, _ = compact_text(INVOICE)
+    assert "Subtotal: 100.00" in text
+    assert "Tax: 8.00" in text
+    assert "Total: 108.00" in text
+    assert "terms and conditions" not in text
+
+
+def test_notice_heading_keeps_following_lines():
+    text, _ = compact_text("Privacy Notice: we keep your data\nTotal Amount: 55.10")
+    assert text == "Total Amount: 55.10"
+
+
+def test_eoe_needs_word_boundaries():
+    text, _ = compact_text("Goods sold E&OE\nStore&Oeuvre Ltd")
+    assert "E&OE" not in text
+    assert "Store&Oeuvre Ltd" in text
+
+
+def test_repeated_edge_lines_removed_up_to_digits():
+    pages = [
+        f"ACME Corp Statement {n}\nItem {n} 10.00\nPrinted 2024-01-0{n}"
+        for n in range(1, 4)
+    ]
+    text, stats = compact_pages(pages)
+    assert text.count("ACME Corp Statement") == 1
+    assert text.count("Printed") == 1
+    assert all(f"Item {n} 10.00" in text for n in range(1, 4))
+    assert stats['repeated_lines_removed'] == 4
+
+
+def test_repeated_body_lines_must_match_exactly():
+    pages = [f"Header\nACME Corp\nShipped 2024-01-0{n}\nThanks\nFooter" for n in range(1, 3)]
+    text, _ = compact_pages(pages)
+    assert "Shipped 2024-01-01" in text
+    assert "Shipped 2024-01-02" in text
+    assert text.count("ACME Corp") == 1
@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+from confidence import ConfidenceScorer, score_batch, score_result
+from validator import ErrorCode
+
+
+def _result(error_codes=None, required=("a", "b"), extracted=("a", "b", "c", "d"), ocr=0.9):
+    return {
+        "metadata": {"ocr_confidence": ocr, "required_fields": list(required)},
+        "extracted_data": {name: "x" for name in extracted},
+        "validation": {"error_codes": error_codes or {}},
+    }
+
+
+def test_clean_result_scores_its_ocr_confidence_and_full_marks():
+    assert score_result(_result()) == pytest.approx(0.3 * 0.9 + 0.7)
+
+
+def test_error_codes_lower_their_components():
+    batch = score_batch([_result({"a": ErrorCode.TYPE | ErrorCode.INVALID, "c": ErrorCode.PATTERN})])
+    assert batch.column("validation")[0] == pytest.approx(0.5)
+    assert batch.column("data_type")[0] == pytest.approx(0.75)
+    assert batch.column("pattern_match")[0] == pytest.approx(0.75)
+
+
+def test_error_code_none_is_not_an_error():
+    assert score_result(_result({"a": ErrorCode.NONE})) == score_result(_result())
+
+
+def test_components_that_do_not_apply_carry_no_weight():
+    batch = score_batch([_result(required=())])
+    assert math.isnan(batch.column("field_presence")[0])
+    assert batch.scores[0] == pytest.approx((0.3 * 0.9 + 0.5) / 0.8)
+
+
+def test_batch_matches_the_stateful_scorer():
+    results = [_result(), _result({"b": ErrorCode.PATTERN}, ocr=0.5), _result(extracted=())]
+    scorer = ConfidenceScorer()
+    batch = score_batch(results)
+    assert list(batch.scores) == pytest.approx([scorer.calculate_score(result) for result in results])
+    assert list(batch.ranked()) == [0, 1, 2]
+    assert list(batch.below(0.6)) == [2]
@@ -0,0 +1,38 @@
+from utils.near_duplicates import NearDuplicateIndex, diff_results, minhash, reusable, similarity
+from utils.word_index import text_words
+
+BODY = "\n".join(f"Line item {n} widget assembly delivered to site {n * 7}" for n in range(40))
+INVOICE = f"ACME Corp\nInvoice Number: INV-001\nDate: 2024-01-31\n{BODY}\nTotal Amount: 108.00"
+RESULT = {"doc_type": "invoice", "fields": [
+    {"name": "Invoice Number", "value": "INV-001", "confidence": 0.9},
+    {"name": "Total Amount", "value": "108.00", "confidence": 0.9},
+]}
+
+
+def test_minhash_tracks_similarity():
+    footer = minhash(INVOICE + "\nPrinted 2024-02-01 10:32")
+    unrelated = minhash("Prescription for Jane Doe\nAmoxicillin 500mg three times daily")
+    assert similarity(minhash(INVOICE), minhash(INVOICE)) == 1.0
+    assert similarity(minhash(INVOICE), footer) > 0.85
+    assert similarity(minhash(INVOICE), unrelated) < 0.2
+    assert minhash("  ") is None
+
+
+def test_index_finds_resubmitted_documents(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.sqlite3"))
+    index.add("a.txt", minhash(INVOICE), RESULT)
+    match = index.query(minhash(INVOICE + "\nPrinted 2024-02-01"))
+    assert match["key"] == "a.txt"
+    assert match["result"] == RESULT
+    assert index.query(minhash("Completely different text about medication dosage schedules")) is None
+
+
+def test_reusable_only_when_every_value_is_still_present():
+    assert reusable(RESULT, [text_words(INVOICE)])
+    assert not reusable(RESULT, [text_words(INVOICE.replace("108.00", "108.01"))])
+    assert not reusable({"fields": []}, [text_words(INVOICE)])
+
+
+def test_diff_results_lists_changed_fields():
+    after = {"fields": [{"name": "Invoice Number", "value": "INV-001"}, {"name": "Total Amount", "value": "99.00"}]}
+    assert diff_results(RESULT, after) == [{"name": "Total Amount", "before": "108.00", "after": "99.00"}]
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from schemas.extraction_models import EXTRACTION_MODELS, LLMExtraction
+from utils.parsing import IncrementalFieldParser, parse_model, repair_json
+
+INVOICE = EXTRACTION_MODELS['invoice']
+
+
+def _response(fields, **extra):
+    return json.dumps({"doc_type": "invoice", "fields": fields, **extra})
+
+
+def test_valid_response_has_no_repairs():
+    result = parse_model(INVOICE, _response([{"name": "Total Amount", "value": "5.00", "confidence": 0.9}]))
+    assert result.repairs == []
+    assert "repairs" not in result.model_dump()
+
+
+def test_confidence_word_is_coerced_and_recorded():
+    result = parse_model(INVOICE, _response([
+        {"name": "Total Amount", "value": "5.00", "confidence": "high"},
+        {"name": "Date", "value": "2024-01-31", "confidence": "85%"},
+    ]))
+    assert [f.confidence for f in result.fields] == [0.9, 0.85]
+    assert len(result.repairs) == 2
+    assert "Total Amount" in result.repairs[0]
+
+
+def test_missing_confidence_defaults_to_zero():
+    result = parse_model(INVOICE, _response([{"name": "Total Amount", "value": "5.00"}]))
+    assert result.fields[0].confidence == 0.0
+
+
+def test_fields_object_is_converted_to_a_list():
+    result = parse_model(INVOICE, _response({
+        "Total Amount": "5.00",
+        "Date": {"value": "2024-01-31", "confidence": 0.8},
+    }))
+    assert {f.name: (f.value, f.confidence) for f in result.fields} == {
+        "Total Amount": ("5.00", 0.0), "Date": ("2024-01-31", 0.8),
+    }
+    assert result.repairs == ["fields object converted to a list"]
+
+
+def test_invalid_field_is_dropped_not_the_document():
+    result = parse_model(LLMExtraction, _response([
+        {"name": "Total Amount", "value": True, "confidence": 0.9},
+        {"name": "Date", "value": "2024-01-31", "confidence": 0.8},
+    ]))
+    assert [f.name for f in result.fields] == ["Date"]
+    assert result.repairs[0].startswith("dropped invalid field")
+
+
+def test_invalid_overall_confidence_is_dropped():
+    result = parse_model(INVOICE, _response([], overall_confidence="high"))
+    assert result.overall_confidence == 0.0
+    assert result.repairs == ["overall_confidence 'high' dropped"]
+
+
+def test_truncated_json_is_repaired():
+    raw = _response([{"name": "Total Amount", "value": "5.00", "confidence": 0.9},
+                     {"name": "Date", "value": "2024-01-31", "confidence": 0.8}])
+    result = parse_model(INVOICE, "```json\n" + raw[:raw.index("2024")])
+    assert [(f.name, f.value) for f in result.fields] == [("Total Amount", "5.00"), ("Date", None)]
+
+
+def test_non_object_response_is_rejected():
+    with pytest.raises(ValueError):
+        parse_model(INVOICE, "[1, 2]")
+
+
+def test_streamed_field_is_repaired_like_the_full_response():
+    field = INVOICE.parse_field({"name": "total_amount", "value": 5, "confidence": "low"})
+    assert (field.name, field.value, field.confidence) == ("Total Amount", "5", 0.3)
+
+
+STREAMED = _response([
+    {"name": "Invoice Number", "value": "INV-{1}", "confidence": 0.9},
+    {"name": "total amount", "value": "5.00 \\\"net\\\"", "confidence": 0.8},
+])
+
+
+def _feed(parser, chunks):
+    return [field for chunk in chunks for field in parser.feed(chunk)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(STREAMED)])
+def test_incremental_parser_on_split_deltas(size):
+    parser = IncrementalFieldParser()
+    fields = _feed(parser, [STREAMED[i:i + size] for i in range(0, len(STREAMED), size)])
+    assert fields == json.loads(STREAMED)["fields"]
+    assert parser.result() == json.loads(STREAMED)
+
+
+def test_incremental_parser_reports_each_field_once_complete():
+    parser = IncrementalFieldParser()
+    cut = STREAMED.index("}, {") + 1
+    assert parser.feed(STREAMED[:cut - 1]) == []
+    assert [f["name"] for f in parser.feed(STREAMED[cut - 1:cut])] == ["Invoice Number"]
+    assert [f["name"] for f in parser.feed(STREAMED[cut:])] == ["total amount"]
+
+
+def test_incremental_parser_normalizes_with_the_response_model():
+    parser = IncrementalFieldParser(model=INVOICE)
+    raw = _response([{"name": "total_amount", "value": 5, "confidence": 80},
+                     {"name": "Unknown", "value": "x", "confidence": 1.0}])
+    assert _feed(parser, [raw[i:i + 5] for i in range(0, len(raw), 5)]) == [
+        {"name": "Total Amount", "value": "5", "confidence": 0.8},
+    ]
+
+
+def test_incremental_parser_ignores_nested_arrays_of_other_keys():
+    parser = IncrementalFieldParser()
+    raw = json.dumps({"notes": [{"name": "x"}], "fields": [{"name": "Date", "value": "2024-01-31"}]})
+    assert _feed(parser, [raw[i:i + 4] for i in range(0, len(raw), 4)]) == [{"name": "Date", "value": "2024-01-31"}]
+
+
+def test_repair_json_closes_truncated_strings_and_drops_trailing_commas():
+    assert json.loads(repair_json('{"a": [1, 2,], "b": "x')) == {"a": [1, 2]}
+    assert json.loads(repair_json('Sure! {"a": "x y')) == {"a": "x y"}
@@ -0,0 +1,47 @@
+import gzip
+import json
+
+import pytest
+
+from utils.sinks import JsonlSink, open_sink
+
+
+def _records(n):
+    return [{"path": f"doc{i}.txt", "status": "success", "result": {"fields": []}} for i in range(n)]
+
+
+def test_jsonl_sink_writes_every_record(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with open_sink(path, flush_interval=None) as sink:
+        for record in _records(5):
+            sink.write(record)
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == _records(5)
+
+
+def test_gzip_sink_is_readable_while_open(tmp_path):
+    path = str(tmp_path / "out.jsonl.gz")
+    sink = open_sink(path, flush_interval=None)
+    sink.write(_records(1)[0])
+    sink.flush()
+    with gzip.open(path, "rt") as f:
+        assert json.loads(f.readline()) == _records(1)[0]
+    sink.close()
+
+
+def test_sink_rotates_parts_by_size(tmp_path):
+    path = str(tmp_path / "out.jsonl.gz")
+    with open_sink(path, max_bytes=1, flush_interval=None, buffer_records=2) as sink:
+        for record in _records(5):
+            sink.write(record)
+    assert [p.rsplit("/", 1)[1] for p in sink.files] == [f"out-{n:05d}.jsonl.gz" for n in range(3)]
+    records = []
+    for part in sink.files:
+        with gzip.open(part, "rt") as f:
+            records.extend(json.loads(line) for line in f)
+    assert records == _records(5)
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        JsonlSink(str(tmp_path / "out.jsonl"), compression="lz4", flush_interval=None)
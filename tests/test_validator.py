@@ -0,0 +1,78 @@
+import pytest
+
+from validator import (
+    ErrorCode, RULE_SETS, _totals_balance, error_codes, validate_date, validate_name, validate_organization_name,
+    validate_output,
+)
+
+
+def _invoice(**values):
+    return {
+        "doc_type": "invoice",
+        "fields": [{"name": name, "value": value, "confidence": 1.0} for name, value in values.items()],
+        "overall_confidence": 1.0,
+    }
+
+
+@pytest.mark.parametrize("total, subtotal, tax", [
+    ("108.00", "100.00", "8.00"),
+    ("$1,080.01", "1,000.00", "80.00"),
+    ("108.01", "100.00", "8.00"),
+])
+def test_totals_balance_within_a_cent(total, subtotal, tax):
+    assert _totals_balance(total, subtotal, tax) is None
+
+
+@pytest.mark.parametrize("total, subtotal, tax", [
+    ("108.02", "100.00", "8.00"),
+    ("100.00", "100.00", "8.00"),
+])
+def test_totals_balance_outside_a_cent(total, subtotal, tax):
+    assert _totals_balance(total, subtotal, tax).startswith("total ")
+
+
+def test_totals_balance_unparseable():
+    assert _totals_balance("n/a", "100.00", "8.00") == "totals could not be parsed"
+
+
+def test_cross_field_failure_penalizes_blamed_field():
+    result = validate_output(_invoice(**{"Subtotal": "100.00", "Tax Amount": "8.00", "Total Amount": "120.00"}))
+    confidences = {field["name"]: field["confidence"] for field in result["fields"]}
+    assert confidences == {"Subtotal": 1.0, "Tax Amount": 1.0, "Total Amount": pytest.approx(0.7)}
+    assert result["qa"]["failed_rules"] == ["totals_balance"]
+    assert result["overall_confidence"] == pytest.approx(0.9)
+
+
+def test_error_codes_blame_cross_field_failures():
+    codes = RULE_SETS["invoice"].error_codes(["totals_balance", "tax_within_total"])
+    assert codes == {"Total Amount": ErrorCode.INVALID, "Tax Amount": ErrorCode.INVALID}
+
+
+def test_error_codes_combine_field_and_cross_field_failures():
+    result = validate_output(_invoice(**{"Subtotal": "100.00", "Tax Amount": "8.00", "Total Amount": "lots"}))
+    assert error_codes(result)["Total Amount"] == ErrorCode.TYPE | ErrorCode.INVALID
+
+
+def test_error_codes_ignore_unknown_rules():
+    assert RULE_SETS["invoice"].error_codes(["no_such_rule", "no_such_rule:Date"]) == {}
+
+
+def test_passing_result_has_no_error_codes():
+    result = validate_output(_invoice(**{"Invoice Number": "INV-001", "Date": "2024/01/31"}))
+    assert result["qa"]["failed_rules"] == []
+    assert error_codes(result) == {}
+
+
+@pytest.mark.parametrize("value, valid", [
+    ("2024-01-31", True), ("2024/01/31", True), ("31/01/2024", True), ("31 Jan 2024", True),
+    ("January 31, 2024", True), ("2024-13-01", False), ("2024-01/31", False), ("soon", False),
+])
+def test_validate_date(value, valid):
+    assert validate_date(value) is valid
+
+
+def test_organization_names_may_contain_digits():
+    assert validate_organization_name("3M Company")
+    assert validate_organization_name("24/7 Care Clinic")
+    assert not validate_organization_name("12345")
+    assert not validate_name("3M Company")
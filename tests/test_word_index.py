@@ -0,0 +1,40 @@
+from utils.word_index import WordIndex, locate_fields, text_words
+
+PAGES = [
+    text_words("ACME Corp\nInvoice Number: INV-001\nDate: 31 Jan 2024"),
+    text_words("Subtotal 12,000.00\nTotal Amount: $12,345.67\nVendor: Acme Corporatoin"),
+]
+
+
+def _page(value, fuzzy=True):
+    span = WordIndex(PAGES).find([("field", value)], fuzzy=fuzzy)[0]
+    return None if span is None else WordIndex(PAGES).pages[span[0]]
+
+
+def test_exact_values_are_found_on_their_page():
+    assert _page("INV-001") == 1
+    assert _page("ACME Corp") == 1
+
+
+def test_amounts_and_dates_are_found_by_value():
+    assert _page("12345.67") == 2
+    assert _page("2024-01-31") == 1
+
+
+def test_changed_amounts_are_not_matched_by_value():
+    assert _page("12345.68", fuzzy=False) is None
+    assert _page("2024-02-01", fuzzy=False) is None
+
+
+def test_fuzzy_matching_is_optional():
+    assert _page("Acme Corporation") == 2
+    assert _page("Acme Corporation", fuzzy=False) is None
+
+
+def test_locate_fields_fills_sources_and_keeps_unlocated_ones():
+    result = {"fields": [{"name": "Total Amount", "value": "$12,345.67"}, {"name": "Tax Amount", "value": "9.99"}]}
+    located, count = locate_fields(result, PAGES)
+    assert count == 1
+    assert located["fields"][0]["source"]["page"] == 2
+    assert any(located["fields"][0]["source"]["bbox"])
+    assert "source" not in located["fields"][1]
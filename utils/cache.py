@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL_SECONDS
+from utils.tracing import increment
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so cosmetic re-extractions map to the same key."""
+    return " ".join(text.split())
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash an ordered tuple of JSON-serializable parts into a cache key."""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent content-addressed cache for LLM responses.
+
+    Entries live in a single SQLite file and are evicted when they are older
+    than ``ttl`` seconds or, least recently used first, when the stored
+    payloads exceed ``max_bytes``. The cache can be shared by threads and
+    by worker processes; each process opens its own connection.
+    """
+
+    def __init__(self, path: str, max_bytes: int = CACHE_MAX_BYTES, ttl: Optional[float] = CACHE_TTL_SECONDS):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite file to store entries in (created if missing)
+            max_bytes: Upper bound on the total size of cached values
+            ttl: Seconds after which an entry expires, or None to keep forever
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so reopen in each new process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for ``key``, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                increment("cache_requests", result="miss")
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            increment("cache_requests", result="hit")
+            return row[0]
+
+    def set(self, key: str, value: str):
+        """Store ``value`` under ``key`` and evict entries if over budget."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            conn.commit()
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        # Trim to 90% of the budget so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        if total > target:
+            excess = total - target
+            freed = 0
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                stale.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+            total -= freed
+        conn.commit()
+        self._bytes = total
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size of the cache."""
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'bytes': self._bytes,
+            }
+
+
+_result_cache = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Return the shared result cache, or None when caching is disabled."""
+    global _result_cache
+    if not CACHE_DIR:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(os.path.join(CACHE_DIR, "results.sqlite3"))
+    return _result_cache
@@ -0,0 +1,110 @@
+import re
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+# Extra phrases that indicate where a field's value is likely to be found
+FIELD_SYNONYMS = {
+    'total': ['total', 'amount due', 'balance due', 'grand total', 'amount payable', 'net payable'],
+    'amount': ['amount', 'total', 'balance', 'due'],
+    'tax': ['tax', 'vat', 'gst', 'hst'],
+    'date': ['date', 'dated', 'issued'],
+    'number': ['number', 'no', '#', 'ref'],
+    'vendor': ['vendor', 'from', 'supplier', 'seller', 'ltd', 'inc', 'llc', 'gmbh'],
+    'hospital': ['hospital', 'clinic', 'medical center', 'health'],
+    'insurance': ['insurance', 'insurer', 'payer', 'policy', 'claim'],
+    'patient': ['patient', 'name'],
+    'doctor': ['doctor', 'dr', 'physician', 'md'],
+    'medications': ['mg', 'tablet', 'capsule', 'sig', 'rx', 'dose'],
+}
+
+_AMOUNT = re.compile(r'\d[\d,]*\.\d{2}\b')
+_DATE = re.compile(r'\b\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}\b|\b\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4}\b')
+_BLOCK_SEPARATOR = re.compile(r'\f|\n\s*\n')
+
+
+def split_chunks(text: str, max_chars: int = 3000) -> List[str]:
+    """
+    Split text into chunks of at most ``max_chars`` characters.
+
+    Text is cut at page breaks (form feeds) and blank lines, which
+    separate pages and sections in extracted text; consecutive blocks are
+    packed together until the next one would not fit. Blocks that are
+    longer than a chunk are cut at line boundaries.
+    """
+    blocks = []
+    for block in _BLOCK_SEPARATOR.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        while len(block) > max_chars:
+            cut = block.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            blocks.append(block[:cut].strip())
+            block = block[cut:].strip()
+        if block:
+            blocks.append(block)
+
+    chunks: List[str] = []
+    current = ""
+    for block in blocks:
+        if current and len(current) + 2 + len(block) > max_chars:
+            chunks.append(current)
+            current = block
+        else:
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@lru_cache(maxsize=64)
+def _field_patterns(fields: Tuple[str, ...]) -> List[Tuple[re.Pattern, bool, bool]]:
+    patterns = []
+    for field in fields:
+        words = re.findall(r'[a-z]+', field.lower())
+        keywords = set(words)
+        for word in words:
+            keywords.update(FIELD_SYNONYMS.get(word, []))
+        alternation = "|".join(sorted((re.escape(k) for k in keywords), key=len, reverse=True))
+        patterns.append((
+            re.compile(rf'(?<![a-z])(?:{alternation})(?![a-z])', re.IGNORECASE),
+            any(w in ('amount', 'total', 'tax') for w in words),
+            'date' in words,
+        ))
+    return patterns
+
+
+def score_chunk(chunk: str, fields: Sequence[str]) -> float:
+    """
+    Score how likely a chunk is to contain the requested fields.
+
+    Each field whose label or synonym appears in the chunk adds one point,
+    plus half a point when a value of the expected shape (an amount or a
+    date) is present as well, so chunks covering many fields rank highest.
+    """
+    has_amount = _AMOUNT.search(chunk) is not None
+    has_date = _DATE.search(chunk) is not None
+    score = 0.0
+    for pattern, wants_amount, wants_date in _field_patterns(tuple(fields)):
+        if pattern.search(chunk):
+            score += 1.0
+            if (wants_amount and has_amount) or (wants_date and has_date):
+                score += 0.5
+    return score
+
+
+def select_chunks(text: str, fields: Sequence[str], max_chunks: int = 3, max_chars: int = 3000) -> List[str]:
+    """
+    Pick the chunks most relevant to ``fields``, in document order.
+
+    The first chunk is always kept because document headers carry
+    identifiers, parties and dates; the remaining slots go to the
+    highest-scoring chunks. Token spend is bounded by
+    ``max_chunks * max_chars`` regardless of document length.
+    """
+    chunks = split_chunks(text, max_chars)
+    if len(chunks) <= max_chunks:
+        return chunks
+    ranked = sorted(range(1, len(chunks)), key=lambda i: score_chunk(chunks[i], fields), reverse=True)
+    keep = sorted([0] + ranked[:max_chunks - 1])
+    return [chunks[i] for i in keep]
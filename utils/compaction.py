@@ -0,0 +1,126 @@
+import math
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Boilerplate that carries no extractable information. Patterns stop at the
+# end of their line: page text rarely has blank lines, so a block match would
+# swallow the rest of the page.
+BOILERPLATE_PATTERNS = [
+    r'this is a (?:computer|system)[- ]generated (?:invoice|document|bill|receipt)[^\n]*',
+    r'(?:this document )?does not require (?:a )?signature[^\n]*',
+    r'page\s+\d+\s*(?:of|/)\s*\d+',
+    r'thank you for (?:your business|choosing us|your order)[^\n]*',
+    r'all rights reserved[^\n]*',
+    r'\be\.?\s*&\s*o\.?\s*e\b\.?',
+    r'please (?:retain|keep) this (?:copy|receipt|document)[^\n]*',
+    r'(?:confidentiality|privacy) notice:?[^\n]*',
+    r'terms (?:and|&) conditions:?[^\n]*',
+    r'subject to [a-z ]+ jurisdiction[^\n]*',
+]
+
+# Lines of a page's top and bottom where running headers and footers sit
+EDGE_LINES = 2
+
+_BOILERPLATE = re.compile("|".join(f"(?:{p})" for p in BOILERPLATE_PATTERNS), re.IGNORECASE)
+_LEADERS = re.compile(r'(?:[ \t]*[.·_=\-]){4,}[ \t]*')
+_SPACES = re.compile(r'[ \t\u00a0\u2000-\u200b]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+_AMOUNT = re.compile(r'\d[\d,]*\.\d{2}\b')
+_DIGITS = re.compile(r'\d+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def _line_key(line: str, edge: bool) -> str:
+    # Page numbers and dates vary between repeated headers and footers, so
+    # digits are masked in the first and last EDGE_LINES lines of a page.
+    # Body lines, and lines holding amounts, only count as repeats when
+    # identical, so rows differing in a date, ID or subtotal are never dropped.
+    key = line.strip().lower()
+    if not edge or _AMOUNT.search(key):
+        return key
+    masked = _DIGITS.sub("#", key)
+    # Masked keys never collide with the exact key of another line
+    return masked if masked == key else "\0" + masked
+
+
+def _line_keys(lines: Sequence[str]) -> List[str]:
+    """Repeat keys of a page's lines."""
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+    return [_line_key(line, i in edges) for i, line in enumerate(lines)]
+
+
+def _clean(text: str) -> str:
+    text = _LEADERS.sub(" ", text)
+    text = _SPACES.sub(" ", text)
+    return "\n".join(line.strip() for line in text.split("\n"))
+
+
+def compact_pages(pages: Sequence[str], min_repeat_ratio: float = 0.5) -> Tuple[str, Dict[str, Any]]:
+    """
+    Strip layout noise from page texts before they are sent to an LLM.
+
+    Whitespace runs and dotted/dashed leader lines are collapsed, known
+    boilerplate blocks are removed, and lines that repeat on at least
+    ``min_repeat_ratio`` of the pages (running headers, footers, table
+    headings) are kept only where they first appear. Lines at the top or
+    bottom of a page repeat when they match up to their digits; anywhere
+    else they must match exactly.
+
+    Args:
+        pages: Text of each page, in order
+        min_repeat_ratio: Fraction of pages a line must appear on to count
+            as a running header or footer (only used for 2+ pages)
+
+    Returns:
+        Tuple of (compacted text, stats) where stats reports characters and
+        estimated tokens before and after compaction
+    """
+    original = "\n\n".join(pages)
+    cleaned = [_BOILERPLATE.sub("", _clean(page)) for page in pages]
+    lines_per_page = [page.split("\n") for page in cleaned]
+    keys_per_page = [_line_keys(lines) for lines in lines_per_page]
+
+    repeated = set()
+    if len(pages) >= 2:
+        page_counts: Dict[str, int] = {}
+        for lines, keys in zip(lines_per_page, keys_per_page):
+            for key in {key for line, key in zip(lines, keys) if len(line) > 2}:
+                page_counts[key] = page_counts.get(key, 0) + 1
+        threshold = max(2, math.ceil(min_repeat_ratio * len(pages)))
+        repeated = {key for key, count in page_counts.items() if count >= threshold}
+
+    seen = set()
+    removed_lines = 0
+    kept_pages = []
+    for lines, keys in zip(lines_per_page, keys_per_page):
+        kept = []
+        for line, key in zip(lines, keys):
+            if key in repeated:
+                if key in seen:
+                    removed_lines += 1
+                    continue
+                seen.add(key)
+            kept.append(line)
+        kept_pages.append("\n".join(kept).strip())
+
+    text = _BLANK_LINES.sub("\n\n", "\n\n".join(page for page in kept_pages if page)).strip()
+    stats = {
+        'chars_before': len(original),
+        'chars_after': len(text),
+        'chars_saved': len(original) - len(text),
+        'tokens_before': estimate_tokens(original),
+        'tokens_after': estimate_tokens(text),
+        'tokens_saved': estimate_tokens(original) - estimate_tokens(text),
+        'repeated_lines_removed': removed_lines,
+    }
+    return text, stats
+
+
+def compact_text(text: str, min_repeat_ratio: float = 0.5) -> Tuple[str, Dict[str, Any]]:
+    """Compact a single text; form feeds, if present, are treated as page breaks."""
+    return compact_pages(text.split("\f"), min_repeat_ratio)
@@ -1,18 +1,30 @@
 import os
-from groq import Groq
-import streamlit as st
+import sys
+import threading
 
 _groq_client = None
+_lock = threading.Lock()
+
+def _secrets_api_key():
+    # Only the Streamlit app has secrets; headless runs must not import streamlit
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        return st.secrets.get("GROQ_API_KEY")
+    except Exception:  # no secrets.toml
+        return None
 
 def get_groq_client():
+    """Return the shared Groq client, creating it (and importing groq) on first use."""
     global _groq_client
     if _groq_client is None:
-        api_key = (
-            st.secrets.get("GROQ_API_KEY")
-            if hasattr(st, "secrets") and "GROQ_API_KEY" in st.secrets
-            else os.getenv("GROQ_API_KEY")
-        )
-        if not api_key:
-            raise RuntimeError("GROQ_API_KEY not set. Add to Streamlit Secrets or environment.")
-        _groq_client = Groq(api_key=api_key)
+        with _lock:
+            if _groq_client is None:
+                from groq import Groq
+
+                api_key = _secrets_api_key() or os.getenv("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GROQ_API_KEY not set. Add to Streamlit Secrets or environment.")
+                _groq_client = Groq(api_key=api_key)
     return _groq_client
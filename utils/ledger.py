@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Document states; 'running' after a crash means the run died mid-document
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+
+def document_fingerprint(path: str, mode: str) -> str:
+    """Identify a document version; ledger entries with another fingerprint start over."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{mode}"
+
+
+def retry_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter before retrying after ``attempt`` failed attempts."""
+    return min(cap, base * 2 ** (attempt - 1)) + random.uniform(0, base)
+
+
+class StageCheckpoints:
+    """
+    Saved stage outputs of one document.
+
+    The pipeline calls load(stage) before running a stage and save(stage,
+    value) after it completes; values must be JSON-serializable.
+    """
+
+    def __init__(self, ledger: "JobLedger", path: str):
+        self._ledger = ledger
+        self._path = path
+        self._saved = ledger.stage_outputs(path)
+
+    def load(self, stage: str) -> Optional[Any]:
+        return self._saved.get(stage)
+
+    def save(self, stage: str, value: Any):
+        self._saved[stage] = value
+        self._ledger.save_stage(self._path, stage, value)
+
+
+class JobLedger:
+    """
+    Persistent record of every document a batch run has touched.
+
+    Each document has a state, an attempt count, its last error and, once
+    done, its result record; stage outputs are checkpointed as they
+    complete, so an interrupted or failed document resumes after its last
+    completed stage. Like ResultCache, the ledger is a single SQLite file
+    shared by threads and worker processes, each process opening its own
+    connection.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the ledger.
+
+        Args:
+            path: SQLite file to store the ledger in (created if missing)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so reopen in each new process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "path TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, record TEXT, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "path TEXT NOT NULL, stage TEXT NOT NULL, output TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (path, stage))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_status ON documents (status)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def completed(self, path: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return the stored result record if this version of the document is done."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT record FROM documents WHERE path = ? AND fingerprint = ? AND status = ?",
+                (path, fingerprint, DONE),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def start(self, path: str, fingerprint: str) -> int:
+        """
+        Mark a document as running and count the attempt.
+
+        Checkpoints and attempts left from a different version of the
+        document are discarded.
+
+        Returns:
+            The attempt number, starting at 1
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT fingerprint, attempts FROM documents WHERE path = ?", (path,)).fetchone()
+            attempts = 1
+            if row is not None and row[0] == fingerprint:
+                attempts = row[1] + 1
+            elif row is not None:
+                conn.execute("DELETE FROM stages WHERE path = ?", (path,))
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (path, fingerprint, status, attempts, error, record, updated) "
+                "VALUES (?, ?, ?, ?, NULL, NULL, ?)",
+                (path, fingerprint, RUNNING, attempts, now),
+            )
+            conn.commit()
+        return attempts
+
+    def stage_outputs(self, path: str) -> Dict[str, Any]:
+        """Checkpointed outputs of the document's completed stages."""
+        with self._lock:
+            rows = self._connect().execute("SELECT stage, output FROM stages WHERE path = ?", (path,)).fetchall()
+        return {stage: json.loads(output) for stage, output in rows}
+
+    def save_stage(self, path: str, stage: str, value: Any):
+        output = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO stages (path, stage, output, created) VALUES (?, ?, ?, ?)",
+                (path, stage, output, time.time()),
+            )
+            conn.commit()
+
+    def checkpoints(self, path: str) -> StageCheckpoints:
+        """Checkpoints to pass to pipeline.process_document for ``path``."""
+        return StageCheckpoints(self, path)
+
+    def finish(self, path: str, record: Dict[str, Any]):
+        """Store the outcome of an attempt: the record when it succeeded, else its error."""
+        status = DONE if record.get('status') == 'success' else FAILED
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE documents SET status = ?, error = ?, record = ?, updated = ? WHERE path = ?",
+                (status, record.get('error'), json.dumps(record) if status == DONE else None, time.time(), path),
+            )
+            conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Number of documents in each state."""
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()
+        return dict(rows)
+
+
+_ledgers: Dict[str, JobLedger] = {}
+
+
+def open_ledger(path: str) -> JobLedger:
+    """Return this process's ledger for ``path``, opening it on first use."""
+    ledger = _ledgers.get(path)
+    if ledger is None:
+        ledger = _ledgers.setdefault(path, JobLedger(path))
+    return ledger
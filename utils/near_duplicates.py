@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import NEAR_DUPLICATE_THRESHOLD
+from utils.tracing import increment
+from utils.word_index import WordIndex
+
+# MinHash permutations, split into LSH bands of NUM_PERM // BANDS rows. With
+# 16 bands of 8 rows, documents with a Jaccard similarity of 0.8 share a
+# band 95% of the time and those at 0.5 only 6% of the time.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Words per shingle
+SHINGLE_WORDS = 3
+# Band entries buffered in a dict before they are merged into the sorted arrays
+MERGE_ENTRIES = 1 << 16
+# Candidates verified against their full signature, most shared bands first
+MAX_CANDIDATES = 64
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+# Fixed seed: signatures and band keys are persisted and must stay comparable
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_BAND_MULTIPLIERS = _rng.integers(1, 1 << 63, size=ROWS, dtype=np.uint64) | np.uint64(1)
+_BAND_OFFSETS = _rng.integers(0, 1 << 63, size=BANDS, dtype=np.uint64)
+_WORD = re.compile(r'\w+')
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Distinct 32-bit hashes of the text's overlapping word shingles."""
+    words = _WORD.findall(text.casefold())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.unique(np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                                 dtype=np.uint64, count=len(shingles)))
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32 values) of the text, or None if it has no words."""
+    hashes = shingle_hashes(text)
+    if not hashes.size:
+        return None
+    signature = np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint64)
+    # In blocks so long documents do not allocate one huge matrix; products wrap modulo 2**64
+    for start in range(0, hashes.size, 2048):
+        block = hashes[start:start + 2048, None]
+        values = ((block * _A + _B) % _MERSENNE) & np.uint64(0xFFFFFFFF)
+        np.minimum(signature, values.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """LSH keys of one signature (BANDS keys) or of a 2-D array of signatures (N x BANDS)."""
+    rows = signatures.astype(np.uint64).reshape(signatures.shape[:-1] + (BANDS, ROWS))
+    return (rows * _BAND_MULTIPLIERS).sum(axis=-1, dtype=np.uint64) + _BAND_OFFSETS
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity estimated from two MinHash signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def reusable(result: Dict[str, Any], pages: Sequence[Sequence[Dict[str, Any]]]) -> bool:
+    """
+    Whether a prior result still holds for a document.
+
+    Every value must be found exactly or, for amounts and dates, by value,
+    never fuzzily: a total that changed by a cent or a date moved by a day
+    must be extracted again. Values located in the prior document must
+    also be found on the same page.
+    """
+    fields = [field for field in result.get('fields') or [] if field.get('value') not in (None, "")]
+    if not fields:
+        return False
+    index = WordIndex(pages)
+    spans = index.find([(field['name'], field['value']) for field in fields], fuzzy=False)
+    for field, span in zip(fields, spans):
+        if span is None:
+            return False
+        source = field.get('source') or {}
+        if source.get('bbox') and any(source['bbox']) and index.pages[span[0]] != source.get('page'):
+            return False
+    return True
+
+
+def diff_results(before: Dict[str, Any], after: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Fields whose value differs between two results, with the value in each."""
+    old = {field['name']: field.get('value') for field in before.get('fields') or []}
+    new = {field['name']: field.get('value') for field in after.get('fields') or []}
+    return [
+        {'name': name, 'before': old.get(name), 'after': new.get(name)}
+        for name in dict.fromkeys(list(old) + list(new)) if old.get(name) != new.get(name)
+    ]
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of processed documents, for recognising resubmissions.
+
+    Each document's text is reduced to a MinHash signature of its word
+    shingles, so a re-scan, a re-saved PDF or a changed timestamp footer
+    still lands close to the original. The LSH band keys are held in
+    memory as one sorted array (plus a small dict of recent additions),
+    about 200 bytes per document, so a lookup is a handful of binary
+    searches however many documents are indexed. Signatures and prior
+    results stay in a SQLite file next to them; like JobLedger it is shared
+    by threads and worker processes, and documents added by another
+    process are picked up on the next lookup.
+    """
+
+    def __init__(self, path: str, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        """
+        Initialize the index.
+
+        Args:
+            path: SQLite file to persist documents in (created if missing)
+            threshold: Estimated Jaccard similarity at which two documents
+                count as near-duplicates
+        """
+        self.path = path
+        self.threshold = threshold
+        self.lookups = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._loaded_id = 0
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._pending: Dict[int, List[int]] = {}
+        self._pending_entries = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so reopen in each new process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, signature BLOB NOT NULL, "
+                "bands BLOB NOT NULL, result TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _sync(self, conn: sqlite3.Connection):
+        # Load band keys of documents added since the last lookup, by any process
+        cursor = conn.execute("SELECT id, bands FROM documents WHERE id > ? ORDER BY id", (self._loaded_id,))
+        while True:
+            rows = cursor.fetchmany(100000)
+            if not rows:
+                break
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            keys = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.uint64)
+            self._insert(np.repeat(ids, BANDS), keys)
+            self._loaded_id = int(ids[-1])
+
+    def _insert(self, ids: np.ndarray, keys: np.ndarray):
+        if keys.size >= MERGE_ENTRIES:
+            self._merge(ids, keys)
+            return
+        for key, doc_id in zip(keys.tolist(), ids.tolist()):
+            self._pending.setdefault(key, []).append(doc_id)
+        self._pending_entries += keys.size
+        if self._pending_entries >= MERGE_ENTRIES:
+            pending_keys = np.fromiter((key for key, ids in self._pending.items() for _ in ids),
+                                       dtype=np.uint64, count=self._pending_entries)
+            pending_ids = np.fromiter((doc_id for ids in self._pending.values() for doc_id in ids),
+                                      dtype=np.int64, count=self._pending_entries)
+            self._pending, self._pending_entries = {}, 0
+            self._merge(pending_ids, pending_keys)
+
+    def _merge(self, ids: np.ndarray, keys: np.ndarray):
+        keys = np.concatenate([self._keys, keys])
+        ids = np.concatenate([self._ids, ids])
+        order = np.argsort(keys, kind='stable')
+        self._keys, self._ids = keys[order], ids[order]
+
+    def _candidates(self, keys: np.ndarray) -> List[int]:
+        counts: Dict[int, int] = {}
+        if self._keys.size:
+            starts = np.searchsorted(self._keys, keys, side='left')
+            ends = np.searchsorted(self._keys, keys, side='right')
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                for doc_id in self._ids[start:end].tolist():
+                    counts[doc_id] = counts.get(doc_id, 0) + 1
+        for key in keys.tolist():
+            for doc_id in self._pending.get(key, ()):
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:MAX_CANDIDATES]
+
+    def query(self, signature: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Find the indexed document most similar to ``signature``.
+
+        Returns:
+            Dict with the document's 'id', 'key', estimated 'similarity' and
+            stored 'result', or None when no document reaches the threshold
+        """
+        with self._lock:
+            conn = self._connect()
+            self._sync(conn)
+            candidates = self._candidates(band_keys(signature))
+            rows = []
+            if candidates:
+                rows = conn.execute(
+                    f"SELECT id, key, signature FROM documents WHERE id IN ({','.join('?' * len(candidates))})",
+                    candidates,
+                ).fetchall()
+            self.lookups += 1
+        best, best_similarity = None, 0.0
+        for doc_id, key, stored in rows:
+            score = similarity(signature, np.frombuffer(stored, dtype=np.uint32))
+            if score > best_similarity:
+                best, best_similarity = (doc_id, key), score
+        if best is None or best_similarity < self.threshold:
+            increment("near_duplicate_lookups", result="miss")
+            return None
+
+        with self._lock:
+            result = self._connect().execute("SELECT result FROM documents WHERE id = ?", (best[0],)).fetchone()[0]
+            self.duplicates += 1
+        increment("near_duplicate_lookups", result="duplicate")
+        return {'id': best[0], 'key': best[1], 'similarity': round(best_similarity, 3), 'result': json.loads(result)}
+
+    def add(self, key: str, signature: np.ndarray, result: Dict[str, Any]) -> int:
+        """Index a processed document under ``key`` (its path) together with its result."""
+        with self._lock:
+            conn = self._connect()
+            doc_id = conn.execute(
+                "INSERT INTO documents (key, signature, bands, result, created) VALUES (?, ?, ?, ?, ?)",
+                (key, signature.astype(np.uint32).tobytes(), band_keys(signature).tobytes(),
+                 json.dumps(result, ensure_ascii=False), time.time()),
+            ).lastrowid
+            conn.commit()
+        return doc_id
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync(self._connect())
+            return self._ids.size // BANDS + self._pending_entries // BANDS
+
+    def stats(self) -> Dict[str, Any]:
+        """Return lookup counters and the number of indexed documents."""
+        documents = len(self)
+        with self._lock:
+            return {
+                'documents': documents,
+                'lookups': self.lookups,
+                'duplicates': self.duplicates,
+                'duplicate_rate': self.duplicates / self.lookups if self.lookups else 0.0,
+            }
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+
+
+def open_near_duplicate_index(path: str) -> NearDuplicateIndex:
+    """Return this process's near-duplicate index for ``path``, opening it on first use."""
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes.setdefault(path, NearDuplicateIndex(path))
+    return index
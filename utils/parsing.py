@@ -1,5 +1,13 @@
 import json
-from typing import Any, Dict
+import re
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+_CODE_FENCE = re.compile(r'^\s*```[a-zA-Z]*\s*|\s*```\s*$')
+_CLOSERS = {"{": "}", "[": "]"}
 
 def parse_json_safely(text: str) -> Dict[str, Any]:
     try:
@@ -13,3 +21,170 @@ def parse_json_safely(text: str) -> Dict[str, Any]:
         except Exception:
             pass
     return {"raw": text}
+
+
+def repair_json(text: str) -> str:
+    """
+    Apply cheap, local fixes to a malformed JSON object.
+
+    Markdown code fences and any prose around the first top-level object
+    are dropped, trailing commas are removed, and a truncated response is
+    cut back to its last complete value before the open strings, arrays
+    and objects are closed. The result is not guaranteed to be valid JSON.
+    """
+    text = _CODE_FENCE.sub("", text)
+    start = text.find("{")
+    if start == -1:
+        return text
+
+    out = []
+    stack = ""
+    in_string = escape = False
+    last_comma = None  # (output length, open containers) at the last comma
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack += ch
+        elif ch in "}]":
+            if out and out[-1] == ",":
+                out.pop()
+            stack = stack[:-1]
+            if not stack:
+                out.append(ch)
+                return "".join(out)
+        elif ch == ",":
+            last_comma = (len(out), stack)
+        elif ch.isspace():
+            continue
+        out.append(ch)
+
+    # Truncated: everything before the last comma is a complete value
+    if last_comma is not None:
+        del out[last_comma[0]:]
+        stack = last_comma[1]
+    elif in_string:
+        out.append('"')
+    return "".join(out) + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def parse_model(model: Type[ModelT], raw: str) -> ModelT:
+    """
+    Parse an LLM response straight into a Pydantic model.
+
+    The response is validated with a single ``model_validate_json`` call.
+    Only when that fails is it repaired locally and validated once more,
+    so malformed output costs a local fix rather than another LLM request:
+    invalid JSON goes through repair_json, and models with a ``repair``
+    classmethod (see LLMExtraction.repair) coerce or drop the values that
+    break their schema.
+
+    Args:
+        model: Pydantic model class describing the response
+        raw: Raw response text
+
+    Returns:
+        Validated model instance
+
+    Raises:
+        ValueError: If the response does not match the model even after repair
+    """
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        text = repair_json(raw) if any(error["type"] == "json_invalid" for error in e.errors()) else raw
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Unrepairable {model.__name__} response: {e}") from None
+    repair = getattr(model, "repair", None)
+    try:
+        return model.model_validate(repair(data) if repair else data)
+    except ValidationError as e:
+        raise ValueError(f"Unrepairable {model.__name__} response: {e}") from None
+
+
+class IncrementalFieldParser:
+    """
+    Incrementally parses a streamed extraction response.
+
+    Feed completion chunks as they arrive; every object in the top-level
+    "fields" array is returned by ``feed`` as soon as its closing brace has
+    been received, without waiting for the rest of the document. With a
+    response model (an LLMExtraction class) each object is validated by
+    its ``parse_field`` first, so streamed fields carry the same canonical
+    names and coerced values as the final result, and fields it would
+    drop are never returned.
+    """
+
+    def __init__(self, array_key: str = "fields", model: Optional[Type[BaseModel]] = None):
+        self.array_key = array_key
+        self.model = model
+        self.buffer = ""
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+        self._array_depth = None
+        self._item_start = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk and return the fields completed by it."""
+        completed = []
+        offset = len(self.buffer)
+        self.buffer += chunk
+        for i in range(offset, len(self.buffer)):
+            ch = self.buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = self.buffer[self._string_start:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch == ":" and len(self._stack) == 1:
+                self._key = self._last_string
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "[" and len(self._stack) == 2 and self._key == self.array_key:
+                    self._array_depth = len(self._stack)
+                elif ch == "{" and self._array_depth is not None and len(self._stack) == self._array_depth + 1:
+                    self._item_start = i
+            elif ch in "}]" and self._stack:
+                self._stack.pop()
+                if ch == "}" and self._item_start is not None and len(self._stack) == self._array_depth:
+                    try:
+                        item = json.loads(self.buffer[self._item_start:i + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict) and self.model is not None:
+                        field = self.model.parse_field(item)
+                        item = field.model_dump() if field is not None else None
+                    if isinstance(item, dict):
+                        completed.append(item)
+                    self._item_start = None
+                elif ch == "]" and len(self._stack) == 1:
+                    self._array_depth = None
+        return completed
+
+    def result(self) -> Dict[str, Any]:
+        """Parse the complete response once the stream has ended."""
+        return parse_json_safely(self.buffer)
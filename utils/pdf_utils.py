@@ -1,30 +1,364 @@
+import contextvars
 import io
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from utils.tracing import span
+
+# pdfplumber (pdfminer) is imported on first use; runs over plain text never need it
+pdfplumber = None
+
 try:
-    import pdfplumber
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_path
 except ImportError:
-    pdfplumber = None
+    convert_from_bytes = convert_from_path = pdfinfo_from_path = None
 
 try:
-    from pdf2image import convert_from_bytes
+    from PIL import Image
 except ImportError:
-    convert_from_bytes = None
+    Image = None
 
+PdfSource = Union[str, bytes, io.BytesIO]
 
-def extract_text_from_pdf(file: io.BytesIO) -> str:
+
+def _require_pdfplumber():
+    global pdfplumber
     if pdfplumber is None:
-        raise RuntimeError("pdfplumber not installed.")
-    text_parts = []
-    with pdfplumber.open(file) as pdf:
-        for page in pdf.pages:
-            txt = page.extract_text() or ""
-            text_parts.append(txt)
-    return "\n\n".join(text_parts).strip()
+        try:
+            import pdfplumber as module
+        except ImportError:
+            raise RuntimeError("pdfplumber not installed.")
+        pdfplumber = module
+    return pdfplumber
+
+
+def _open_pdf(file: PdfSource):
+    _require_pdfplumber()
+    if isinstance(file, (bytes, bytearray)):
+        file = io.BytesIO(file)
+    return pdfplumber.open(file)
+
+
+def count_pdf_pages(file: PdfSource) -> int:
+    """Return the number of pages in a PDF."""
+    with _open_pdf(file) as pdf:
+        return len(pdf.pages)
+
+
+def _image_coverage(page) -> float:
+    """Fraction of the page area covered by embedded images (capped at 1)."""
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for img in page.images:
+        width = max(0.0, min(img["x1"], page.width) - max(img["x0"], 0))
+        height = max(0.0, min(img["bottom"], page.height) - max(img["top"], 0))
+        covered += width * height
+    return min(1.0, covered / page_area)
+
+
+def needs_ocr(text: str, image_coverage: float = 0.0, min_chars: int = 32,
+              scanned_coverage: float = 0.5, scanned_max_chars: int = 200) -> bool:
+    """
+    Decide whether a page's text layer is too thin to use.
+
+    A page needs OCR when its text layer has fewer than ``min_chars``
+    non-whitespace characters, or when it is mostly covered by images and
+    only carries a small amount of text (e.g. a stamped page number or a
+    header over a scanned body).
+    """
+    chars = len("".join(text.split()))
+    if chars < min_chars:
+        return True
+    return image_coverage >= scanned_coverage and chars < scanned_max_chars
+
+
+def page_words(page) -> List[Dict[str, Any]]:
+    """Words of a pdfplumber page with [x0, top, x1, bottom] boxes in PDF points."""
+    return [
+        {'text': word['text'], 'bbox': [round(word['x0'], 2), round(word['top'], 2),
+                                        round(word['x1'], 2), round(word['bottom'], 2)]}
+        for word in page.extract_words()
+    ]
+
+
+def _iter_layers_serial(file: PdfSource, start: int = 0, end: Optional[int] = None,
+                        with_words: bool = False) -> Iterator[Tuple[int, str, float, Optional[list]]]:
+    with _open_pdf(file) as pdf:
+        pages = pdf.pages
+        end = len(pages) if end is None else min(end, len(pages))
+        for index in range(start, end):
+            page = pages[index]
+            try:
+                text = page.extract_text() or ""
+                coverage = _image_coverage(page)
+                # Reuses the characters already parsed for the text
+                words = page_words(page) if with_words else None
+            finally:
+                page.close()
+            yield index, text, coverage, words
+
+
+def iter_pdf_pages(file: PdfSource, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the text of each page as soon as it has been extracted.
+
+    Each page's parsed objects are released once its text is produced, so
+    memory use does not grow with the number of pages.
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        start: Index of the first page to extract (0-based)
+        end: Index after the last page to extract (defaults to the last page)
+
+    Yields:
+        Tuples of (page_index, page_text)
+    """
+    for index, text, _, _ in _iter_layers_serial(file, start, end):
+        yield index, text
+
+
+_worker_source: Optional[PdfSource] = None
+
+
+def _init_page_worker(source: PdfSource):
+    # The PDF is sent once per worker process instead of once per page range
+    global _worker_source
+    _worker_source = source
+
+
+def _extract_page_range(start: int, end: int, with_words: bool = False) -> List[Tuple[str, float, Optional[list]]]:
+    return [layer[1:] for layer in _iter_layers_serial(_worker_source, start, end, with_words)]
+
+
+def _iter_layers_parallel(file: PdfSource, workers: Optional[int], pages_per_task: int,
+                          with_words: bool = False) -> Iterator[Tuple[int, str, float, Optional[list]]]:
+    _require_pdfplumber()
+    workers = workers or os.cpu_count() or 1
+    source = file
+    if not isinstance(file, (str, bytes, bytearray)):
+        file.seek(0)
+        source = file.read()
+
+    total = count_pdf_pages(source)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker, initargs=(source,)) as pool:
+        queued = []
+        next_range = 0
+        while next_range < len(ranges) or queued:
+            while next_range < len(ranges) and len(queued) < workers * 2:
+                queued.append(pool.submit(_extract_page_range, *ranges[next_range], with_words))
+                next_range += 1
+            start, _ = ranges[next_range - len(queued)]
+            for offset, (text, coverage, words) in enumerate(queued.pop(0).result()):
+                yield start + offset, text, coverage, words
+
+
+def iter_pdf_pages_parallel(
+    file: PdfSource,
+    workers: Optional[int] = None,
+    pages_per_task: int = 8,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Extract page text across worker processes, yielding pages in order.
+
+    The page range is split into chunks of ``pages_per_task`` pages. Only a
+    bounded number of chunks is outstanding at a time, and results are
+    yielded strictly in page order as soon as the next chunk is ready.
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        workers: Number of worker processes (defaults to the CPU count)
+        pages_per_task: Pages extracted by one worker per task
+
+    Yields:
+        Tuples of (page_index, page_text)
+    """
+    for index, text, _, _ in _iter_layers_parallel(file, workers, pages_per_task):
+        yield index, text
+
+
+def iter_pdf_page_layers(
+    file: PdfSource,
+    workers: Optional[int] = None,
+    pages_per_task: int = 8,
+    with_words: bool = False,
+) -> Iterator[tuple]:
+    """
+    Yield each page's text layer together with its image coverage.
+
+    Use with needs_ocr to decide per page whether the text layer can be
+    used or the page has to be rendered and OCRed.
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        workers: Use this many processes; None or 1 extracts serially
+        pages_per_task: Pages extracted by one worker per task
+        with_words: Also yield the page's words (see page_words)
+
+    Yields:
+        Tuples of (page_index, page_text, image_coverage), plus the word
+        list as a fourth item when ``with_words`` is set
+    """
+    if workers and workers > 1:
+        layers = _iter_layers_parallel(file, workers, pages_per_task, with_words)
+    else:
+        layers = _iter_layers_serial(file, with_words=with_words)
+    if with_words:
+        return layers
+    return (layer[:3] for layer in layers)
+
+
+def extract_text_from_pdf(file: PdfSource, workers: Optional[int] = None, pages_per_task: int = 8) -> str:
+    """
+    Extract the text of every page, joined by blank lines.
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        workers: Use this many processes for PDFs longer than one task;
+            None or 1 extracts serially in this process
+        pages_per_task: Pages extracted by one worker per task
+
+    Returns:
+        Extracted text
+    """
+    _require_pdfplumber()
+    if workers and workers > 1:
+        if not isinstance(file, (str, bytes, bytearray)):
+            file.seek(0)
+            file = file.read()
+        if count_pdf_pages(file) > pages_per_task:
+            pages = iter_pdf_pages_parallel(file, workers, pages_per_task)
+            return "\n\n".join(text for _, text in pages).strip()
+    return "\n\n".join(text for _, text in iter_pdf_pages(file)).strip()
+
+
+def _page_runs(pages: Iterable[int], max_run: int) -> List[Tuple[int, int]]:
+    """Group sorted page indices into (start, end) runs of at most max_run pages."""
+    runs: List[Tuple[int, int]] = []
+    for index in sorted(set(pages)):
+        if runs and runs[-1][1] == index and index - runs[-1][0] < max_run:
+            runs[-1] = (runs[-1][0], index + 1)
+        else:
+            runs.append((index, index + 1))
+    return runs
+
+
+def iter_pdf_images(
+    file: PdfSource,
+    dpi: int = 200,
+    grayscale: bool = False,
+    thread_count: int = 1,
+    pages: Optional[Iterable[int]] = None,
+    pages_per_batch: int = 2,
+    prefetch: int = 1,
+    fmt: str = "png",
+) -> Iterator[Tuple[int, "Image.Image"]]:
+    """
+    Render PDF pages lazily, a few at a time, yielding one image per page.
+
+    Pages are rendered by poppler into a temporary directory on a
+    background thread, ``prefetch`` batches ahead of the consumer, so OCR
+    of page N overlaps with rendering of page N+1. Each image is loaded
+    only when it is yielded and its file is deleted straight away, so at
+    most ``(prefetch + 1) * pages_per_batch`` rendered pages exist at once.
+    Requires: pip install pdf2image poppler-utils
+
+    Args:
+        file: Path, bytes or binary file object of the PDF
+        dpi: Rendering resolution
+        grayscale: Render single-channel images (smaller and OCR-friendly)
+        thread_count: Poppler threads used for each batch
+        pages: 0-based page indices to render (defaults to every page)
+        pages_per_batch: Consecutive pages rendered per poppler call
+        prefetch: Batches rendered ahead of the consumer
+        fmt: Intermediate image format on disk
+
+    Yields:
+        Tuples of (page_index, PIL Image)
+    """
+    if convert_from_path is None or Image is None:
+        raise RuntimeError("pdf2image not installed.")
+
+    workdir = tempfile.mkdtemp(prefix="pdf_pages_")
+    try:
+        if isinstance(file, str):
+            pdf_path = file
+        else:
+            # Spool once to disk so each batch does not re-send the whole PDF to poppler
+            pdf_path = os.path.join(workdir, "source.pdf")
+            with open(pdf_path, "wb") as f:
+                if isinstance(file, (bytes, bytearray)):
+                    f.write(file)
+                else:
+                    file.seek(0)
+                    shutil.copyfileobj(file, f)
+
+        total = pdfinfo_from_path(pdf_path)["Pages"]
+        selected = range(total) if pages is None else [p for p in pages if 0 <= p < total]
+        runs = _page_runs(selected, pages_per_batch)
+
+        batches: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+
+        def render():
+            try:
+                for start, end in runs:
+                    if stop.is_set():
+                        return
+                    with span("render", pages=end - start):
+                        paths = convert_from_path(
+                            pdf_path, dpi=dpi, first_page=start + 1, last_page=end,
+                            grayscale=grayscale, thread_count=thread_count, fmt=fmt,
+                            output_folder=workdir, output_file=f"p{start:06d}_", paths_only=True,
+                        )
+                    batches.put((start, sorted(paths)))
+            except Exception as e:
+                batches.put(e)
+            finally:
+                batches.put(None)
+
+        # Run in a copy of the caller's context so render spans nest under the caller's span
+        renderer = threading.Thread(target=contextvars.copy_context().run, args=(render,),
+                                    name="pdf-renderer", daemon=True)
+        renderer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, paths = item
+                for offset, path in enumerate(paths):
+                    with Image.open(path) as img:
+                        img.load()
+                        image = img.copy()
+                    os.remove(path)
+                    yield start + offset, image
+        finally:
+            stop.set()
+            # Unblock the renderer if it is waiting on a full queue
+            while renderer.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
 
 def pdf_to_images(file: io.BytesIO):
     """
     Convert PDF pages into images.
     Requires: pip install pdf2image poppler-utils
+
+    This holds every page in memory; use iter_pdf_images for large files.
     """
     if convert_from_bytes is None:
         raise RuntimeError("pdf2image not installed.")
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if they are now)."""
+        self._refill(now)
+        # Requests larger than the bucket wait for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Refund (positive) or charge (negative) tokens after the fact."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimitScheduler:
+    """
+    Admits requests under requests-per-minute and tokens-per-minute limits.
+
+    Callers ``await acquire(tokens)`` before each request. Waiters are
+    admitted in FIFO order. A 429 reported through ``pause`` stops all
+    callers until the server's retry window has passed, instead of each
+    request backing off on its own.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """
+        Initialize the scheduler.
+
+        Args:
+            requests_per_minute: Maximum requests admitted per minute
+            tokens_per_minute: Maximum prompt plus completion tokens per minute
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, tokens: float = 0):
+        """Wait until a request estimated at ``tokens`` tokens may be sent."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now),
+                )
+                if delay <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold back every caller for ``seconds`` (e.g. after a 429)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Requests already admitted count against the window the server reset
+        self.requests.tokens = min(self.requests.tokens, 0.0)
+
+    def record_usage(self, estimated: float, actual: float):
+        """Correct the token bucket once the real usage of a request is known."""
+        self.tokens.adjust(estimated - actual)
@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import FIELD_MAPPING
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Record-level columns of the columnar sinks; extracted fields follow them
+RECORD_COLUMNS = (
+    ('path', 'string'), ('status', 'string'), ('mode', 'string'), ('doc_type', 'string'),
+    ('error', 'string'), ('pages', 'int64'), ('ocr_pages', 'int64'), ('chars', 'int64'),
+    ('attempts', 'int64'), ('overall_confidence', 'float64'), ('duplicate_of', 'string'),
+    ('duplicate_similarity', 'float64'),
+)
+
+
+def field_column(name: str) -> str:
+    """Column name for an extracted field, e.g. 'Invoice Number' -> 'invoice_number'."""
+    return re.sub(r'\W+', '_', name.strip().lower()).strip('_')
+
+
+class ResultSink(ABC):
+    """
+    Buffered writer of pipeline records into a few large files.
+
+    Records are buffered in memory and written out when ``buffer_records``
+    accumulate, when ``flush_interval`` seconds have passed since the last
+    flush (checked by a background thread), and on close. Output rotates to
+    a new numbered part once a file reaches ``max_bytes`` on disk. Files
+    are only ever appended to; an existing file at the same path is
+    replaced.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, flush_interval: Optional[float] = 5.0,
+                 buffer_records: int = 1000):
+        """
+        Initialize the sink.
+
+        Args:
+            path: Output file; with rotation, parts are named <stem>-00000<ext>
+            max_bytes: Rotate once the current file reaches this size (None never rotates)
+            flush_interval: Seconds between timed flushes (None flushes only when full)
+            buffer_records: Records buffered before they are written
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.buffer_records = buffer_records
+        self.files: List[str] = []
+        self.records = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval:
+            self._timer = threading.Thread(target=self._flush_periodically, name="sink-flush", daemon=True)
+            self._timer.start()
+
+    def write(self, record: Dict[str, Any]):
+        with self._lock:
+            self._buffer.append(record)
+            self.records += 1
+            if len(self._buffer) >= self.buffer_records:
+                self._flush()
+
+    def flush(self):
+        """Write out every buffered record."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        with self._lock:
+            self._flush()
+            if self._is_open():
+                self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if not self._is_open():
+            self._open_file(self._next_path())
+        records, self._buffer = self._buffer, []
+        self._write_records(records)
+        if self.max_bytes and self._file_size() >= self.max_bytes:
+            self._close_file()
+
+    def _next_path(self) -> str:
+        if not self.max_bytes:
+            path = self.path
+        else:
+            stem, ext = _split_ext(self.path)
+            path = f"{stem}-{len(self.files):05d}{ext}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.files.append(path)
+        return path
+
+    # Implemented by each format
+    @abstractmethod
+    def _is_open(self) -> bool:
+        """Whether an output file is currently open."""
+
+    @abstractmethod
+    def _open_file(self, path: str):
+        """Open ``path`` for writing."""
+
+    @abstractmethod
+    def _write_records(self, records: List[Dict[str, Any]]):
+        """Write a batch of records to the open file."""
+
+    @abstractmethod
+    def _file_size(self) -> int:
+        """Bytes written to the open file so far."""
+
+    @abstractmethod
+    def _close_file(self):
+        """Finish and close the open file."""
+
+
+class JsonlSink(ResultSink):
+    """
+    JSON Lines sink, optionally gzip or zstd compressed.
+
+    Compression defaults to the path's extension (.gz or .zst). Each flush
+    ends a compressed block, so everything flushed so far can be read back
+    while the sink is still open.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None, **kwargs):
+        if compression is None:
+            compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(path)[1].lower())
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise RuntimeError("zstandard not installed.")
+        self.compression = compression
+        self._raw = None
+        self._stream = None
+        super().__init__(path, **kwargs)
+
+    def _is_open(self) -> bool:
+        return self._raw is not None
+
+    def _open_file(self, path: str):
+        self._raw = open(path, "wb")
+        if self.compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif self.compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    def _write_records(self, records: List[Dict[str, Any]]):
+        self._stream.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+        if self.compression == 'zstd':
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._stream.flush()
+        self._raw.flush()
+
+    def _file_size(self) -> int:
+        return self._raw.tell()
+
+    def _close_file(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._raw = self._stream = None
+
+
+class ColumnarSink(ResultSink):
+    """
+    Parquet (.parquet) or Arrow IPC (.arrow, .feather) sink with one row per document.
+
+    Extracted fields are flattened into a value and a confidence column
+    per field name known to FIELD_MAPPING (for example ``total_amount``
+    and ``total_amount_confidence``), followed by one ``<stage>_seconds``
+    column per pipeline stage, so a whole run loads with one scan. Each
+    flush writes one row group (Parquet) or record batch (Arrow).
+    """
+
+    def __init__(self, path: str, field_names: Optional[List[str]] = None, stages: Optional[List[str]] = None,
+                 **kwargs):
+        """
+        Initialize the sink.
+
+        Args:
+            path: Output file; the format follows its extension
+            field_names: Extracted fields to give columns (defaults to every FIELD_MAPPING field)
+            stages: Stages to give timing columns (defaults to pipeline.STAGES)
+            **kwargs: Buffering and rotation options, as for ResultSink
+        """
+        if pa is None:
+            raise RuntimeError("pyarrow not installed.")
+        if field_names is None:
+            field_names = list(dict.fromkeys(name for names in FIELD_MAPPING.values() for name in names))
+        if stages is None:
+            # Imported here so the sink does not pull in the pipeline for callers that pass stages
+            from pipeline import STAGES
+            stages = list(STAGES)
+        self.format = 'parquet' if path.lower().endswith(".parquet") else 'arrow'
+        self._columns = {field_column(name): name for name in field_names}
+        self._stages = list(stages)
+        self.schema = pa.schema(
+            [(name, pa.type_for_alias(kind)) for name, kind in RECORD_COLUMNS]
+            + [('failed_rules', pa.list_(pa.string()))]
+            + [field for column in self._columns
+               for field in ((column, pa.string()), (f"{column}_confidence", pa.float64()))]
+            + [(f"{stage}_seconds", pa.float64()) for stage in self._stages]
+        )
+        self._writer = None
+        self._sink = None
+        super().__init__(path, **kwargs)
+
+    def to_columns(self, records: List[Dict[str, Any]]) -> Dict[str, list]:
+        """Flatten pipeline records into one list per schema column."""
+        columns: Dict[str, list] = {name: [] for name in self.schema.names}
+        for record in records:
+            result = record.get('result') or {}
+            duplicate = record.get('duplicate') or {}
+            for name, _ in RECORD_COLUMNS:
+                if name == 'overall_confidence':
+                    value = result.get(name)
+                elif name.startswith('duplicate_'):
+                    value = duplicate.get('of' if name == 'duplicate_of' else 'similarity')
+                else:
+                    value = record.get(name)
+                columns[name].append(value)
+            columns['failed_rules'].append((result.get('qa') or {}).get('failed_rules'))
+            fields = {field_column(f['name']): f for f in result.get('fields') or []}
+            for column in self._columns:
+                field = fields.get(column) or {}
+                columns[column].append(field.get('value'))
+                columns[f"{column}_confidence"].append(field.get('confidence'))
+            timings = record.get('timings') or {}
+            for stage in self._stages:
+                columns[f"{stage}_seconds"].append(timings.get(stage))
+        return columns
+
+    def _is_open(self) -> bool:
+        return self._writer is not None
+
+    def _open_file(self, path: str):
+        if self.format == 'parquet':
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def _write_records(self, records: List[Dict[str, Any]]):
+        self._writer.write_table(pa.table(self.to_columns(records), schema=self.schema))
+
+    def _file_size(self) -> int:
+        return os.path.getsize(self.files[-1])
+
+    def _close_file(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._writer = self._sink = None
+
+
+def _split_ext(path: str):
+    # Keep compound extensions such as .jsonl.gz together
+    for ext in (".jsonl.gz", ".jsonl.zst", ".json.gz", ".json.zst"):
+        if path.lower().endswith(ext):
+            return path[:-len(ext)], path[-len(ext):]
+    return os.path.splitext(path)
+
+
+def open_sink(path: str, **kwargs) -> ResultSink:
+    """
+    Open the sink for ``path``'s format: .parquet/.arrow/.feather for columnar
+    output, otherwise JSON Lines (gzip for .gz, zstd for .zst).
+    """
+    if path.lower().endswith((".parquet", ".arrow", ".feather")):
+        return ColumnarSink(path, **kwargs)
+    return JsonlSink(path, **kwargs)
@@ -0,0 +1,373 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from config import TEMPLATE_MIN_CONFIDENCE, TEMPLATE_MIN_SIMILARITY
+from utils.tracing import increment
+from utils.word_index import WordIndex, normalize_token
+from validator import validate_output
+
+# Words of the label kept in front of each value
+ANCHOR_TOKENS = 4
+# A horizontal gap wider than this many line heights ends a value (or label)
+VALUE_GAP = 1.5
+# Columns the first page is divided into for the layout fingerprint
+FINGERPRINT_COLUMNS = 4
+# Margin around a field's learned box when it has no label, relative to the page
+BOX_MARGIN = 0.02
+# Templates with fewer static features than this are too generic to match on
+MIN_FEATURES = 5
+
+
+def _extent(words: Sequence[Dict[str, Any]]) -> Tuple[float, float]:
+    # Pages are measured by their words so PDF points, pixels and character cells all work
+    width = max((word['bbox'][2] for word in words), default=0) or 1
+    height = max((word['bbox'][3] for word in words), default=0) or 1
+    return width, height
+
+
+def layout_fingerprint(pages: Sequence[Sequence[Dict[str, Any]]]) -> FrozenSet[str]:
+    """
+    Layout features of a document: the text words of its first page with the column they start in.
+
+    Words holding digits (amounts, dates, numbers) vary between documents
+    of one layout and are left out.
+    """
+    words = pages[0] if pages else []
+    width, _ = _extent(words)
+    features = set()
+    for word in words:
+        token = normalize_token(word['text'])
+        if len(token) > 1 and not any(char.isdigit() for char in token):
+            column = min(FINGERPRINT_COLUMNS - 1, int(word['bbox'][0] / width * FINGERPRINT_COLUMNS))
+            features.add(f"{token}|{column}")
+    return frozenset(features)
+
+
+def similarity(template: FrozenSet[str], document: FrozenSet[str]) -> float:
+    """Fraction of a template's fingerprint found in a document's fingerprint."""
+    if len(template) < MIN_FEATURES:
+        return 0.0
+    return len(template & document) / len(template)
+
+
+def _signature(fields: List[Dict[str, Any]]) -> List[Tuple[str, Any, Tuple[str, ...]]]:
+    # Two extractions with the same labels in front of the same fields share a layout
+    return [(field['name'], field['page'], tuple(field.get('anchor') or ())) for field in fields]
+
+
+def _same_line(a: Sequence[float], b: Sequence[float]) -> bool:
+    overlap = min(a[3], b[3]) - max(a[1], b[1])
+    return overlap > 0.5 * min(a[3] - a[1], b[3] - b[1])
+
+
+def _adjacent(left: Sequence[float], right: Sequence[float]) -> bool:
+    # Neighbouring words of one value or label, rather than separate columns
+    return _same_line(left, right) and right[0] - left[2] <= VALUE_GAP * (left[3] - left[1])
+
+
+class TemplateStore:
+    """
+    Layout templates learned from confident extractions.
+
+    After an extraction passes validation with high confidence and every
+    value has been located on the page, the store records where each
+    field sat: its page, its box relative to the page and the label words
+    in front of it. Each further extraction with the same labels narrows
+    the template's fingerprint down to the text all of them share (the
+    letterhead, labels and table headings rather than names and line
+    items). A later document containing enough of that text is extracted
+    locally from the learned positions, preferring the label and falling
+    back to the box, and goes to the LLM only if that result fails
+    validation. Like JobLedger, the store is a single SQLite
+    file shared by threads and worker processes; templates are held in
+    memory and reloaded when another connection changes the file.
+    """
+
+    def __init__(self, path: str, min_similarity: float = TEMPLATE_MIN_SIMILARITY,
+                 min_confidence: float = TEMPLATE_MIN_CONFIDENCE):
+        """
+        Initialize the store.
+
+        Args:
+            path: SQLite file to store templates in (created if missing)
+            min_similarity: Fraction of a template's fingerprint a document
+                must contain to be extracted with it
+            min_confidence: Overall confidence an extraction needs to be learned
+        """
+        self.path = path
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._version = None
+        self._templates: Dict[int, Dict[str, Any]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so reopen in each new process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS templates ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, doc_type TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "fields TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            self._version = None
+        return self._conn
+
+    def _load(self) -> Dict[int, Dict[str, Any]]:
+        # data_version only changes when another connection commits
+        conn = self._connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._templates = {
+                row[0]: {'id': row[0], 'doc_type': row[1], 'fingerprint': frozenset(json.loads(row[2])),
+                         'fields': json.loads(row[3])}
+                for row in conn.execute("SELECT id, doc_type, fingerprint, fields FROM templates")
+            }
+            self._version = version
+        return self._templates
+
+    def match(self, fingerprint: FrozenSet[str], doc_type: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        Find the template most similar to ``fingerprint``.
+
+        Args:
+            fingerprint: Layout fingerprint of the document
+            doc_type: Only consider templates of this type, if given
+
+        Returns:
+            Tuple of (template, similarity), or (None, best similarity) when
+            no template is similar enough
+        """
+        with self._lock:
+            templates = list(self._load().values())
+        best, best_similarity = None, 0.0
+        for template in templates:
+            if doc_type is not None and template['doc_type'] != doc_type:
+                continue
+            score = similarity(template['fingerprint'], fingerprint)
+            if score > best_similarity:
+                best, best_similarity = template, score
+        if best_similarity < self.min_similarity:
+            return None, best_similarity
+        return best, best_similarity
+
+    def extract(self, pages: Sequence[Sequence[Dict[str, Any]]],
+                doc_type: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Extract a document locally with the template of a matching layout.
+
+        Args:
+            pages: Words of each page, as for utils.word_index.WordIndex
+            doc_type: Document type, if already known from the router
+
+        Returns:
+            Tuple of (validated result, info). The result is None unless a
+            template matched and its output passed validation; info has the
+            outcome under 'status' ('hit', 'fallback' or 'miss') and the
+            template id and similarity when one matched
+        """
+        template, score = self.match(layout_fingerprint(pages), doc_type)
+        if template is None:
+            self._count("miss")
+            return None, {'status': 'miss'}
+        info = {'template_id': template['id'], 'similarity': round(score, 3)}
+
+        index = WordIndex(pages)
+        extents = [_extent(words) for words in pages]
+        fields, complete = [], True
+        for learned in template['fields']:
+            field = {'name': learned['name'], 'value': None, 'confidence': learned['confidence']}
+            if learned.get('page'):
+                span = _find_value(index, extents, learned)
+                if span is None:
+                    complete = False
+                    break
+                field['value'] = " ".join(index.raw[span[0]:span[1]])
+                field['source'] = index.source(*span)
+            fields.append(field)
+        result = None
+        if complete:
+            result = validate_output({'doc_type': template['doc_type'], 'fields': fields, 'overall_confidence': 0.0})
+        if result is None or 'error' in result or result['qa']['failed_rules']:
+            self._count("fallback")
+            return None, dict(info, status='fallback')
+
+        self._count("hit")
+        return result, dict(info, status='hit')
+
+    def learn(self, pages: Sequence[Sequence[Dict[str, Any]]], result: Dict[str, Any]) -> Optional[int]:
+        """
+        Record the layout of a confident extraction.
+
+        Results that failed a rule, had to be repaired, fall below
+        ``min_confidence``, are of type 'other' or have a value that cannot
+        be found among the words are not learned. An extraction with the same labels as a template
+        of its type narrows that template's fingerprint to their common
+        text; otherwise a template matching the document is replaced, or
+        a new one is added.
+
+        Returns:
+            The template id, or None when nothing was learned
+        """
+        doc_type = result.get('doc_type')
+        fields = result.get('fields') or []
+        if ('error' in result or not fields or doc_type in (None, 'other')
+                or result.get('qa', {}).get('failed_rules') or result.get('repairs')
+                or result.get('overall_confidence', 0) < self.min_confidence):
+            return None
+
+        index = WordIndex(pages)
+        spans = index.find([(field['name'], field.get('value')) for field in fields])
+        learned = []
+        for field, span in zip(fields, spans):
+            entry = {'name': field['name'], 'confidence': field.get('confidence', 0.0), 'page': None}
+            if field.get('value') not in (None, ""):
+                if span is None:
+                    return None
+                page = index.pages[span[0]]
+                width, height = _extent(pages[page - 1])
+                box = index.source(*span)['bbox']
+                entry.update(
+                    page=page,
+                    bbox=[round(box[0] / width, 4), round(box[1] / height, 4),
+                          round(box[2] / width, 4), round(box[3] / height, 4)],
+                    anchor=_anchor(index, span[0]),
+                )
+            learned.append(entry)
+        if not any(entry['page'] for entry in learned):
+            return None
+
+        fingerprint = layout_fingerprint(pages)
+        signature = _signature(learned)
+        with self._lock:
+            same_labels = [t for t in self._load().values()
+                           if t['doc_type'] == doc_type and _signature(t['fields']) == signature]
+        existing = max(same_labels, key=lambda t: len(t['fingerprint'] & fingerprint), default=None)
+        if existing is not None and len(existing['fingerprint'] & fingerprint) >= MIN_FEATURES:
+            fingerprint = existing['fingerprint'] & fingerprint
+        else:
+            existing, _ = self.match(fingerprint, doc_type)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if existing is not None:
+                conn.execute(
+                    "UPDATE templates SET fingerprint = ?, fields = ?, updated = ? WHERE id = ?",
+                    (json.dumps(sorted(fingerprint)), json.dumps(learned), now, existing['id']),
+                )
+                template_id = existing['id']
+            else:
+                template_id = conn.execute(
+                    "INSERT INTO templates (doc_type, fingerprint, fields, created, updated) VALUES (?, ?, ?, ?, ?)",
+                    (doc_type, json.dumps(sorted(fingerprint)), json.dumps(learned), now, now),
+                ).lastrowid
+            conn.commit()
+            self._load()
+            self._templates[template_id] = {'id': template_id, 'doc_type': doc_type,
+                                            'fingerprint': fingerprint, 'fields': learned}
+        increment("templates_learned", doc_type=doc_type)
+        return template_id
+
+    def _count(self, outcome: str):
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "fallback":
+                self.fallbacks += 1
+            else:
+                self.misses += 1
+        increment("template_lookups", result=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return lookup counters, the hit rate and the number of templates."""
+        with self._lock:
+            templates = len(self._load())
+            lookups = self.hits + self.misses + self.fallbacks
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fallbacks': self.fallbacks,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'templates': templates,
+            }
+
+
+def _anchor(index: WordIndex, start: int) -> List[str]:
+    """Label tokens directly in front of the word at ``start`` on its line."""
+    anchor: List[str] = []
+    right = index.boxes[start]
+    i = start - 1
+    while i >= 0 and len(anchor) < ANCHOR_TOKENS and index.pages[i] == index.pages[start]:
+        box = index.boxes[i]
+        # The gap between a label and its value may be wide; within the label it may not
+        if not _same_line(box, right) or (anchor and not _adjacent(box, right)):
+            break
+        if any(char.isdigit() for char in index.tokens[i]):
+            break
+        anchor.insert(0, index.tokens[i])
+        right = box
+        i -= 1
+    return anchor
+
+
+def _find_value(index: WordIndex, extents: Sequence[Tuple[float, float]],
+                learned: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Word positions of a learned field in another document, or None."""
+    page = learned['page']
+    if page > len(extents):
+        return None
+    width, height = extents[page - 1]
+    x0, top, x1, bottom = learned['bbox']
+    on_page = [i for i in range(len(index)) if index.pages[i] == page]
+
+    anchor = learned.get('anchor') or []
+    if anchor:
+        # The occurrence of the label nearest the learned position wins
+        size = len(anchor)
+        ends = [
+            i + size for i in on_page
+            if index.tokens[i:i + size] == anchor and i + size < len(index) and index.pages[i + size] == page
+            and _same_line(index.boxes[i + size - 1], index.boxes[i + size])
+        ]
+        if not ends:
+            return None
+        start = min(ends, key=lambda end: abs(index.boxes[end][1] / height - top))
+        end = start + 1
+        while end < len(index) and index.pages[end] == page and _adjacent(index.boxes[end - 1], index.boxes[end]):
+            end += 1
+        return start, end
+
+    # Unlabelled values are read from the learned box
+    inside = [
+        i for i in on_page
+        if x0 - BOX_MARGIN <= (index.boxes[i][0] + index.boxes[i][2]) / 2 / width <= x1 + BOX_MARGIN
+        and top - BOX_MARGIN <= (index.boxes[i][1] + index.boxes[i][3]) / 2 / height <= bottom + BOX_MARGIN
+    ]
+    if not inside or inside[-1] - inside[0] + 1 != len(inside):
+        return None
+    return inside[0], inside[-1] + 1
+
+
+_stores: Dict[str, TemplateStore] = {}
+
+
+def open_template_store(path: str) -> TemplateStore:
+    """Return this process's template store for ``path``, opening it on first use."""
+    store = _stores.get(path)
+    if store is None:
+        store = _stores.setdefault(path, TemplateStore(path))
+    return store
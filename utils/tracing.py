@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import TRACING_ENABLED
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "docextract"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    """Stand-in returned by span() while tracing is disabled."""
+
+    trace_id = span_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed operation, nested under whichever span was active when it started.
+
+    Parents are tracked with a ContextVar, so nesting follows threads and
+    asyncio tasks. Exceptions escaping the span are recorded and re-raised.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = tracer._next_id()
+        self.parent_id: Optional[int] = None
+        self.trace_id: Optional[int] = None
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set(self, key: str, value: Any):
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    def record_error(self, error: Any):
+        """Mark the span as failed for an error that was handled rather than raised."""
+        self.error = str(error)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self._token = _current_span.set(self)
+        self.start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self._tracer._finish(self, duration)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans and metrics for the extraction pipeline.
+
+    While disabled, span() returns a shared no-op context manager and
+    increment() returns immediately, so instrumented code pays for one
+    attribute check. Finished spans are kept in a bounded buffer and
+    every span's duration also feeds the per-stage latency histogram.
+    """
+
+    def __init__(self, enabled: bool = False, max_spans: int = 10000):
+        self.enabled = enabled
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._histograms: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._ids = 0
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def span(self, name: str, **attributes):
+        """Context manager timing ``name``; a no-op while disabled."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def increment(self, metric: str, value: float = 1, **labels):
+        """Add ``value`` to a counter, e.g. increment("tokens", 120, direction="sent")."""
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _finish(self, span: Span, duration: float):
+        if span.error:
+            self.increment("errors", stage=span.name)
+        self._spans.append({
+            'name': span.name,
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'start': span.start,
+            'duration': duration,
+            'thread': threading.get_ident(),
+            'pid': os.getpid(),
+            'attributes': span.attributes,
+            'error': span.error,
+        })
+        with self._lock:
+            counts = self._histograms.get(span.name)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the running sum
+                counts = self._histograms[span.name] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(LATENCY_BUCKETS)] += 1
+            counts[-1] += duration
+
+    def spans(self, trace_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Finished spans, optionally only those of one trace."""
+        spans = list(self._spans)
+        if trace_id is None:
+            return spans
+        return [span for span in spans if span['trace_id'] == trace_id]
+
+    def reset(self):
+        """Drop every recorded span and metric."""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Render counters and stage latency histograms in Prometheus text format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: list(counts) for name, counts in self._histograms.items()}
+
+        lines = []
+        by_metric: Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], float]]] = {}
+        for (metric, labels), value in sorted(counters.items()):
+            by_metric.setdefault(metric, []).append((labels, value))
+        for metric, samples in by_metric.items():
+            name = f"{METRIC_PREFIX}_{metric}_total"
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        if histograms:
+            name = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for stage, counts in sorted(histograms.items()):
+                cumulative = 0.0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels((('stage', stage), ('le', le)))} {cumulative:g}")
+                lines.append(f"{name}_sum{_format_labels((('stage', stage),))} {counts[-1]:.6f}")
+                lines.append(f"{name}_count{_format_labels((('stage', stage),))} {cumulative:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_trace_events(self, trace_id: Optional[int] = None) -> Dict[str, Any]:
+        """Spans in Chrome trace-event JSON, viewable in chrome://tracing or Perfetto."""
+        events = []
+        for span in self.spans(trace_id):
+            args = dict(span['attributes'], trace_id=span['trace_id'], span_id=span['span_id'])
+            if span['parent_id'] is not None:
+                args['parent_id'] = span['parent_id']
+            if span['error']:
+                args['error'] = span['error']
+            events.append({
+                'name': span['name'], 'ph': 'X', 'ts': span['start'] * 1e6, 'dur': span['duration'] * 1e6,
+                'pid': span['pid'], 'tid': span['thread'], 'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path: str, trace_id: Optional[int] = None):
+        """Write the spans as a JSON trace file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace_events(trace_id), f, default=str)
+
+    def write_prometheus(self, path: str):
+        """Write the metrics in Prometheus text format (e.g. for node_exporter's textfile collector)."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+tracer = Tracer(enabled=TRACING_ENABLED)
+
+
+def span(name: str, **attributes):
+    """Time a block with the shared tracer: ``with span("ocr", page=3): ...``."""
+    if not tracer.enabled:
+        return _NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def increment(metric: str, value: float = 1, **labels):
+    """Add to a counter on the shared tracer."""
+    if tracer.enabled:
+        tracer.increment(metric, value, **labels)
+
+
+def count_tokens(usage: Any):
+    """Count the prompt and completion tokens reported by an API response."""
+    if tracer.enabled and usage is not None:
+        tracer.increment("tokens", getattr(usage, "prompt_tokens", 0) or 0, direction="sent")
+        tracer.increment("tokens", getattr(usage, "completion_tokens", 0) or 0, direction="received")
+
+
+def enable():
+    tracer.enabled = True
+
+
+def disable():
+    tracer.enabled = False
+
@@ -1,9 +1,5 @@
 from typing import List, Dict, Tuple, Any, Optional
-import cv2
-import numpy as np
 from PIL import Image, ImageDraw, ImageFont
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 import io
 
 class DocumentVisualizer:
@@ -129,6 +125,12 @@ class DocumentVisualizer:
         Returns:
             PIL Image of the plot
         """
+        # Deferred: matplotlib takes longer to import than the rest of the pipeline
+        try:
+            import matplotlib.pyplot as plt
+        except ImportError:
+            raise RuntimeError("matplotlib not installed.")
+
         plt.figure(figsize=(8, 6))
         plt.hist(data, bins=bins, color=color, edgecolor=edgecolor, alpha=0.7)
         plt.title(title)
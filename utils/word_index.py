@@ -0,0 +1,368 @@
+import difflib
+import re
+from bisect import bisect_right
+from collections import deque
+from datetime import date
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from validator import parse_amount
+
+# Tokens of the label are looked for this many words before a value
+LABEL_WINDOW = 6
+# Minimum similarity of a fuzzy match, and the shortest value tried fuzzily
+FUZZY_RATIO = 0.85
+FUZZY_MIN_CHARS = 4
+# Amounts and dates span at most this many words ("$ 1,234.50", "31 Jan 2024")
+CANONICAL_WINDOW = 3
+
+_NON_WORD = re.compile(r'[\W_]+')
+_NON_DIGIT = re.compile(r'\D+')
+# Character classes counted by the fuzzy prefilter: a-z, 0-9 and everything else
+_CHAR_CLASSES = 37
+_CLASSED_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789"
+_MONTHS = {name: number for number, names in enumerate((
+    ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",),
+    ("jun", "june"), ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"),
+    ("oct", "october"), ("nov", "november"), ("dec", "december"),
+), start=1) for name in names}
+_ISO_DATE = re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$')
+_NUMERIC_DATE = re.compile(r'^(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})$')
+_DAY_MONTH_YEAR = re.compile(r'^(\d{1,2})(?:st|nd|rd|th)?\s+([a-z]+)\.?,?\s+(\d{4})$')
+_MONTH_DAY_YEAR = re.compile(r'^([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})$')
+
+
+def normalize_token(text: str) -> str:
+    """Case-folded word with punctuation and currency symbols removed."""
+    return _NON_WORD.sub("", text.casefold())
+
+
+def _iso(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def date_keys(text: str) -> List[str]:
+    """
+    ISO dates a date string may denote.
+
+    Numeric dates such as 03/04/2024 are ambiguous between day-first and
+    month-first order and yield both readings.
+    """
+    text = " ".join(text.casefold().split())
+    candidates = []
+    match = _ISO_DATE.match(text)
+    if match:
+        candidates.append((int(match[1]), int(match[2]), int(match[3])))
+    match = _NUMERIC_DATE.match(text)
+    if match:
+        first, second, year = int(match[1]), int(match[2]), int(match[3])
+        year += 2000 if year < 100 else 0
+        candidates += [(year, second, first), (year, first, second)]
+    match = _DAY_MONTH_YEAR.match(text)
+    if match and match[2] in _MONTHS:
+        candidates.append((int(match[3]), _MONTHS[match[2]], int(match[1])))
+    match = _MONTH_DAY_YEAR.match(text)
+    if match and match[1] in _MONTHS:
+        candidates.append((int(match[3]), _MONTHS[match[1]], int(match[2])))
+    return list(dict.fromkeys(key for key in (_iso(*c) for c in candidates) if key))
+
+
+def canonical_keys(text: str) -> List[str]:
+    """Keys under which an amount ('#1234.50') or a date ('@2024-01-31') is indexed."""
+    keys = [f"@{key}" for key in date_keys(text)]
+    if not keys:
+        amount = parse_amount(text)
+        if amount is not None:
+            keys.append(f"#{amount:.2f}")
+    return keys
+
+
+def _key_digits(key: str) -> str:
+    # Digits every spelling of the value has in one word: the integer part
+    # of an amount ('1,234.5' and '$1234.50' both hold '1234'), the last two
+    # digits of a date's year ('31 Jan 2024' and '31/01/24' both hold '24')
+    if key.startswith("#"):
+        return key[1:].split(".")[0].lstrip("-")
+    return key[3:5]
+
+
+def _char_classes(np, text: str):
+    """Prefilter character class of every character of ``text``, as a numpy array."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    table = np.full(128, _CHAR_CLASSES - 1, dtype=np.int64)
+    table[[ord(c) for c in _CLASSED_CHARS]] = np.arange(len(_CLASSED_CHARS))
+    return table[np.minimum(codes, 127)]
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over token sequences.
+
+    All patterns are matched in one pass over the token stream, whatever
+    their number.
+    """
+
+    def __init__(self, patterns: Iterable[Sequence[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.lengths: List[int] = []
+        for pattern_id, pattern in enumerate(patterns):
+            self.lengths.append(len(pattern))
+            state = 0
+            for token in pattern:
+                nxt = self._goto[state].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            if pattern:
+                self._out[state].append(pattern_id)
+
+        # Breadth-first, so every fail link points at an already finished state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(token, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, tokens: Sequence[str]) -> Iterable[Tuple[int, int]]:
+        """Yield (start, pattern_id) for every occurrence of every pattern."""
+        state = 0
+        for end, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for pattern_id in self._out[state]:
+                yield end - self.lengths[pattern_id] + 1, pattern_id
+
+
+class WordIndex:
+    """
+    Positions of a document's words, for finding where extracted values came from.
+
+    Built once per document from the words of each page (pdfplumber words
+    from the text layer, OCR words elsewhere). Values are first matched
+    exactly on normalized tokens, all of them in one Aho-Corasick pass;
+    amounts and dates that were not found verbatim are then looked up by
+    their canonical value, so '1234.5' finds '$1,234.50' and '2024-01-31'
+    finds '31 Jan 2024'; anything left is matched fuzzily. The canonical
+    and fuzzy lookups only examine words that can match: words holding
+    the value's digits, and word windows whose letter counts allow the
+    required similarity, found with indexes built once per document.
+    """
+
+    def __init__(self, pages: Sequence[Sequence[Dict[str, Any]]]):
+        """
+        Initialize the index.
+
+        Args:
+            pages: For each page, its words as dicts with 'text' and
+                'bbox' ([x0, top, x1, bottom] in page coordinates)
+        """
+        self.tokens: List[str] = []
+        self.raw: List[str] = []
+        self.pages: List[int] = []
+        self.boxes: List[Sequence[float]] = []
+        for page, words in enumerate(pages, start=1):
+            for word in words:
+                token = normalize_token(word['text'])
+                if token:
+                    self.tokens.append(token)
+                    self.raw.append(word['text'])
+                    self.pages.append(page)
+                    self.boxes.append(word['bbox'])
+        self._window_keys: Dict[Tuple[int, int], List[str]] = {}
+        self._digits: Optional[str] = None
+        self._digit_ends: List[int] = []
+        self._char_counts = None
+        self._char_lengths = None
+        self._page_array = None
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def _anchors(self, digits: str) -> List[int]:
+        """Positions of the words whose digits contain ``digits``."""
+        if self._digits is None:
+            # One string of every word's digits, so a search runs at C speed
+            parts = [_NON_DIGIT.sub("", token) for token in self.tokens]
+            self._digits = "\n".join(parts)
+            self._digit_ends = list(accumulate(len(part) + 1 for part in parts))
+        anchors = []
+        if not digits:
+            return anchors
+        found = self._digits.find(digits)
+        while found != -1:
+            anchor = bisect_right(self._digit_ends, found)
+            if not anchors or anchors[-1] != anchor:
+                anchors.append(anchor)
+            found = self._digits.find(digits, found + 1)
+        return anchors
+
+    def _canonical_spans(self, key: str) -> List[Tuple[int, int]]:
+        """Windows of up to CANONICAL_WINDOW words on one page whose canonical keys include ``key``."""
+        spans = []
+        for anchor in self._anchors(_key_digits(key)):
+            for start in range(max(0, anchor - CANONICAL_WINDOW + 1), anchor + 1):
+                for end in range(anchor + 1, min(start + CANONICAL_WINDOW, len(self.tokens)) + 1):
+                    if self.pages[start] != self.pages[end - 1]:
+                        continue
+                    keys = self._window_keys.get((start, end))
+                    if keys is None:
+                        keys = canonical_keys(" ".join(self.raw[start:end]).strip(",;:"))
+                        self._window_keys[(start, end)] = keys
+                    if key in keys:
+                        spans.append((start, end))
+        return list(dict.fromkeys(spans))
+
+    def _fuzzy_candidates(self, target: str, size: int, threshold: float):
+        """
+        Starts of the ``size``-word windows on one page whose quick_ratio
+        against ``target`` reaches ``threshold``.
+
+        quick_ratio bounds the similarity from above by the characters two
+        strings have in common whatever their order; it is computed for all
+        windows at once from per-word character counts, so only windows
+        that can reach the threshold are compared character by character.
+        """
+        # Imported here so documents whose values are all found exactly never load numpy
+        import numpy as np
+
+        if self._char_counts is None:
+            lengths = np.fromiter((len(token) for token in self.tokens), dtype=np.int64, count=len(self.tokens))
+            classes = _char_classes(np, "".join(self.tokens))
+            owners = np.repeat(np.arange(len(self.tokens)), lengths)
+            counts = np.bincount(owners * _CHAR_CLASSES + classes, minlength=len(self.tokens) * _CHAR_CLASSES)
+            # Prefix sums, so a window's counts are one subtraction
+            self._char_counts = np.vstack([np.zeros((1, _CHAR_CLASSES), dtype=np.int32),
+                                           counts.reshape(-1, _CHAR_CLASSES).cumsum(axis=0, dtype=np.int32)])
+            self._char_lengths = np.concatenate([[0], lengths.cumsum()])
+            self._page_array = np.asarray(self.pages)
+
+        if size > len(self.tokens):
+            return []
+        wanted = np.bincount(_char_classes(np, target), minlength=_CHAR_CLASSES)
+        windows = self._char_counts[size:] - self._char_counts[:-size]
+        common = np.minimum(windows, wanted).sum(axis=1)
+        lengths = self._char_lengths[size:] - self._char_lengths[:-size]
+        bound = 2.0 * common / (lengths + len(target))
+        same_page = self._page_array[:len(self.tokens) - size + 1] == self._page_array[size - 1:]
+        return np.flatnonzero((bound >= threshold) & same_page).tolist()
+
+    def _fuzzy_spans(self, tokens: List[str]) -> List[Tuple[int, int]]:
+        target = "".join(tokens)
+        if len(target) < FUZZY_MIN_CHARS:
+            return []
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(target)
+        best, spans = FUZZY_RATIO, []
+        # Windows one token shorter or longer catch split and merged words
+        for size in {max(1, len(tokens) - 1), len(tokens), len(tokens) + 1}:
+            for start in self._fuzzy_candidates(target, size, FUZZY_RATIO):
+                matcher.set_seq1("".join(self.tokens[start:start + size]))
+                if matcher.real_quick_ratio() < best or matcher.quick_ratio() < best:
+                    continue
+                ratio = matcher.ratio()
+                if ratio > best:
+                    best, spans = ratio, [(start, start + size)]
+                elif ratio == best:
+                    spans.append((start, start + size))
+        return spans
+
+    def _label_score(self, start: int, label: List[str]) -> int:
+        before = range(max(0, start - LABEL_WINDOW), start)
+        return sum(1 for i in before if self.pages[i] == self.pages[start] and self.tokens[i] in label)
+
+    def source(self, start: int, end: int) -> Dict[str, Any]:
+        """Page and union box of the words ``start`` to ``end`` (exclusive)."""
+        boxes = self.boxes[start:end]
+        return {
+            'page': self.pages[start],
+            'bbox': [min(b[0] for b in boxes), min(b[1] for b in boxes),
+                     max(b[2] for b in boxes), max(b[3] for b in boxes)],
+        }
+
+    def find(self, fields: Sequence[Tuple[str, Optional[str]]],
+             fuzzy: bool = True) -> List[Optional[Tuple[int, int]]]:
+        """
+        Find each value in the document.
+
+        Args:
+            fields: (field name, value) pairs; the name's words count as a
+                label and decide between several occurrences of a value
+            fuzzy: Also accept near misses; without it a value must match
+                exactly or, for amounts and dates, by value
+
+        Returns:
+            For each field, the (start, end) word positions of its best
+            match, or None when the value was not found
+        """
+        patterns = [
+            [token for token in (normalize_token(part) for part in str(value or "").split()) if token]
+            for _, value in fields
+        ]
+        candidates: List[List[Tuple[int, int]]] = [[] for _ in fields]
+        if self.tokens:
+            for start, field_index in AhoCorasick(patterns).find(self.tokens):
+                candidates[field_index].append((start, start + len(patterns[field_index])))
+
+        found: List[Optional[Tuple[int, int]]] = []
+        for (name, value), tokens, spans in zip(fields, patterns, candidates):
+            if not spans and tokens and self.tokens:
+                spans = [span for key in canonical_keys(str(value)) for span in self._canonical_spans(key)]
+                if not spans and fuzzy:
+                    spans = self._fuzzy_spans(tokens)
+            spans = [(start, end) for start, end in spans if self.pages[start] == self.pages[end - 1]]
+            if not spans:
+                found.append(None)
+                continue
+            label = [token for token in (normalize_token(part) for part in name.split()) if token]
+            found.append(min(spans, key=lambda span: (-self._label_score(span[0], label), span[0])))
+        return found
+
+    def locate(self, fields: Sequence[Tuple[str, Optional[str]]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Like find, but return each match as a dict shaped like
+        schemas.extraction_models.Source: the 1-based page and the union of
+        the matched words' boxes.
+        """
+        return [self.source(*span) if span else None for span in self.find(fields)]
+
+
+def text_words(page: str) -> List[Dict[str, Any]]:
+    """Words of a plain-text page, boxed in character cells ([column, line, column + length, line + 1])."""
+    return [
+        {'text': match.group(), 'bbox': [match.start(), line, match.end(), line + 1]}
+        for line, text in enumerate(page.split("\n"))
+        for match in re.finditer(r'\S+', text)
+    ]
+
+
+def locate_fields(result: Dict[str, Any], pages: Sequence[Sequence[Dict[str, Any]]]) -> Tuple[Dict[str, Any], int]:
+    """
+    Fill in the source of every extracted field that can be found in the document.
+
+    Args:
+        result: Validated extraction result with a 'fields' list
+        pages: Words of each page, as for WordIndex
+
+    Returns:
+        Tuple of (a new result whose located fields carry page and bbox,
+        number of fields located); unlocated fields keep their source
+    """
+    fields = result.get("fields") or []
+    sources = WordIndex(pages).locate([(field["name"], field.get("value")) for field in fields])
+    located = [dict(field, source=source) if source else field for field, source in zip(fields, sources)]
+    return dict(result, fields=located), sum(1 for source in sources if source)
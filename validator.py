@@ -1,21 +1,299 @@
 import re
 import json
+from dataclasses import dataclass
+from enum import IntFlag
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+
+# Confidence multiplier applied to a field that fails one of its rules
+DEFAULT_PENALTY = 0.7
+
+
+class ErrorCode(IntFlag):
+    """Kinds of validation error a field can have; combine with |."""
+    NONE = 0
+    INVALID = 1
+    TYPE = 2
+    PATTERN = 4
+
+
+_AMOUNT = re.compile(
+    r'^(?:[A-Za-z]{3}|[$€£¥₹])?\s*-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d{1,2})?\s*(?:[A-Za-z]{3})?$'
+)
+_AMOUNT_NOISE = re.compile(r'[^\d.\-]')
+_MONTH = r'(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)'
+_DAY = r'(?:0?[1-9]|[12]\d|3[01])'
+_DATE = re.compile(
+    rf'^(?:\d{{4}}([/.-])(?:0?[1-9]|1[0-2])\1{_DAY}'           # 2024-01-31, 2024/01/31
+    rf'|{_DAY}[/.-]{_DAY}[/.-](?:\d{{4}}|\d{{2}})'             # 31/01/2024, 01-31-24
+    rf'|{_DAY}(?:st|nd|rd|th)?\s+{_MONTH}\.?,?\s+\d{{4}}'      # 31 Jan 2024
+    rf'|{_MONTH}\.?\s+{_DAY}(?:st|nd|rd|th)?,?\s+\d{{4}})$',   # January 31, 2024
+    re.IGNORECASE
+)
+_INVOICE_NUMBER = re.compile(r'^(?=[^\d]*\d)[A-Za-z0-9][A-Za-z0-9 #/._-]{1,39}$')
+_NAME = re.compile(r'^(?=.*[^\W\d_]{2})[^\d@]{2,120}$')
+# Organizations may have digits in their name ("3M Company", "24/7 Care Clinic")
+_ORGANIZATION_NAME = re.compile(r'^(?=.*[^\W\d_]{2})[^@]{2,120}$')
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Parse a currency amount such as '$1,234.50' or 'EUR 12' into a float."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if value is None or not _AMOUNT.match(str(value).strip()):
+        return None
+    try:
+        return float(_AMOUNT_NOISE.sub("", str(value)))
+    except ValueError:
+        return None
+
 
 def validate_amount(value):
-    return bool(re.match(r'^\d+(\.\d{1,2})?$', str(value)))
+    return parse_amount(value) is not None
+
+def validate_date(value):
+    return bool(_DATE.match(str(value).strip()))
+
+def validate_invoice_number(value):
+    return bool(_INVOICE_NUMBER.match(str(value).strip()))
+
+def validate_name(value):
+    return bool(_NAME.match(str(value).strip()))
+
+def validate_organization_name(value):
+    return bool(_ORGANIZATION_NAME.match(str(value).strip()))
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """
+    A check on a single field value.
+
+    The rule applies to fields whose name is in ``fields`` or, for generic
+    rule sets, whose lowercased name contains one of ``keywords``.
+    ``error`` is the kind of error a failure reports to the confidence
+    scorer.
+    """
+    name: str
+    check: Callable[[Any], bool]
+    fields: Tuple[str, ...] = ()
+    keywords: Tuple[str, ...] = ()
+    penalty: float = DEFAULT_PENALTY
+    error: ErrorCode = ErrorCode.PATTERN
+
+    def applies_to(self, field_name: str) -> bool:
+        lowered = field_name.lower()
+        return field_name in self.fields or any(keyword in lowered for keyword in self.keywords)
+
+
+@dataclass(frozen=True)
+class CrossFieldRule:
+    """
+    A check across several fields, skipped unless all of them have values.
+
+    ``check`` receives the values in ``fields`` order and returns None when
+    it passes or a short note explaining the failure; the penalty is
+    applied to the field named by ``blame``.
+    """
+    name: str
+    fields: Tuple[str, ...]
+    check: Callable[..., Optional[str]]
+    blame: str
+    penalty: float = DEFAULT_PENALTY
+    error: ErrorCode = ErrorCode.INVALID
+
+
+def _totals_balance(total, subtotal, tax) -> Optional[str]:
+    total, subtotal, tax = parse_amount(total), parse_amount(subtotal), parse_amount(tax)
+    if None in (total, subtotal, tax):
+        return "totals could not be parsed"
+    if abs(subtotal + tax - total) > 0.011:
+        return f"total {total:.2f} != subtotal {subtotal:.2f} + tax {tax:.2f}"
+    return None
+
+
+def _tax_within_total(tax, total) -> Optional[str]:
+    tax, total = parse_amount(tax), parse_amount(total)
+    if None in (tax, total):
+        return "amounts could not be parsed"
+    if tax > total:
+        return f"tax {tax:.2f} exceeds total {total:.2f}"
+    return None
+
+
+class RuleSet:
+    """
+    Precompiled rules for one document type.
+
+    Rules are resolved once per distinct field name and cached, so
+    validating a document costs one dict lookup per field plus the checks
+    themselves, however many rules the set holds.
+    """
+
+    def __init__(self, field_rules: Iterable[FieldRule] = (), cross_rules: Iterable[CrossFieldRule] = ()):
+        self.field_rules = tuple(field_rules)
+        self.cross_rules = tuple(cross_rules)
+        self._by_field: Dict[str, Tuple[FieldRule, ...]] = {}
+        self._by_name = {rule.name: rule for rule in self.field_rules + self.cross_rules}
+
+    def rules_for(self, field_name: str) -> Tuple[FieldRule, ...]:
+        """Field rules that apply to ``field_name``."""
+        rules = self._by_field.get(field_name)
+        if rules is None:
+            rules = tuple(rule for rule in self.field_rules if rule.applies_to(field_name))
+            self._by_field[field_name] = rules
+        return rules
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate one extraction result without modifying it.
+
+        Args:
+            data: Dict with 'doc_type', 'fields' and 'overall_confidence'
+
+        Returns:
+            A new dict whose fields carry penalized confidences, with the
+            recomputed overall confidence and a 'qa' entry shaped like
+            schemas.extraction_models.QAReport
+        """
+        passed: List[str] = []
+        failed: List[str] = []
+        notes: List[str] = []
+        fields = []
+        values: Dict[str, Any] = {}
+        index: Dict[str, int] = {}
+        for field in data["fields"]:
+            field = dict(field)
+            name, value = field["name"], field.get("value")
+            if value not in (None, ""):
+                values[name] = value
+                index[name] = len(fields)
+                for rule in self.rules_for(name):
+                    rule_id = f"{rule.name}:{name}"
+                    if rule.check(value):
+                        passed.append(rule_id)
+                    else:
+                        failed.append(rule_id)
+                        field["confidence"] = field.get("confidence", 0) * rule.penalty
+            fields.append(field)
+
+        for rule in self.cross_rules:
+            if not all(name in values for name in rule.fields):
+                continue
+            note = rule.check(*(values[name] for name in rule.fields))
+            if note is None:
+                passed.append(rule.name)
+            else:
+                failed.append(rule.name)
+                notes.append(f"{rule.name}: {note}")
+                blamed = fields[index[rule.blame]]
+                blamed["confidence"] = blamed.get("confidence", 0) * rule.penalty
+
+        result = dict(data, fields=fields)
+        result["overall_confidence"] = compute_overall_confidence(fields)
+        result["qa"] = {"passed_rules": passed, "failed_rules": failed, "notes": "; ".join(notes)}
+        return result
+
+    def error_codes(self, failed_rules: Iterable[str]) -> Dict[str, ErrorCode]:
+        """
+        Map failed rule ids ('rule:field' or cross-field rule names) to one
+        ErrorCode per field; cross-field failures count against the blamed
+        field. Unknown rule ids are ignored.
+        """
+        codes: Dict[str, ErrorCode] = {}
+        for rule_id in failed_rules:
+            name, _, field = rule_id.partition(":")
+            rule = self._by_name.get(name)
+            if rule is None:
+                continue
+            if isinstance(rule, CrossFieldRule):
+                field = rule.blame
+            codes[field] = codes.get(field, ErrorCode.NONE) | rule.error | ErrorCode.INVALID
+        return codes
+
+
+# Used for 'other' and any document type without its own rule set
+GENERIC_RULES = RuleSet([
+    FieldRule("amount_format", validate_amount, keywords=("amount", "total", "subtotal"), error=ErrorCode.TYPE),
+    FieldRule("date_format", validate_date, keywords=("date",)),
+])
+
+RULE_SETS: Dict[str, RuleSet] = {
+    'invoice': RuleSet(
+        [
+            FieldRule("invoice_number_format", validate_invoice_number, fields=("Invoice Number",)),
+            FieldRule("date_format", validate_date, fields=("Date",)),
+            FieldRule("amount_format", validate_amount, fields=("Subtotal", "Tax Amount", "Total Amount"),
+                      error=ErrorCode.TYPE),
+            FieldRule("organization_name_format", validate_organization_name, fields=("Vendor Name",)),
+        ],
+        [
+            CrossFieldRule("totals_balance", ("Total Amount", "Subtotal", "Tax Amount"), _totals_balance,
+                           blame="Total Amount"),
+            CrossFieldRule("tax_within_total", ("Tax Amount", "Total Amount"), _tax_within_total,
+                           blame="Tax Amount"),
+        ],
+    ),
+    'medical_bill': RuleSet([
+        FieldRule("date_format", validate_date, fields=("Bill Date",)),
+        FieldRule("amount_format", validate_amount, fields=("Total Amount",), error=ErrorCode.TYPE),
+        FieldRule("name_format", validate_name, fields=("Patient Name",)),
+        FieldRule("organization_name_format", validate_organization_name, fields=("Hospital Name",)),
+    ]),
+    'prescription': RuleSet([
+        FieldRule("date_format", validate_date, fields=("Prescription Date",)),
+        FieldRule("name_format", validate_name, fields=("Patient Name", "Doctor Name")),
+    ]),
+    'other': GENERIC_RULES,
+}
+
+
+def get_rule_set(doc_type: Optional[str]) -> RuleSet:
+    """Return the rule set for ``doc_type`` (generic rules for unknown types)."""
+    return RULE_SETS.get(doc_type, GENERIC_RULES)
+
 
 def compute_overall_confidence(fields):
     if not fields:
         return 0.0
     return sum(f.get("confidence", 0) for f in fields) / len(fields)
 
-def validate_output(raw_json: str):
+
+def _as_dict(raw_json) -> Dict[str, Any]:
+    if isinstance(raw_json, BaseModel):
+        return raw_json.model_dump()
+    if isinstance(raw_json, dict):
+        return raw_json
+    return json.loads(raw_json)
+
+
+def validate_output(raw_json):
+    """
+    Run the document type's rules, recompute overall confidence and return a plain dict.
+
+    ``raw_json`` may be a validated response model (as returned by the
+    extractor), an already parsed dict, or a JSON string; it is never
+    modified. Rule outcomes are reported under 'qa'.
+    """
     try:
-        data = json.loads(raw_json)
-        for f in data["fields"]:
-            if "amount" in f["name"].lower() and not validate_amount(f["value"]):
-                f["confidence"] *= 0.7
-        data["overall_confidence"] = compute_overall_confidence(data["fields"])
-        return data
+        data = _as_dict(raw_json)
+        return get_rule_set(data.get("doc_type")).validate(data)
     except Exception as e:
+        if isinstance(raw_json, BaseModel):
+            raw_json = raw_json.model_dump_json()
         return {"error": str(e), "raw": raw_json}
+
+
+def error_codes(result: Dict[str, Any]) -> Dict[str, ErrorCode]:
+    """
+    ErrorCode of each field that failed validation in a validated result.
+
+    Pass them as validation['error_codes'] to confidence.score_result or
+    score_batch.
+    """
+    return get_rule_set(result.get("doc_type")).error_codes((result.get("qa") or {}).get("failed_rules", []))
+
+
+def validate_batch(outputs: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Validate many extraction results in one pass; see validate_output."""
+    return [validate_output(output) for output in outputs]